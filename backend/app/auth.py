@@ -1,19 +1,27 @@
-from fastapi import APIRouter
-from services.auth import AuthService
+from fastapi import APIRouter, Depends, Request
+from fastapi.security import HTTPAuthorizationCredentials
+from schema.auth import LoginSchema
 
-router = APIRouter("/v1/auth", tags=["auth"])
+from .dependencies import AuthServiceDep, bearer_scheme
+
+router = APIRouter(prefix="/v1/auth", tags=["auth"])
 
 
 @router.post("/login")
-def login(svc: AuthService):
-    return svc.login()
+async def login(credentials: LoginSchema, request: Request, svc: AuthServiceDep):
+    client_ip = request.client.host if request.client is not None else None
+
+    return await svc.login(credentials.email, credentials.password, client_ip)
 
 
 @router.post("/logout")
-def logout(svc: AuthService):
-    svc.logout()
+async def logout(
+    svc: AuthServiceDep,
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    await svc.logout(credentials.credentials)
 
 
 @router.put("email/confirm")
-def confirm_email_update(svc: AuthService):
-    svc.confirm_emai_update()
+async def confirm_email_update(svc: AuthServiceDep):
+    await svc.confirm_emai_update()
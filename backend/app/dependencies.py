@@ -0,0 +1,81 @@
+from typing import Annotated, AsyncIterator
+
+from fastapi import Depends
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import AsyncSessionLocal
+from services.auth import AsyncAuthService
+from services.image import ImageService, get_image_service
+from services.match import AsyncMatchService
+from services.message import AsyncMessageService
+from services.registration import AsyncRegisterationService
+from services.revocation import TOKEN_EXPIRATION_IN_MINUTES
+from services.survey import AsyncSurveyService
+from services.token import get_token_verifier
+from services.user import AsyncUserService
+
+bearer_scheme = HTTPBearer()
+
+
+def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+) -> int:
+    """Authenticates the request from its bearer token alone, no database lookup"""
+    claims = get_token_verifier().verify(credentials.credentials)
+
+    return int(claims["sub"])
+
+
+CurrentUserId = Annotated[int, Depends(get_current_user_id)]
+
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """One session per request, committed once after the handler returns and
+    rolled back if it raises"""
+    async with AsyncSessionLocal() as session:
+        yield session
+        await session.commit()
+
+
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+
+
+def get_user_service(session: SessionDep) -> AsyncUserService:
+    return AsyncUserService(session)
+
+
+def get_message_service(session: SessionDep) -> AsyncMessageService:
+    return AsyncMessageService(session)
+
+
+def get_match_service(session: SessionDep) -> AsyncMatchService:
+    return AsyncMatchService(session)
+
+
+def get_auth_service(session: SessionDep) -> AsyncAuthService:
+    token_verifier = get_token_verifier()
+
+    return AsyncAuthService(
+        session,
+        secret_key=token_verifier.keys[token_verifier.active_kid],
+        token_expiration_in_minutes=TOKEN_EXPIRATION_IN_MINUTES,
+        token_verifier=token_verifier,
+    )
+
+
+def get_survey_service(session: SessionDep) -> AsyncSurveyService:
+    return AsyncSurveyService(session)
+
+
+def get_registration_service(session: SessionDep) -> AsyncRegisterationService:
+    return AsyncRegisterationService(session)
+
+
+ImageServiceDep = Annotated[ImageService, Depends(get_image_service)]
+UserServiceDep = Annotated[AsyncUserService, Depends(get_user_service)]
+MessageServiceDep = Annotated[AsyncMessageService, Depends(get_message_service)]
+MatchServiceDep = Annotated[AsyncMatchService, Depends(get_match_service)]
+AuthServiceDep = Annotated[AsyncAuthService, Depends(get_auth_service)]
+SurveyServiceDep = Annotated[AsyncSurveyService, Depends(get_survey_service)]
+RegistrationServiceDep = Annotated[AsyncRegisterationService, Depends(get_registration_service)]
@@ -0,0 +1,98 @@
+from fastapi import APIRouter, Header, HTTPException, Path, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from services.image import MAX_IMAGE_BYTES, ORIGINAL, VARIANTS, image_key
+
+from .dependencies import CurrentUserId, ImageServiceDep, UserServiceDep
+
+router = APIRouter(prefix="/v1/images", tags=["images"])
+
+# Keys are content hashes so a served key never changes. A variant request answered
+# with the original until the variant is rendered must be re-fetched soon
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FALLBACK_CACHE_CONTROL = "public, max-age=60"
+
+
+def _parse_range(value: str, size: int) -> tuple[int, int] | None:
+    """(start, end exclusive) of a single bytes range, None to serve the whole file"""
+    unit, _, spec = value.partition("=")
+
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+
+    start, _, end = spec.strip().partition("-")
+
+    try:
+        if not start:
+            start, end = max(size - int(end), 0), size
+        else:
+            start, end = int(start), min(int(end) + 1, size) if end else size
+    except ValueError:
+        return None
+
+    if start >= end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    return start, end
+
+
+@router.post("/{slot}")
+async def upload_image(
+    user_id: CurrentUserId,
+    file: UploadFile,
+    images: ImageServiceDep,
+    svc: UserServiceDep,
+    slot: int = Path(ge=1, le=3),
+):
+    data = await file.read(MAX_IMAGE_BYTES + 1)
+    digest = await run_in_threadpool(images.store, data)
+    await svc.set_image(user_id, slot, digest)
+
+    return {"image": digest}
+
+
+@router.get("/{digest}")
+def get_image(
+    images: ImageServiceDep,
+    digest: str = Path(pattern="^[0-9a-f]{64}$"),
+    variant: str = ORIGINAL,
+    range_header: str | None = Header(None, alias="Range"),
+    if_none_match: str | None = Header(None),
+):
+    if variant != ORIGINAL and variant not in VARIANTS:
+        raise HTTPException(status_code=400, detail=f"Unknown variant {variant}")
+
+    key = images.resolve(digest, variant)
+    headers = {
+        "ETag": f'"{key}"',
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL
+            if key == image_key(digest, variant)
+            else FALLBACK_CACHE_CONTROL
+        ),
+    }
+
+    if if_none_match is not None and headers["ETag"] in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    size = images.storage.size(key)
+    byte_range = _parse_range(range_header, size) if range_header else None
+    media_type = images.content_type(key)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            images.storage.read(key), media_type=media_type, headers=headers
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+
+    return StreamingResponse(
+        images.storage.read(key, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -1,13 +1,67 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+from db import AsyncSessionLocal, SessionLocal, async_engine
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from services.hub import get_message_hub
+from services.search_index import SEARCH_INDEX_REBUILD_SECONDS, load_search_index
 
 from .auth import router as auth_router
+from .image import router as image_router
+from .match import router as match_router
+from .metrics import MetricsMiddleware
+from .metrics import router as metrics_router
 from .message import router as message_router
 from .registration import router as registration_router
+from .survey import router as survey_router
 from .user import router as user_router
 
-app = FastAPI()
+
+def _reload_search_index() -> None:
+    with SessionLocal() as session:
+        load_search_index(session)
+
+
+async def _rebuild_search_index() -> None:
+    """Picks up profile edits made through the other processes, which only
+    update their own search index"""
+    while True:
+        await asyncio.sleep(SEARCH_INDEX_REBUILD_SECONDS)
+        # In the threadpool, so the rebuild doesn't hold up requests
+        await run_in_threadpool(_reload_search_index)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with AsyncSessionLocal() as session:
+        await session.run_sync(load_search_index)
+
+    rebuild = (
+        asyncio.create_task(_rebuild_search_index()) if SEARCH_INDEX_REBUILD_SECONDS > 0 else None
+    )
+    hub = get_message_hub()
+    await hub.start()
+    yield
+    await hub.stop()
+
+    if rebuild is not None:
+        rebuild.cancel()
+
+        with suppress(asyncio.CancelledError):
+            await rebuild
+
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth_router)
+app.include_router(image_router)
+app.include_router(match_router)
 app.include_router(message_router)
+app.include_router(metrics_router)
 app.include_router(registration_router)
+app.include_router(survey_router)
 app.include_router(user_router)
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Query
+from schema.match import DailyMatchPageSchema
+from services.match import DEFAULT_MATCH_PAGE_SIZE
+
+from .dependencies import CurrentUserId, MatchServiceDep
+
+router = APIRouter(prefix="/v1/match", tags=["match"])
+
+MAX_SCORES_PER_REQUEST = 100
+
+
+@router.get("/score")
+async def get_score(user_id: CurrentUserId, other_id: int, svc: MatchServiceDep):
+    return {"other_id": other_id, "score": await svc.get_score(user_id, other_id)}
+
+
+@router.get("/scores")
+async def get_scores(
+    user_id: CurrentUserId, svc: MatchServiceDep, ids: list[int] = Query()
+) -> dict[int, float | None]:
+    if len(ids) > MAX_SCORES_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_SCORES_PER_REQUEST} scores per request",
+        )
+
+    return await svc.get_scores(user_id, ids)
+
+
+@router.get("/today", response_model=DailyMatchPageSchema)
+async def get_todays_matches(
+    user_id: CurrentUserId,
+    svc: MatchServiceDep,
+    cursor: int = 0,
+    limit: int = DEFAULT_MATCH_PAGE_SIZE,
+):
+    """Served from the last published run of the match cron, never recomputed"""
+    return await svc.get_todays_matches(user_id, cursor, limit)
@@ -1,38 +1,112 @@
-from fastapi import APIRouter
-from services.message import MessageService
+import asyncio
 
-router = APIRouter(prefix="/v1/message", tags=["message"])
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from services.hub import Subscription, get_message_hub
+from services.message import DEFAULT_PAGE_SIZE
+from services.token import get_token_verifier
+from schema.message import MessagePageSchema, MessageSchema
 
+from .dependencies import CurrentUserId, MessageServiceDep
 
-# TODO token authentication, svc dependency, response model
+router = APIRouter(prefix="/v1/message", tags=["message"])
 
 
 @router.get("/number/unread")
-def get_num_of_unread_messages(user_id: int, svc: MessageService):
-    return svc.get_num_of_unread_messages(user_id)
+async def get_num_of_unread_messages(user_id: CurrentUserId, svc: MessageServiceDep):
+    return await svc.get_num_of_unread_messages(user_id)
+
+
+@router.get("/", response_model=MessagePageSchema)
+async def get_messages(
+    user_id: CurrentUserId,
+    svc: MessageServiceDep,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    return await svc.get_messages(user_id, cursor, limit)
 
 
-@router.get("/")
-def get_messages(user_id: int, svc: MessageService):
-    return svc.get_messages(user_id)
+@router.get("/conversation/{conversation_id}", response_model=MessagePageSchema)
+async def get_conversation_messages(
+    user_id: CurrentUserId,
+    conversation_id: int,
+    svc: MessageServiceDep,
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    return await svc.get_conversation_messages(user_id, conversation_id, cursor, limit)
 
 
 @router.delete("/")
-def delete_message(user_id: int, message_id: int, svc: MessageService):
-    svc.delete_message()
+async def delete_message(user_id: CurrentUserId, message_id: int, svc: MessageServiceDep):
+    await svc.delete_message_(user_id, message_id)
 
 
 # TODO send to username instead of ID maybe
 @router.post("/send")
-def send_message(from_user_id: int, to_user_id: int, svc: MessageService):
-    svc.send_message(from_user_id, to_user_id)
+async def send_message(
+    from_user_id: CurrentUserId,
+    to_user_id: int,
+    message: MessageSchema,
+    svc: MessageServiceDep,
+):
+    await svc.send_message(from_user_id, to_user_id, message.body)
 
 
 @router.put("/seen")
-def mark_message_as_seen(user_id: int, message_id: int, svc: MessageService):
-    svc.mark_message_as_seen(user_id, message_id)
+async def mark_message_as_seen(user_id: CurrentUserId, message_id: int, svc: MessageServiceDep):
+    await svc.mark_message_as_seen(user_id, message_id)
 
 
 @router.post("/reply")
-def reply_to_message(user_id: int, message_id: int, svc: MessageService):
-    svc.reply(user_id, message_id)
+async def reply_to_message(
+    user_id: CurrentUserId, message_id: int, message: MessageSchema, svc: MessageServiceDep
+):
+    await svc.reply(user_id, message_id, message.body)
+
+
+async def _forward_events(websocket: WebSocket, subscription: Subscription) -> None:
+    while (event := await subscription.get()) is not None:
+        await websocket.send_json(event)
+
+    # Dropped by the hub for falling too far behind
+    await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
+@router.websocket("/ws")
+async def message_events(websocket: WebSocket, token: str):
+    """Pushes new messages and unread counts. Browsers can't set headers on a
+    WebSocket handshake, so the bearer token comes in the query string"""
+    try:
+        # Off the event loop, like get_current_user_id, as the revocation check may query
+        claims = await run_in_threadpool(get_token_verifier().verify, token)
+        user_id = int(claims["sub"])
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+
+    hub = get_message_hub()
+    subscription = hub.connect(user_id)
+    tasks = [
+        asyncio.create_task(_forward_events(websocket, subscription)),
+        asyncio.create_task(_wait_for_disconnect(websocket)),
+    ]
+
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+        hub.disconnect(user_id, subscription)
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import re
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services import match, message, user
+from services.hashing import get_hashing_pool
+from services.hub import get_message_hub
+from services.image import get_image_service
+from services.metrics import (
+    PROFILE_DIR,
+    PROFILE_SLOW_REQUEST_SECONDS,
+    QueryStats,
+    RequestMetrics,
+    SamplingProfiler,
+    current_query_stats,
+)
+from services.throttle import get_login_throttle
+
+router = APIRouter(tags=["metrics"])
+
+request_metrics = RequestMetrics()
+request_metrics.register_stats("hashing", lambda: get_hashing_pool().stats())
+request_metrics.register_stats("message_hub", lambda: get_message_hub().stats())
+request_metrics.register_stats("login_throttle", lambda: get_login_throttle().stats())
+request_metrics.register_stats("images", lambda: get_image_service().stats())
+request_metrics.register_stats("user_cache", user._user_cache.stats)
+request_metrics.register_stats("visibility_cache", user._visibility_cache.stats)
+request_metrics.register_stats("score_cache", match._score_cache.stats)
+request_metrics.register_stats("unread_cache", message._unread_cache.stats)
+
+
+class MetricsMiddleware(object):
+    """Times every HTTP request and counts its database queries, by route template.
+
+    With slow_request_seconds set, a sampling profiler runs in the background
+    and the samples taken during any slower request are dumped to profile_dir.
+    """
+
+    def __init__(
+        self,
+        app,
+        metrics: RequestMetrics = request_metrics,
+        slow_request_seconds: float = PROFILE_SLOW_REQUEST_SECONDS,
+        profile_dir: str = PROFILE_DIR,
+    ) -> None:
+        self.app = app
+        self.metrics = metrics
+        self.slow_request_seconds = slow_request_seconds
+        self.profile_dir = profile_dir
+        self.profiler = None
+
+        if slow_request_seconds > 0:
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        query_stats = QueryStats()
+        token = current_query_stats.set(query_stats)
+        self.metrics.in_flight += 1
+        started = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            finished = time.perf_counter()
+            self.metrics.in_flight -= 1
+            current_query_stats.reset(token)
+
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            self.metrics.observe(scope["method"], path, status, finished - started, query_stats)
+
+            if self.profiler is not None and finished - started >= self.slow_request_seconds:
+                await asyncio.to_thread(
+                    self.profiler.dump,
+                    self._profile_path(scope["method"], path, finished - started),
+                    started,
+                    finished,
+                )
+
+    def _profile_path(self, method: str, route: str, seconds: float) -> str:
+        name = re.sub(r"[^A-Za-z0-9]+", "_", f"{method}{route}").strip("_")
+        filename = f"{time.time():.0f}-{name}-{seconds * 1000:.0f}ms.txt"
+
+        return os.path.join(self.profile_dir, filename)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> str:
+    return request_metrics.render()
@@ -1,11 +1,11 @@
 from fastapi import APIRouter
+from schema.registration import RegistrationSchema
 
-from ..schema.registration import RegistrationSchema
-from ..services.registration import RegisterationService
+from .dependencies import RegistrationServiceDep
 
-router = APIRouter("v1/register", tags=["Registration"])
+router = APIRouter(prefix="/v1/register", tags=["Registration"])
 
 
 @router.post("/")
-def register(registration_data: RegistrationSchema, svc: RegisterationService):
-    return svc.sign_up(registration_data)
+async def register(registration_data: RegistrationSchema, svc: RegistrationServiceDep):
+    return await svc.sign_up(registration_data)
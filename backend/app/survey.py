@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from schema.survey import SurveyAnswersSchema, SurveyQuestionSchema
+
+from .dependencies import CurrentUserId, SurveyServiceDep
+
+router = APIRouter(prefix="/v1/survey", tags=["survey"])
+
+
+@router.get("/", response_model=list[SurveyQuestionSchema])
+async def get_survey(svc: SurveyServiceDep):
+    return await svc.get_survey()
+
+
+@router.post("/answers")
+async def answer_survey(user_id: CurrentUserId, data: SurveyAnswersSchema, svc: SurveyServiceDep):
+    await svc.answer_survey(user_id, data.answers)
+
+
+@router.put("/answers")
+async def edit_survey_answers(
+    user_id: CurrentUserId, data: SurveyAnswersSchema, svc: SurveyServiceDep
+):
+    await svc.edit_survey_answers(user_id, data.answers)
+
+
+@router.post("/submit")
+async def submit_survey(user_id: CurrentUserId, svc: SurveyServiceDep):
+    await svc.submit_survey(user_id)
@@ -1,54 +1,110 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
 
-from services.user import UserService
-from schema.profile import ProfileSchema
+from schema.profile import (
+    AccountSchema,
+    ProfileCardSchema,
+    ProfileSchema,
+    ProfileSearchPageSchema,
+)
+from schema.visibility import VisibilitySchema
+from services.hashing import get_hashing_pool
+from services.search_index import DEFAULT_SEARCH_PAGE_SIZE
+
+from .dependencies import CurrentUserId, UserServiceDep
 
 router = APIRouter(prefix="/v1/user", tags=["user"])
 
-# TODO token authentication, svc dependency, response model
+MAX_PROFILES_PER_REQUEST = 100
+
+
+@router.get("/account", response_model=AccountSchema)
+async def get_user(user_id: CurrentUserId, svc: UserServiceDep):
+    return await svc.get_user(user_id)
+
 
+@router.get("/profiles", response_model=list[ProfileCardSchema])
+async def get_profiles(user_id: CurrentUserId, svc: UserServiceDep, ids: list[int] = Query()):
+    if len(ids) > MAX_PROFILES_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_PROFILES_PER_REQUEST} profiles per request",
+        )
 
-@router.get("/account")
-def get_user(user_id: int, svc: UserService):
-    return svc.get_user(user_id)
+    return await svc.get_profile_cards(user_id, ids)
+
+
+@router.get("/search", response_model=ProfileSearchPageSchema)
+async def search_profiles(
+    user_id: CurrentUserId,
+    svc: UserServiceDep,
+    q: str = Query(min_length=1, max_length=100),
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_SEARCH_PAGE_SIZE, ge=1),
+):
+    """Active profiles by username prefix or about words, from the in-process index"""
+    return await svc.search_profiles(user_id, q, cursor, limit)
 
 
 @router.post("/account")
-def add_user(profile_data: ProfileSchema, svc: UserService):
-    svc.create_user(profile_data)
-    svc.session.commit()
+async def add_user(profile_data: ProfileSchema, svc: UserServiceDep):
+    hashed_password = await get_hashing_pool().hash(profile_data.password)
+
+    await svc.create_user(
+        profile_data.email, hashed_password, profile_data.username, profile_data.first_name
+    )
 
 
 @router.put("/account")
-def edit_user(user_id: int, profile_data: ProfileSchema, svc: UserService):
-    svc.edit_user(user_id, profile_data)
-    svc.session.commt()
+async def edit_user(user_id: CurrentUserId, profile_data: ProfileSchema, svc: UserServiceDep):
+    await svc.edit_user(user_id, profile_data)
 
 
 @router.delete("/account")
-def delete_user(user_id: int, svc: UserService):
-    svc.delete_user(user_id)
-    svc.session.commit()
+async def delete_user(user_id: CurrentUserId, svc: UserServiceDep):
+    await svc.delete_user(user_id)
 
 
 @router.put("/account/deactivate")
-def deactivate_account(user_id: int, svc: UserService):
-    svc.deactivate_account(user_id)
-    svc.session.commit()
+async def deactivate_account(user_id: CurrentUserId, svc: UserServiceDep):
+    await svc.deactivate_account(user_id)
+
 
+@router.get("/usernames", response_model=list[str])
+async def suggest_usernames(user_id: CurrentUserId, svc: UserServiceDep):
+    return await svc.suggest_usernames(user_id)
 
-@router.get("/usernames")
-def suggest_usernames(user_id: int, svc: UserService):
-    return svc.suggest_usernames(user_id)
+
+@router.get("/suggestions", response_model=list[ProfileCardSchema])
+async def suggest_profiles(user_id: CurrentUserId, svc: UserServiceDep, limit: int = 20):
+    return await svc.suggest_profiles(user_id, limit)
 
 
 @router.post("/first-name/show")
-def show_first_name(user_id: int, permission_granted_for_id: int, svc: UserService):
-    svc.show_first_name(user_id, permission_granted_for_id)
-    svc.session.commit()
+async def show_first_name(
+    user_id: CurrentUserId, permission_granted_for_id: int, svc: UserServiceDep
+):
+    await svc.show_first_name(user_id, permission_granted_for_id)
 
 
 @router.delete("/first-name/un-show")
-def un_show_first_name(user_id: int, permission_granted_for_id: int, svc: UserService):
-    svc.un_show_first_nameshow_first_name(user_id, permission_granted_for_id)
-    svc.session.commit()
+async def un_show_first_name(
+    user_id: CurrentUserId, permission_granted_for_id: int, svc: UserServiceDep
+):
+    await svc.un_show_first_name(user_id, permission_granted_for_id)
+
+
+@router.post("/first-name/show/bulk")
+async def show_first_names(user_id: CurrentUserId, data: VisibilitySchema, svc: UserServiceDep):
+    await svc.show_first_names(user_id, data.user_ids)
+
+
+@router.delete("/first-name/un-show/bulk")
+async def un_show_first_names(user_id: CurrentUserId, data: VisibilitySchema, svc: UserServiceDep):
+    await svc.un_show_first_names(user_id, data.user_ids)
+
+
+@router.get("/first-name/visible")
+async def can_see_first_names(
+    user_id: CurrentUserId, svc: UserServiceDep, ids: list[int] = Query()
+) -> dict[int, bool]:
+    return await svc.can_see_first_names(user_id, ids)
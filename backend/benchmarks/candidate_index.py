@@ -0,0 +1,88 @@
+# Recall vs latency of the LSH candidate index against exact scoring
+#
+#   python -m benchmarks.candidate_index --users 50000 --queries 500
+import argparse
+import time
+
+import numpy as np
+
+from services.candidate_index import CandidateIndex
+from services.compatibility import compatibility_scores, encode_answers, top_k
+
+SETTINGS = [
+    # (num_tables, num_bits)
+    (4, 8),
+    (8, 8),
+    (8, 12),
+    (16, 12),
+    (16, 16),
+]
+
+
+def synthetic_answers(
+    num_users: int, num_questions: int, num_choices: int, seed: int = 0
+) -> np.ndarray:
+    """Users drawn around a few hundred "types" so neighbourhoods exist, with
+    some answers flipped at random and some left unanswered"""
+    rng = np.random.default_rng(seed)
+    types = rng.integers(1, num_choices + 1, (max(num_users // 200, 1), num_questions))
+
+    answers = types[rng.integers(0, len(types), num_users)]
+    noise = rng.random(answers.shape)
+    answers = np.where(noise < 0.2, rng.integers(1, num_choices + 1, answers.shape), answers)
+    answers[noise > 0.9] = 0
+
+    return answers.astype(np.int8)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--choices", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--candidates", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    user_ids = np.arange(args.users, dtype=np.int64)
+    answers = synthetic_answers(args.users, args.questions, args.choices)
+    queries = np.random.default_rng(1).choice(args.users, args.queries, replace=False)
+
+    one_hot, answered = encode_answers(answers)
+
+    started = time.perf_counter()
+    scores = compatibility_scores(one_hot, answered, queries)
+    scores[np.arange(len(queries)), queries] = -np.inf
+    _, exact = top_k(scores, args.top_k)
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    print(f"exact scan: {exact_ms:.3f} ms/query")
+    print(f"{'tables':>6} {'bits':>4} {'build s':>8} {'ms/query':>9} {f'recall@{args.top_k}':>10}")
+
+    for num_tables, num_bits in SETTINGS:
+        started = time.perf_counter()
+        index = CandidateIndex.build(
+            user_ids, answers, num_tables=num_tables, num_bits=num_bits
+        )
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        candidates = index.query_many(answers[queries], args.candidates)
+        query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        # Survey scores tie a lot, so a hit is any re-ranked candidate scoring at
+        # least as well as the exact k-th best rather than a specific user id
+        hits = 0
+
+        for row, found, true in zip(scores, candidates, exact):
+            best = np.sort(row[found])[::-1][: args.top_k]
+            hits += int((best >= true[-1]).sum())
+
+        recall = hits / exact.size
+
+        print(f"{num_tables:>6} {num_bits:>4} {build_s:>8.2f} {query_ms:>9.3f} {recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
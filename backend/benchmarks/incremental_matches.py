@@ -0,0 +1,81 @@
+# Incremental match runs against a full rebuild, as the share of users with
+# profile changes since the previous run grows
+#
+#   python -m benchmarks.incremental_matches --users 20000 --changed 0.001 0.01 0.05
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.candidate_index import synthetic_answers
+from crons.match import MatchChunk, iter_incremental_matches, iter_matches
+from services.compatibility import ANY_GENDER, MatchFeatures
+
+
+def _run(chunks) -> tuple[MatchChunk, float]:
+    started = time.perf_counter()
+    chunks = list(chunks)
+    elapsed = time.perf_counter() - started
+
+    return MatchChunk(
+        user_ids=np.concatenate([c.user_ids for c in chunks]),
+        match_user_ids=np.concatenate([c.match_user_ids for c in chunks]),
+        ranks=np.concatenate([c.ranks for c in chunks]),
+        scores=np.concatenate([c.scores for c in chunks]),
+        pairs_scored=sum(c.pairs_scored for c in chunks),
+    ), elapsed
+
+
+def _score_lists(chunk: MatchChunk) -> np.ndarray:
+    """Scores ordered by user then rank, which ties can't reorder"""
+    return chunk.scores[np.lexsort((chunk.ranks, chunk.user_ids))]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--choices", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--block-size", type=int, default=1024)
+    parser.add_argument("--changed", type=float, nargs="+", default=[0.001, 0.01, 0.05])
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    features = MatchFeatures(
+        user_ids=np.arange(1, args.users + 1, dtype=np.int64),
+        genders=rng.integers(0, 2, args.users).astype(np.int8),
+        interested_in=rng.choice([0, 1, ANY_GENDER], args.users).astype(np.int8),
+        answers=synthetic_answers(args.users, args.questions, args.choices),
+    )
+    previous, full_s = _run(iter_matches(features, args.top_k, args.block_size))
+
+    print(f"full rebuild: {full_s:.2f}s")
+    print(f"{'changed':>8} {'users':>7} {'full s':>7} {'incr s':>7} {'pairs':>7} {'speedup':>8}")
+
+    for share in args.changed:
+        # Changed users re-answer the survey as a different random user would
+        changed = np.sort(rng.choice(args.users, max(int(args.users * share), 1), replace=False))
+        answers = features.answers.copy()
+        answers[changed] = answers[rng.integers(0, args.users, len(changed))]
+        after = MatchFeatures(features.user_ids, features.genders, features.interested_in, answers)
+
+        full, full_s = _run(iter_matches(after, args.top_k, args.block_size))
+        incremental, incremental_s = _run(
+            iter_incremental_matches(
+                after, previous, features.user_ids[changed], args.top_k, args.block_size
+            )
+        )
+
+        if not np.allclose(_score_lists(incremental), _score_lists(full)):
+            raise SystemExit(f"incremental run differs from the full rebuild at {share:.1%}")
+
+        print(
+            f"{share:>8.1%} {len(changed):>7} {full_s:>7.2f} {incremental_s:>7.2f} "
+            f"{incremental.pairs_scored / full.pairs_scored:>7.1%} "
+            f"{full_s / incremental_s:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
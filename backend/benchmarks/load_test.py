@@ -0,0 +1,136 @@
+# Requests/sec of GET /v1/user/profiles under concurrent clients, sync sessions in the
+# threadpool (how handlers ran before) vs the async engine and per-request AsyncSession
+#
+#   python -m benchmarks.load_test --clients 50 --requests 5000
+#
+# SQLite serializes on one file and aiosqlite adds a thread hop per query, so locally
+# this mostly shows the async overhead. Point --database-url at Postgres to see the
+# event loop overlapping query round-trips.
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Query
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.dependencies import get_current_user_id, get_session
+from app.main import app
+from benchmarks.profile_feed import VIEWER_ID, seed
+from db import async_url
+from models.user import Base
+from schema.profile import ProfileCardSchema
+from services.user import UserService
+
+
+def sync_app(session_factory: sessionmaker) -> FastAPI:
+    """The profiles route as it ran before: a sync handler in the threadpool, own session"""
+    legacy = FastAPI()
+
+    @legacy.get("/v1/user/profiles", response_model=list[ProfileCardSchema])
+    def get_profiles(ids: list[int] = Query()):
+        with session_factory() as session:
+            cards = UserService(session).get_profile_cards(VIEWER_ID, ids)
+            session.commit()
+
+        return cards
+
+    return legacy
+
+
+def async_app(database_url: str, pool_size: int) -> tuple[FastAPI, object]:
+    """The real app, with the session dependency bound to the benchmark database"""
+    engine = create_async_engine(database_url, pool_size=pool_size)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def benchmark_session():
+        async with session_factory() as session:
+            yield session
+            await session.commit()
+
+    app.dependency_overrides[get_session] = benchmark_session
+    app.dependency_overrides[get_current_user_id] = lambda: VIEWER_ID
+
+    return app, engine
+
+
+async def load(
+    target: FastAPI, pages: list[list[int]], clients: int
+) -> tuple[float, list[float]]:
+    """Runs every page request across clients concurrent connections"""
+    pending = iter(pages)
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=target)
+
+    async def client() -> None:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            for user_ids in pending:
+                started = time.perf_counter()
+                response = await http.get("/v1/user/profiles", params={"ids": user_ids})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+
+    return time.perf_counter() - started, latencies
+
+
+def report(name: str, elapsed: float, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:>5}: {len(latencies) / elapsed:8.1f} req/s, "
+        f"p50 {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--grants", type=int, default=20_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument(
+        "--database-url", help="an empty database, a temporary SQLite file by default"
+    )
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(), "load_test.db"
+    )
+    engine = create_engine(database_url, pool_size=args.pool_size)
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        seed(session, args.users, args.grants)
+
+    rng = random.Random(1)
+    pages = [
+        rng.sample(range(2, args.users + 1), args.page_size) for _ in range(args.requests)
+    ]
+    print(f"{args.requests} requests, {args.clients} clients, {args.page_size} cards each")
+
+    elapsed, latencies = asyncio.run(load(sync_app(sessionmaker(engine)), pages, args.clients))
+    report("sync", elapsed, latencies)
+
+    target, async_engine = async_app(async_url(database_url), args.pool_size)
+
+    try:
+        elapsed, latencies = asyncio.run(load(target, pages, args.clients))
+        report("async", elapsed, latencies)
+    finally:
+        asyncio.run(async_engine.dispose())
+        app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Inbox page latency for a user with a large inbox, keyset cursor vs OFFSET
+#
+#   python -m benchmarks.message_inbox --messages 100000
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from models.message import ConversationModel, MessageModel
+from models.user import Base, Gender, UserModel
+from services.message import MessageService
+
+INBOX_USER_ID = 1
+
+
+def seed(session: Session, num_messages: int, num_senders: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+
+    session.execute(
+        insert(UserModel),
+        [
+            {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "email": f"user{user_id}@example.com",
+                "hashed_password": "x",
+                "first_name": "User",
+                "gender": Gender.FEMALE,
+            }
+            for user_id in range(1, num_senders + 2)
+        ],
+    )
+    session.execute(
+        insert(ConversationModel),
+        [
+            {"id": sender_id, "user_a_id": INBOX_USER_ID, "user_b_id": sender_id}
+            for sender_id in range(2, num_senders + 2)
+        ],
+    )
+
+    started = datetime.utcnow() - timedelta(days=365)
+    batch = []
+
+    for i in range(num_messages):
+        sender_id = rng.randint(2, num_senders + 1)
+        batch.append(
+            {
+                "conversation_id": sender_id,
+                "sender_id": sender_id,
+                "recipient_id": INBOX_USER_ID,
+                "body": f"message {i}",
+                "created_at": started + timedelta(seconds=rng.randint(0, 365 * 86400)),
+            }
+        )
+
+        if len(batch) == 10_000:
+            session.execute(insert(MessageModel), batch)
+            batch = []
+
+    if batch:
+        session.execute(insert(MessageModel), batch)
+
+    session.commit()
+
+
+def _percentiles(latencies: list[float]) -> str:
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    return f"p50 {p50:.3f} ms, p99 {p99:.3f} ms"
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--senders", type=int, default=1_000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--database-url", default="sqlite://")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        seed(session, args.messages, args.senders)
+        svc = MessageService(session)
+
+        latencies, cursor, pages = [], None, 0
+        while True:
+            started = time.perf_counter()
+            page = svc.get_messages(INBOX_USER_ID, cursor, args.page_size)
+            latencies.append(time.perf_counter() - started)
+            session.expunge_all()
+
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        print(f"keyset: {pages} pages, {_percentiles(latencies)}")
+
+        # The same walk with OFFSET for comparison, sampled since it is quadratic
+        offset_latencies = []
+        for page_number in range(0, pages, max(pages // 100, 1)):
+            q = (
+                select(MessageModel)
+                .where(MessageModel.recipient_id == INBOX_USER_ID)
+                .order_by(MessageModel.created_at.desc(), MessageModel.id.desc())
+                .offset(page_number * args.page_size)
+                .limit(args.page_size)
+            )
+            started = time.perf_counter()
+            session.execute(q).scalars().all()
+            offset_latencies.append(time.perf_counter() - started)
+            session.expunge_all()
+
+        print(f"offset: {len(offset_latencies)} sampled pages, {_percentiles(offset_latencies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Queries and latency to render a page of match cards, per-card loads vs get_profile_cards
+#
+#   python -m benchmarks.profile_feed --users 100000 --page-size 50
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine, event, exists, insert, select
+from sqlalchemy.orm import Session
+
+from models.user import Base, Gender, UserModel
+from models.visible_first_names import VisibleFirstNameModel
+from services.user import UserService
+
+VIEWER_ID = 1
+
+
+def seed(session: Session, num_users: int, num_grants: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+
+    session.execute(
+        insert(UserModel),
+        [
+            {
+                "id": user_id,
+                "username": f"user{user_id}",
+                "email": f"user{user_id}@example.com",
+                "hashed_password": "x",
+                "first_name": f"First{user_id}",
+                "gender": rng.choice(list(Gender)),
+                "about": "About me " * 20,
+                "image_1": f"{user_id:064x}",
+                "image_2": f"{user_id:064x}",
+                "image_3": f"{user_id:064x}",
+            }
+            for user_id in range(1, num_users + 1)
+        ],
+    )
+    grants = {
+        (rng.randint(2, num_users), rng.choice((VIEWER_ID, rng.randint(2, num_users))))
+        for _ in range(num_grants)
+    }
+    session.execute(
+        insert(VisibleFirstNameModel),
+        [
+            {"user_id": user_id, "permission_granted_for_user_id": viewer_id}
+            for user_id, viewer_id in grants
+            if user_id != viewer_id
+        ],
+    )
+    session.commit()
+
+
+def per_card(svc: UserService, user_ids: list[int]) -> None:
+    """What rendering a page cost before: one request per card, plus a visibility lookup"""
+    for user_id in user_ids:
+        svc.get_user(user_id)
+        svc.session.execute(
+            select(
+                exists().where(
+                    VisibleFirstNameModel.user_id == user_id,
+                    VisibleFirstNameModel.permission_granted_for_user_id == VIEWER_ID,
+                )
+            )
+        ).scalar()
+
+
+def batched(svc: UserService, user_ids: list[int]) -> None:
+    svc.get_profile_cards(VIEWER_ID, user_ids)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--grants", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--database-url", default="sqlite://")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(engine)
+
+    queries = 0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*_) -> None:
+        nonlocal queries
+        queries += 1
+
+    rng = random.Random(1)
+    pages = [rng.sample(range(2, args.users + 1), args.page_size) for _ in range(args.pages)]
+
+    with Session(engine) as session:
+        seed(session, args.users, args.grants)
+        svc = UserService(session)
+
+        for name, render in (("per-card", per_card), ("batched", batched)):
+            queries = 0
+            started = time.perf_counter()
+
+            for user_ids in pages:
+                render(svc, user_ids)
+                session.expunge_all()
+
+            elapsed_ms = (time.perf_counter() - started) * 1000 / len(pages)
+            print(
+                f"{name:>8}: {queries / len(pages):.0f} queries, "
+                f"{elapsed_ms:.2f} ms per {args.page_size}-card page"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Build time, memory and query latency of the profile search index, against
+# scanning every profile the way LIKE '%word%' would
+#
+#   python -m benchmarks.search_index --users 1000000 --queries 200
+import argparse
+import random
+import resource
+import string
+import time
+
+import numpy as np
+
+from services.search_index import SearchIndex
+
+
+def synthetic_profiles(num_users: int, vocabulary: int, seed: int = 0):
+    """Usernames built from a few thousand stems, about text drawn from a
+    Zipf-distributed vocabulary as real text would be"""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    def word() -> str:
+        return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+
+    stems = [word() for _ in range(5000)]
+    words = [word() for _ in range(vocabulary)]
+    lengths = np_rng.integers(5, 30, num_users)
+    drawn = np.minimum(np_rng.zipf(1.3, int(lengths.sum())), vocabulary) - 1
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    for user_id in range(num_users):
+        about = " ".join(words[i] for i in drawn[offsets[user_id] : offsets[user_id + 1]])
+
+        yield user_id + 1, f"{rng.choice(stems)}{user_id}", about.capitalize()
+
+
+def _timed(fn, iterations: int) -> np.ndarray:
+    timings = []
+
+    for i in range(iterations):
+        started = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return np.array(timings)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scans", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    profiles = list(synthetic_profiles(args.users, args.vocabulary))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    index = SearchIndex.build(profiles)
+    build_s = time.perf_counter() - started
+    rss_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+
+    print(f"built {len(index):,} profiles in {build_s:.1f}s, ~{rss_mb:,.0f} MB")
+
+    rng = random.Random(1)
+    sample = rng.sample(profiles, args.queries)
+    about_words = [about.lower().split() for _, _, about in sample]
+
+    cases = {
+        "username exact": lambda i: index.search(sample[i][1]),
+        "username prefix": lambda i: index.search(sample[i][1][:3]),
+        "one word": lambda i: index.search(rng.choice(about_words[i])),
+        "rare word": lambda i: index.search(max(about_words[i], key=len)),
+        "two words": lambda i: index.search(" ".join(rng.sample(about_words[i], 2))),
+        "word and prefix": lambda i: index.search(
+            f"{about_words[i][0]} {about_words[i][-1][:3]}"
+        ),
+        "prefix, page 5": lambda i: index.search(about_words[i][0][:3], offset=80),
+    }
+
+    print(f"{'query':>16} {'p50 ms':>8} {'p99 ms':>8}")
+
+    for name, fn in cases.items():
+        timings = _timed(fn, args.queries)
+        print(f"{name:>16} {np.percentile(timings, 50):>8.3f} {np.percentile(timings, 99):>8.3f}")
+
+    def update(i: int) -> None:
+        user_id, username, _ = sample[i]
+        index.add(user_id, username, " ".join(about_words[(i + 1) % len(sample)]))
+
+    for name, fn in {
+        "edit": update,
+        "remove": lambda i: index.remove(sample[i][0]),
+        "re-add": lambda i: index.add(*sample[i]),
+    }.items():
+        timings = _timed(fn, args.queries)
+        print(f"{name:>16} {np.percentile(timings, 50):>8.3f} {np.percentile(timings, 99):>8.3f}")
+
+    # What the endpoint would cost without the index
+    scan = _timed(
+        lambda i: [
+            user_id for user_id, _, about in profiles if about_words[i][0] in about.lower()
+        ],
+        args.scans,
+    )
+    print(f"{'full scan':>16} {np.percentile(scan, 50):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,536 @@
+# Latency of the hot paths of the services and HTTP endpoints against a seeded SQLite
+# database, written out as JSON and optionally compared with an earlier run
+#
+#   python -m benchmarks.suite --scale 100k --output results.json
+#   python -m benchmarks.suite --scale 100k --compare baseline.json --tolerance 0.2
+#
+# Scales are 1k, 100k and 1m users, with messages and first name grants scaled along.
+# Seeding 1m takes a while, so --database keeps the file and later runs at the same
+# scale reuse it. With --compare the run exits 1 if any case's p50 is slower than the
+# baseline's by more than the tolerance, so CI can fail on regressions.
+#
+# Passwords are seeded with cheap bcrypt hashes, which verify at the cost they were
+# hashed with, so login and registration measure the service around bcrypt rather
+# than bcrypt itself.
+import argparse
+import asyncio
+import inspect
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Iterator
+
+import httpx
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import create_engine, delete, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.dependencies import get_current_user_id, get_session
+from app.main import app
+from crons.match import DEFAULT_BLOCK_SIZE, DEFAULT_TOP_K, load_features, score_block
+from db import async_url
+from models.message import ConversationModel, MessageModel, UnreadCounterModel
+from models.survey import SurveyQuestionModel, SurveyVectorModel
+from models.user import Base, Gender, UserModel
+from models.visible_first_names import VisibleFirstNameModel
+from schema.registration import RegistrationSchema
+from services.auth import AuthService
+from services.candidate_index import CandidateIndex
+from services.compatibility import encode_answers
+from services.hashing import HashingPool, get_hashing_pool, hash_password
+from services.match import MatchRunWriter, MatchService
+from services.message import MessageService
+from services import throttle
+from services.registration import RegisterationService
+from services.user import UserService
+
+SCALES = {
+    "1k": {"users": 1_000, "messages": 10_000, "grants": 2_000},
+    "100k": {"users": 100_000, "messages": 500_000, "grants": 200_000},
+    "1m": {"users": 1_000_000, "messages": 2_000_000, "grants": 2_000_000},
+}
+VIEWER_ID = 1
+PASSWORD = "benchmark password"
+SEED_ROUNDS = 4
+NUM_QUESTIONS = 20
+NUM_CHOICES = 4
+NUM_INBOX_SENDERS = 1_000
+PAGE_SIZE = 50
+SEED_BATCH_SIZE = 10_000
+SIGN_UP_EMAIL_PREFIX = "signup-"
+SECRET_KEY = "benchmark-secret-key-benchmark-secret-key"
+# Every login attempt is let through, the suite measures the paths behind the throttle
+UNLIMITED_ATTEMPTS = 10**9
+# Keeps one exhaustive cron block's score matrix around 64MB however many users there are
+MAX_BLOCK_PAIRS = 1 << 24
+
+DEFAULT_TOLERANCE = 0.2
+# Cases this fast are mostly noise, they only regress by more than this too
+MIN_REGRESSION_MS = 0.05
+
+
+def _batches(rows: Iterator[dict], size: int = SEED_BATCH_SIZE) -> Iterator[list[dict]]:
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def seed(session: Session, num_users: int, num_messages: int, num_grants: int) -> None:
+    rng = random.Random(0)
+    np_rng = np.random.default_rng(0)
+    hashed_password = hash_password(PASSWORD, SEED_ROUNDS)
+    genders = list(Gender)
+
+    users = (
+        {
+            "id": user_id,
+            "username": f"user{user_id}",
+            "email": f"user{user_id}@example.com",
+            "hashed_password": hashed_password,
+            "first_name": f"First{user_id}",
+            "gender": rng.choice(genders),
+            "interested_in": rng.choice([None, *genders]),
+            "about": "About me " * 20,
+        }
+        for user_id in range(1, num_users + 1)
+    )
+    for batch in _batches(users):
+        session.execute(insert(UserModel), batch)
+
+    session.execute(
+        insert(SurveyQuestionModel),
+        [
+            {"id": question_id, "text": f"Question {question_id}", "choices": ["a", "b", "c", "d"]}
+            for question_id in range(1, NUM_QUESTIONS + 1)
+        ],
+    )
+
+    # Vectors are indexed by question id, and there is no question 0
+    encoded_at = datetime.utcnow()
+    for start in range(1, num_users + 1, SEED_BATCH_SIZE):
+        stop = min(start + SEED_BATCH_SIZE, num_users + 1)
+        answers = np_rng.integers(0, NUM_CHOICES + 1, (stop - start, NUM_QUESTIONS + 1))
+        answers[:, 0] = 0
+        session.execute(
+            insert(SurveyVectorModel),
+            [
+                {"user_id": user_id, "vector": row.tobytes(), "encoded_at": encoded_at}
+                for user_id, row in zip(range(start, stop), answers.astype(np.int8))
+            ],
+        )
+
+    # The viewer talks to a fixed set of senders, everyone else to their next id
+    num_senders = min(NUM_INBOX_SENDERS, num_users - 1)
+    pairs = [(VIEWER_ID, sender_id) for sender_id in range(2, num_senders + 2)]
+    pairs += [(user_id, user_id + 1) for user_id in range(num_senders + 2, num_users)]
+    session.execute(
+        insert(ConversationModel),
+        [
+            {"id": conversation_id, "user_a_id": a, "user_b_id": b}
+            for conversation_id, (a, b) in enumerate(pairs, 1)
+        ],
+    )
+
+    started = datetime.utcnow() - timedelta(days=365)
+
+    def messages() -> Iterator[dict]:
+        for i in range(num_messages):
+            # A tenth of all messages go through the viewer's conversations
+            if i % 10 == 0 or len(pairs) == num_senders:
+                conversation_id = rng.randint(1, num_senders)
+            else:
+                conversation_id = rng.randint(num_senders + 1, len(pairs))
+
+            sender_id, recipient_id = rng.sample(pairs[conversation_id - 1], 2)
+
+            yield {
+                "conversation_id": conversation_id,
+                "sender_id": sender_id,
+                "recipient_id": recipient_id,
+                "body": f"message {i}",
+                "created_at": started + timedelta(seconds=rng.randint(0, 365 * 86400)),
+            }
+
+    for batch in _batches(messages()):
+        session.execute(insert(MessageModel), batch)
+
+    session.execute(insert(UnreadCounterModel).values(user_id=VIEWER_ID, unread_count=100))
+
+    grants = {
+        (rng.randint(2, num_users), rng.choice((VIEWER_ID, rng.randint(2, num_users))))
+        for _ in range(num_grants)
+    }
+    grant_rows = (
+        {"user_id": user_id, "permission_granted_for_user_id": viewer_id}
+        for user_id, viewer_id in grants
+        if user_id != viewer_id
+    )
+    for batch in _batches(grant_rows):
+        session.execute(insert(VisibleFirstNameModel), batch)
+
+    session.commit()
+
+    # A published run of random matches for /v1/match/today to read
+    writer = MatchRunWriter(
+        lambda: Session(session.get_bind()), datetime.utcnow().date(), DEFAULT_TOP_K
+    )
+    writer.start()
+    ranks = np.arange(1, DEFAULT_TOP_K + 1)
+
+    for start in range(1, num_users + 1, SEED_BATCH_SIZE):
+        user_ids = np.arange(start, min(start + SEED_BATCH_SIZE, num_users + 1))
+        writer.write(
+            np.repeat(user_ids, DEFAULT_TOP_K),
+            np_rng.integers(1, num_users + 1, len(user_ids) * DEFAULT_TOP_K),
+            np.tile(ranks, len(user_ids)),
+            np.tile(np.linspace(1, 0, DEFAULT_TOP_K), len(user_ids)),
+        )
+
+    writer.publish()
+
+
+def is_seeded(session: Session, num_users: int) -> bool:
+    return session.scalar(select(func.count()).select_from(UserModel)) == num_users
+
+
+async def measure(fn: Callable[[], object | Awaitable], iterations: int, warmup: int) -> dict:
+    """Runs fn warmup times untimed, then iterations times, and summarizes its latency"""
+    latencies = []
+
+    for i in range(warmup + iterations):
+        started = time.perf_counter()
+        result = fn()
+
+        if inspect.isawaitable(result):
+            await result
+
+        if i >= warmup:
+            latencies.append(time.perf_counter() - started)
+
+    p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+
+    return {
+        "iterations": iterations,
+        "mean_ms": float(np.mean(latencies) * 1000),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "max_ms": float(max(latencies) * 1000),
+    }
+
+
+Case = tuple[str, Callable[[], object | Awaitable], int]
+
+
+def service_cases(
+    session: Session, num_users: int, pool: HashingPool, iterations: int
+) -> list[Case]:
+    rng = random.Random(1)
+    user_svc = UserService(session, CandidateIndex(num_questions=0, num_choices=1))
+    unthrottled = throttle.LoginThrottle(
+        ip_attempts=UNLIMITED_ATTEMPTS, email_attempts=UNLIMITED_ATTEMPTS
+    )
+    auth_svc = AuthService(session, SECRET_KEY, 30, hashing_pool=pool, throttle=unthrottled)
+    # Lets one attempt through, every later one is turned away by the throttle
+    throttled_svc = AuthService(
+        session,
+        SECRET_KEY,
+        30,
+        hashing_pool=pool,
+        throttle=throttle.LoginThrottle(ip_attempts=1, email_attempts=1),
+    )
+    registration_svc = RegisterationService(session, hashing_pool=pool)
+    registration_svc.user_svc = user_svc
+    message_svc = MessageService(session)
+    match_svc = MatchService(session)
+    num_senders = min(NUM_INBOX_SENDERS, num_users - 1)
+
+    def user_id() -> int:
+        return rng.randint(2, num_users)
+
+    def page() -> list[int]:
+        return rng.sample(range(2, num_users + 1), min(PAGE_SIZE, num_users - 1))
+
+    def then_expunge(fn: Callable[[], object]) -> Callable[[], object]:
+        def wrapper():
+            result = fn()
+            session.expunge_all()
+            return result
+
+        return wrapper
+
+    def inbox_deep_page() -> None:
+        cursor = None
+
+        for _ in range(5):
+            cursor = message_svc.get_messages(VIEWER_ID, cursor, PAGE_SIZE)["next_cursor"]
+
+    def send_message() -> None:
+        message_svc.send_message(rng.randint(2, num_senders + 1), VIEWER_ID, "benchmark")
+        session.commit()
+
+    sign_ups = itertools.count()
+
+    async def sign_up() -> None:
+        email = f"{SIGN_UP_EMAIL_PREFIX}{next(sign_ups)}@example.com"
+        await registration_svc.sign_up(
+            RegistrationSchema(email=email, password1=PASSWORD, password2=PASSWORD)
+        )
+        session.commit()
+
+    async def login() -> None:
+        await auth_svc.login(f"user{user_id()}@example.com", PASSWORD)
+
+    async def throttled_login() -> None:
+        try:
+            await throttled_svc.login(f"user{VIEWER_ID}@example.com", PASSWORD, "203.0.113.1")
+        except HTTPException:
+            pass
+
+    features = load_features(session)
+    one_hot, answered = encode_answers(features.answers)
+    block_size = max(1, min(DEFAULT_BLOCK_SIZE, MAX_BLOCK_PAIRS // len(features)))
+
+    def cron_block() -> None:
+        start = rng.randrange(0, max(len(features) - block_size, 1))
+        stop = min(start + block_size, len(features))
+        score_block(features, one_hot, answered, start, stop, DEFAULT_TOP_K)
+
+    def conversation_page() -> None:
+        message_svc.get_conversation_messages(VIEWER_ID, rng.randint(1, num_senders))
+
+    def user_by_email() -> None:
+        user_svc.get_user_by_email(f"user{user_id()}@example.com")
+
+    slow = max(1, iterations // 50)
+
+    return [
+        ("user.get_user", then_expunge(lambda: user_svc.get_user(user_id())), iterations),
+        ("user.get_user_by_email", then_expunge(user_by_email), iterations),
+        (
+            "user.get_profile_cards",
+            then_expunge(lambda: user_svc.get_profile_cards(VIEWER_ID, page())),
+            iterations,
+        ),
+        (
+            "user.can_see_first_names",
+            lambda: user_svc.can_see_first_names(VIEWER_ID, page()),
+            iterations,
+        ),
+        ("user.suggest_usernames", lambda: user_svc.suggest_usernames(user_id()), iterations),
+        ("auth.login", login, iterations),
+        ("auth.login_throttled", throttled_login, iterations),
+        ("registration.sign_up", sign_up, iterations),
+        (
+            "message.get_messages",
+            then_expunge(lambda: message_svc.get_messages(VIEWER_ID)),
+            iterations,
+        ),
+        ("message.get_messages_page_5", then_expunge(inbox_deep_page), iterations),
+        ("message.get_conversation_messages", then_expunge(conversation_page), iterations),
+        (
+            "message.get_num_of_unread_messages",
+            lambda: message_svc.get_num_of_unread_messages(user_id()),
+            iterations,
+        ),
+        ("message.send_message", send_message, iterations),
+        ("match.get_scores", lambda: match_svc.get_scores(VIEWER_ID, page()), iterations),
+        ("match.get_todays_matches", lambda: match_svc.get_todays_matches(user_id()), iterations),
+        ("cron.load_features", lambda: load_features(session), slow),
+        (f"cron.score_block_{block_size}", cron_block, slow),
+    ]
+
+
+def http_cases(client: httpx.AsyncClient, num_users: int, iterations: int) -> list[Case]:
+    rng = random.Random(2)
+
+    def page() -> list[int]:
+        return rng.sample(range(2, num_users + 1), min(PAGE_SIZE, num_users - 1))
+
+    async def get(path: str, **params) -> None:
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+
+    async def login() -> None:
+        response = await client.post(
+            "/v1/auth/login",
+            json={"email": f"user{rng.randint(2, num_users)}@example.com", "password": PASSWORD},
+        )
+        response.raise_for_status()
+
+    return [
+        ("http.get_profiles", lambda: get("/v1/user/profiles", ids=page()), iterations),
+        ("http.get_messages", lambda: get("/v1/message/"), iterations),
+        ("http.get_unread", lambda: get("/v1/message/number/unread"), iterations),
+        ("http.get_scores", lambda: get("/v1/match/scores", ids=page()), iterations),
+        ("http.get_todays_matches", lambda: get("/v1/match/today"), iterations),
+        ("http.login", login, iterations),
+    ]
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> list[str]:
+    """Cases whose p50 is slower than the baseline's by more than tolerance, as
+    messages. Cases missing from either run are skipped"""
+    regressions = []
+
+    for name, result in results["results"].items():
+        before = baseline["results"].get(name)
+
+        if before is None:
+            continue
+
+        limit = before["p50_ms"] * (1 + tolerance)
+
+        if result["p50_ms"] > limit and result["p50_ms"] - before["p50_ms"] > MIN_REGRESSION_MS:
+            regressions.append(
+                f"{name}: p50 {result['p50_ms']:.3f} ms vs {before['p50_ms']:.3f} ms "
+                f"(+{(result['p50_ms'] / before['p50_ms'] - 1) * 100:.0f}%)"
+            )
+
+    return regressions
+
+
+async def run(
+    database_url: str, scale: dict, iterations: int, warmup: int
+) -> dict[str, dict]:
+    engine = create_engine(database_url)
+    pool = HashingPool(workers=1, rounds=SEED_ROUNDS)
+    results = {}
+
+    with Session(engine) as session:
+        try:
+            for name, fn, n in service_cases(session, scale["users"], pool, iterations):
+                results[name] = await measure(fn, n, warmup)
+                print(f"{name:>40}: p50 {results[name]['p50_ms']:9.3f} ms", file=sys.stderr)
+        finally:
+            # Sign ups are removed so the database can be reused at the same scale
+            session.rollback()
+            session.execute(
+                delete(UserModel).where(UserModel.email.startswith(SIGN_UP_EMAIL_PREFIX))
+            )
+            session.commit()
+            pool.shutdown()
+
+    async_engine = create_async_engine(async_url(database_url))
+    session_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def benchmark_session():
+        async with session_factory() as session:
+            yield session
+            await session.commit()
+
+    # Tokens issued by login are signed with it
+    os.environ.setdefault("SECRET_KEY", SECRET_KEY)
+    throttle._login_throttle = throttle.LoginThrottle(
+        ip_attempts=UNLIMITED_ATTEMPTS, email_attempts=UNLIMITED_ATTEMPTS
+    )
+    app.dependency_overrides[get_session] = benchmark_session
+    app.dependency_overrides[get_current_user_id] = lambda: VIEWER_ID
+    transport = httpx.ASGITransport(app=app)
+
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, fn, n in http_cases(client, scale["users"], iterations):
+                results[name] = await measure(fn, n, warmup)
+                print(f"{name:>40}: p50 {results[name]['p50_ms']:9.3f} ms", file=sys.stderr)
+    finally:
+        app.dependency_overrides.clear()
+        get_hashing_pool().shutdown()
+        await async_engine.dispose()
+
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the services and HTTP endpoints")
+    parser.add_argument("--scale", choices=SCALES, default="1k")
+    parser.add_argument("--users", type=int, help="overrides the scale's user count")
+    parser.add_argument("--messages", type=int, help="overrides the scale's message count")
+    parser.add_argument("--grants", type=int, help="overrides the scale's grant count")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument(
+        "--database", help="SQLite file to seed, or reuse if seeded at this scale"
+    )
+    parser.add_argument("--output", default="-", help="JSON file, - for stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    scale = dict(SCALES[args.scale])
+
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    if scale["users"] < 2:
+        parser.error("at least 2 users are needed")
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        if baseline["scale"] != scale:
+            parser.error(f"{args.compare} was run at {baseline['scale']}, not {scale}")
+
+    path = args.database or os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    database_url = f"sqlite:///{path}"
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        if not is_seeded(session, scale["users"]):
+            if session.scalar(select(func.count()).select_from(UserModel)):
+                parser.error(f"{path} was seeded at another scale")
+
+            started = time.perf_counter()
+            seed(session, scale["users"], scale["messages"], scale["grants"])
+            print(f"seeded {scale} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    engine.dispose()
+
+    results = {
+        "scale": scale,
+        "python": platform.python_version(),
+        "created_at": datetime.utcnow().isoformat(),
+        "results": asyncio.run(run(database_url, scale, args.iterations, args.warmup)),
+    }
+
+    if args.output == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.tolerance)
+
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+        print(f"no regressions against {args.compare}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,742 @@
 # CRON for daily matches
+#
+# Loads every active user and their survey answers into NumPy matrices, scores
+# all candidate pairs one block of rows at a time and keeps the top-k matches
+# per user. Results are streamed out chunk by chunk so memory stays bounded by
+# the block size rather than the number of pairs.
+#
+#   python -m crons.match --top-k 10 --block-size 1024 --output matches.csv
+#
+# With --workers the user set is split into shards scored by a process pool.
+# Feature arrays are written once to the checkpoint directory and memory-mapped
+# read-only by every worker, and each finished shard is checkpointed there too,
+# so re-running with the same --checkpoint-dir resumes a crashed run.
+#
+#   python -m crons.match --workers 8 --checkpoint-dir /var/tmp/matches/2024-01-01
+#
+# With --candidates only the N nearest neighbours from an LSH candidate index
+# are scored exactly for each user, instead of every other user. The rebuilt
+# index is saved to CANDIDATE_INDEX_PATH, the API processes reload it from there.
+#
+#   python -m crons.match --candidates 300
+#
+# With --store the matches are written to the daily_matches table GET
+# /v1/match/today serves, one transaction per block (or per shard with
+# --workers). The run only becomes visible once every block is in, when the
+# current run pointer is swapped over to it, and the previous run is deleted.
+#
+#   python -m crons.match --workers 8 --checkpoint-dir /var/tmp/matches/2024-01-01 --store
+#
+# With --incremental only the users affected by the profile changes no
+# published run has consumed yet are re-scored: the changed users, the users whose lists
+# they're in, and the users they now beat a match of. Everyone else's list is
+# copied over from the current run. A full rebuild stays the default, and is
+# done anyway when there's no current run with the same --top-k.
+#
+#   python -m crons.match --store --incremental
+#
+# With --notify every user who got matches is sent a notification, queued in
+# the email outbox in one statement per thousand users once the run is written.
+#
+#   python -m crons.match --output matches.csv --notify
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models.daily_match import CurrentMatchRunModel, DailyMatchModel, MatchRunModel
+from models.user import UserModel
+from services.compatibility import (
+    MatchFeatures,
+    build_features,
+    compatibility_scores,
+    encode_answers,
+    preference_mask,
+    rank_candidates,
+    top_k,
+)
+from services.candidate_index import CANDIDATE_INDEX_PATH, CandidateIndex
+from services.match import MatchRunWriter
+from services.outbox import MATCH_NOTIFICATION_BODY, MATCH_NOTIFICATION_SUBJECT, EmailOutbox
+from services.profile_changes import pending_changes
+from services.survey import SurveyService
+
+DEFAULT_TOP_K = 10
+DEFAULT_BLOCK_SIZE = 1024
+DEFAULT_SHARD_SIZE = 16384
+DEFAULT_NUM_CANDIDATES = 300
+
+FEATURE_ARRAYS = ("user_ids", "genders", "interested_in", "answers", "one_hot", "answered")
+
+
+class MatchChunk(object):
+    """Top-k matches for one block of users, as flat parallel arrays"""
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        match_user_ids: np.ndarray,
+        ranks: np.ndarray,
+        scores: np.ndarray,
+        pairs_scored: int,
+    ) -> None:
+        self.user_ids = user_ids
+        self.match_user_ids = match_user_ids
+        self.ranks = ranks
+        self.scores = scores
+        self.pairs_scored = pairs_scored
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def rows(self) -> Iterator[tuple[int, int, int, float]]:
+        return zip(
+            self.user_ids.tolist(),
+            self.match_user_ids.tolist(),
+            self.ranks.tolist(),
+            self.scores.tolist(),
+        )
+
+
+def load_features(session: Session) -> MatchFeatures:
+    q = (
+        select(UserModel.id, UserModel.gender, UserModel.interested_in)
+        # Users who haven't given a gender yet can't be matched on preferences
+        .where(UserModel.is_active.is_(True), UserModel.gender.is_not(None))
+        .order_by(UserModel.id)
+    )
+    users = session.execute(q).all()
+
+    user_ids = np.fromiter((u.id for u in users), dtype=np.int64, count=len(users))
+    answers = SurveyService(session).get_active_answer_matrix(user_ids)
+
+    return build_features(users, answers)
+
+
+def _chunk(
+    features: MatchFeatures,
+    row_user_ids: np.ndarray,
+    idx: np.ndarray,
+    scores: np.ndarray,
+    pairs_scored: int,
+) -> MatchChunk:
+    # Excluded pairs are scored -inf and sort last, so ranks stay contiguous
+    valid = np.isfinite(scores)
+    k = idx.shape[1]
+
+    return MatchChunk(
+        user_ids=np.repeat(row_user_ids, k)[valid.ravel()],
+        match_user_ids=features.user_ids[idx[valid]],
+        ranks=np.tile(np.arange(1, k + 1), len(row_user_ids))[valid.ravel()],
+        scores=scores[valid],
+        pairs_scored=pairs_scored,
+    )
+
+
+def score_block(
+    features: MatchFeatures,
+    one_hot: np.ndarray,
+    answered: np.ndarray,
+    start: int,
+    stop: int,
+    k: int,
+) -> MatchChunk:
+    rows = slice(start, stop)
+
+    scores = compatibility_scores(one_hot, answered, rows)
+    scores[~preference_mask(features, rows)] = -np.inf
+    scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+    idx, best = top_k(scores, k)
+
+    return _chunk(features, features.user_ids[rows], idx, best, scores.size)
+
+
+def iter_matches(
+    features: MatchFeatures,
+    k: int = DEFAULT_TOP_K,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> Iterator[MatchChunk]:
+    """Yields the top-k matches of every user, one block of users at a time"""
+    one_hot, answered = encode_answers(features.answers)
+
+    for start in range(0, len(features), block_size):
+        stop = min(start + block_size, len(features))
+
+        yield score_block(features, one_hot, answered, start, stop, k)
+
+
+def iter_candidate_matches(
+    features: MatchFeatures,
+    index: CandidateIndex,
+    k: int = DEFAULT_TOP_K,
+    num_candidates: int = DEFAULT_NUM_CANDIDATES,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> Iterator[MatchChunk]:
+    """Like iter_matches, but each user is only scored against the candidates
+    the index retrieves for them"""
+    one_hot, answered = encode_answers(features.answers)
+
+    for start in range(0, len(features), block_size):
+        stop = min(start + block_size, len(features))
+        candidates = index.query_many(features.answers[start:stop], num_candidates)
+
+        idx = np.zeros((stop - start, k), dtype=np.int64)
+        best = np.full((stop - start, k), -np.inf)
+        pairs_scored = 0
+
+        for offset, candidate_ids in enumerate(candidates):
+            cols = np.searchsorted(features.user_ids, candidate_ids).clip(
+                max=len(features) - 1
+            )
+            cols = cols[features.user_ids[cols] == candidate_ids]
+
+            ranked, scores = rank_candidates(
+                features, one_hot, answered, start + offset, cols, k
+            )
+            idx[offset, : len(ranked)] = ranked
+            best[offset, : len(scores)] = scores
+            pairs_scored += len(cols)
+
+        yield _chunk(features, features.user_ids[start:stop], idx, best, pairs_scored)
+
+
+def load_current_run(
+    session: Session, batch_size: int = 100_000
+) -> tuple[MatchRunModel | None, MatchChunk | None]:
+    """The run being served and all of its matches, read in batches straight
+    into arrays rather than one Python tuple per row"""
+    q = select(MatchRunModel).join(
+        CurrentMatchRunModel, CurrentMatchRunModel.run_id == MatchRunModel.id
+    )
+    run = session.scalars(q).one_or_none()
+
+    if run is None:
+        return None, None
+
+    q = (
+        select(
+            DailyMatchModel.user_id,
+            DailyMatchModel.match_user_id,
+            DailyMatchModel.rank,
+            DailyMatchModel.score,
+        )
+        .where(DailyMatchModel.run_id == run.id)
+        .execution_options(yield_per=batch_size)
+    )
+    batches = [np.array(rows, dtype=np.float64) for rows in session.execute(q).partitions()]
+    matches = np.concatenate(batches) if batches else np.empty((0, 4))
+
+    return run, MatchChunk(
+        user_ids=matches[:, 0].astype(np.int64),
+        match_user_ids=matches[:, 1].astype(np.int64),
+        ranks=matches[:, 2].astype(np.int64),
+        scores=matches[:, 3],
+        pairs_scored=0,
+    )
+
+
+def _positions(features: MatchFeatures, user_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The feature row of each of user_ids, and a mask of which are active and so have one"""
+    if len(features) == 0:
+        return np.zeros(len(user_ids), dtype=np.int64), np.zeros(len(user_ids), dtype=bool)
+
+    rows = np.searchsorted(features.user_ids, user_ids).clip(max=len(features) - 1)
+
+    return rows, features.user_ids[rows] == user_ids
+
+
+def _feature_rows(features: MatchFeatures, user_ids: np.ndarray) -> np.ndarray:
+    """Sorted feature rows of user_ids, leaving out users who aren't active"""
+    rows, known = _positions(features, user_ids)
+
+    return np.unique(rows[known])
+
+
+def score_rows(
+    features: MatchFeatures,
+    one_hot: np.ndarray,
+    answered: np.ndarray,
+    rows: np.ndarray,
+    k: int,
+) -> tuple[MatchChunk, np.ndarray]:
+    """Like score_block for an arbitrary set of rows, also returning the
+    masked score matrix"""
+    scores = compatibility_scores(one_hot, answered, rows)
+    scores[~preference_mask(features, rows)] = -np.inf
+    scores[np.arange(len(rows)), rows] = -np.inf
+
+    idx, best = top_k(scores, k)
+
+    return _chunk(features, features.user_ids[rows], idx, best, scores.size), scores
+
+
+def iter_incremental_matches(
+    features: MatchFeatures,
+    previous: MatchChunk,
+    changed_ids: np.ndarray,
+    k: int = DEFAULT_TOP_K,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+) -> Iterator[MatchChunk]:
+    """Yields the same top-k lists as iter_matches, up to ties, given previous,
+    the lists of a run computed before the users in changed_ids changed.
+
+    Only the lists that can differ are re-scored: those of the changed users,
+    of users with a changed user in their list, and of users a changed user now
+    scores above their k-th match, found while the changed users are scored.
+    Every other active user's previous list is carried over as is.
+    """
+    one_hot, answered = encode_answers(features.answers)
+    changed_rows = _feature_rows(features, np.asarray(changed_ids, dtype=np.int64))
+
+    # The k-th best score of each previous list, -inf while a list has fewer than k
+    threshold = np.full(len(features), -np.inf)
+    last = previous.ranks == k
+    rows, known = _positions(features, previous.user_ids[last])
+    threshold[rows[known]] = previous.scores[last][known]
+
+    affected = np.zeros(len(features), dtype=bool)
+
+    for start in range(0, len(changed_rows), block_size):
+        chunk, scores = score_rows(
+            features, one_hot, answered, changed_rows[start : start + block_size], k
+        )
+        affected |= (scores > threshold).any(axis=0)
+
+        yield chunk
+
+    containing = previous.user_ids[np.isin(previous.match_user_ids, changed_ids)]
+    affected[_feature_rows(features, containing)] = True
+    # Users with no previous list at all, which a change log entry can't be relied on for
+    affected[~np.isin(features.user_ids, previous.user_ids)] = True
+    affected[changed_rows] = False
+    affected_rows = np.flatnonzero(affected)
+
+    for start in range(0, len(affected_rows), block_size):
+        chunk, _ = score_rows(
+            features, one_hot, answered, affected_rows[start : start + block_size], k
+        )
+
+        yield chunk
+
+    rescored = features.user_ids[np.union1d(changed_rows, affected_rows)]
+    carried = np.flatnonzero(
+        np.isin(previous.user_ids, features.user_ids)
+        & ~np.isin(previous.user_ids, rescored)
+    )
+
+    for start in range(0, len(carried), block_size * k):
+        rows = carried[start : start + block_size * k]
+
+        yield MatchChunk(
+            user_ids=previous.user_ids[rows],
+            match_user_ids=previous.match_user_ids[rows],
+            ranks=previous.ranks[rows],
+            scores=previous.scores[rows],
+            pairs_scored=0,
+        )
+
+    print(
+        f"incremental: {len(changed_rows):,} changed users and {len(affected_rows):,} "
+        f"affected users re-scored, {len(features) - len(rescored):,} lists carried over",
+        file=sys.stderr,
+    )
+
+
+def save_features(
+    features: MatchFeatures, directory: str, change_ids: list[int] | None = None
+) -> None:
+    """Writes the feature arrays, plus their encodings, as .npy files workers can
+    memory-map, and the ids of the profile changes they reflect"""
+    features_dir = os.path.join(directory, "features")
+    os.makedirs(features_dir, exist_ok=True)
+
+    one_hot, answered = encode_answers(features.answers)
+    arrays = {
+        "user_ids": features.user_ids,
+        "genders": features.genders,
+        "interested_in": features.interested_in,
+        "answers": features.answers,
+        "one_hot": one_hot,
+        "answered": answered,
+    }
+
+    for name, array in arrays.items():
+        np.save(os.path.join(features_dir, f"{name}.npy"), array)
+
+    np.save(
+        os.path.join(features_dir, "change_ids.npy"),
+        np.array(change_ids or [], dtype=np.int64),
+    )
+
+    # Written last so a crash mid-save is never mistaken for a usable snapshot
+    open(os.path.join(features_dir, "READY"), "w").close()
+
+
+def has_saved_features(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, "features", "READY"))
+
+
+def saved_change_ids(directory: str) -> list[int]:
+    return np.load(os.path.join(directory, "features", "change_ids.npy")).tolist()
+
+
+def open_features(directory: str) -> dict[str, np.ndarray]:
+    features_dir = os.path.join(directory, "features")
+
+    return {
+        name: np.load(os.path.join(features_dir, f"{name}.npy"), mmap_mode="r")
+        for name in FEATURE_ARRAYS
+    }
+
+
+def _shard_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, f"shard-{shard:05d}.npz")
+
+
+def _save_chunk(chunk: MatchChunk, path: str) -> None:
+    tmp_path = f"{path}.tmp"
+
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            user_ids=chunk.user_ids,
+            match_user_ids=chunk.match_user_ids,
+            ranks=chunk.ranks,
+            scores=chunk.scores,
+            pairs_scored=np.array(chunk.pairs_scored),
+        )
+
+    os.replace(tmp_path, path)
+
+
+def _load_chunk(path: str) -> MatchChunk:
+    with np.load(path) as f:
+        return MatchChunk(
+            user_ids=f["user_ids"],
+            match_user_ids=f["match_user_ids"],
+            ranks=f["ranks"],
+            scores=f["scores"],
+            pairs_scored=int(f["pairs_scored"]),
+        )
+
+
+_worker_arrays: dict[str, dict[str, np.ndarray]] = {}
+
+
+def _score_shard(
+    directory: str, shard: int, start: int, stop: int, k: int, block_size: int
+) -> tuple[int, float, int]:
+    """Runs in a worker process. Only the shard bounds are pickled, the feature
+    arrays are memory-mapped once per process and shared through the page cache"""
+    started = time.perf_counter()
+
+    if directory not in _worker_arrays:
+        _worker_arrays[directory] = open_features(directory)
+
+    arrays = _worker_arrays[directory]
+    features = MatchFeatures(
+        arrays["user_ids"], arrays["genders"], arrays["interested_in"], arrays["answers"]
+    )
+
+    chunks = [
+        score_block(
+            features,
+            arrays["one_hot"],
+            arrays["answered"],
+            block_start,
+            min(block_start + block_size, stop),
+            k,
+        )
+        for block_start in range(start, stop, block_size)
+    ]
+    chunk = MatchChunk(
+        user_ids=np.concatenate([c.user_ids for c in chunks]),
+        match_user_ids=np.concatenate([c.match_user_ids for c in chunks]),
+        ranks=np.concatenate([c.ranks for c in chunks]),
+        scores=np.concatenate([c.scores for c in chunks]),
+        pairs_scored=sum(c.pairs_scored for c in chunks),
+    )
+    _save_chunk(chunk, _shard_path(directory, shard))
+
+    return shard, time.perf_counter() - started, chunk.pairs_scored
+
+
+def check_shard_params(directory: str, **params: int) -> None:
+    """Records the parameters shards in directory are scored with, or raises
+    ValueError if its checkpoints were scored with different ones"""
+    path = os.path.join(directory, "PARAMS")
+
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+
+        if saved != params:
+            raise ValueError(
+                f"{directory} was checkpointed with {saved}, not {params}, "
+                "use another checkpoint directory"
+            )
+
+        return
+
+    os.makedirs(directory, exist_ok=True)
+
+    with open(path, "w") as f:
+        json.dump(params, f)
+
+
+def iter_sharded_matches(
+    directory: str,
+    workers: int,
+    k: int = DEFAULT_TOP_K,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+) -> Iterator[MatchChunk]:
+    """Scores the features saved in directory across a process pool, skipping
+    shards already checkpointed by a previous run, then yields every shard in
+    order. Raises ValueError straight away if those were scored with other
+    parameters, rather than mixing them in"""
+    check_shard_params(directory, k=k, block_size=block_size, shard_size=shard_size)
+
+    return _iter_shards(directory, workers, k, block_size, shard_size)
+
+
+def _iter_shards(
+    directory: str, workers: int, k: int, block_size: int, shard_size: int
+) -> Iterator[MatchChunk]:
+    num_users = len(open_features(directory)["user_ids"])
+    bounds = [
+        (start, min(start + shard_size, num_users))
+        for start in range(0, num_users, shard_size)
+    ]
+    pending = [
+        shard
+        for shard in range(len(bounds))
+        if not os.path.exists(_shard_path(directory, shard))
+    ]
+
+    if len(pending) < len(bounds):
+        print(
+            f"resuming: {len(bounds) - len(pending)}/{len(bounds)} shards already checkpointed",
+            file=sys.stderr,
+        )
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_score_shard, directory, shard, *bounds[shard], k, block_size)
+            for shard in pending
+        ]
+
+        for future in as_completed(futures):
+            shard, elapsed, pairs_scored = future.result()
+            start, stop = bounds[shard]
+            print(
+                f"shard {shard + 1}/{len(bounds)} (users {start}-{stop}): "
+                f"{pairs_scored:,} pairs in {elapsed:.2f}s "
+                f"({pairs_scored / max(elapsed, 1e-9):,.0f} pairs/sec)",
+                file=sys.stderr,
+            )
+
+    for shard in range(len(bounds)):
+        yield _load_chunk(_shard_path(directory, shard))
+
+
+def write_matches(chunks: Iterator[MatchChunk], out) -> tuple[int, int]:
+    """Streams chunks out as CSV rows, returns (rows written, pairs scored)"""
+    writer = csv.writer(out)
+    writer.writerow(["user_id", "match_user_id", "rank", "score"])
+
+    num_rows = pairs_scored = 0
+
+    for chunk in chunks:
+        writer.writerows(chunk.rows())
+        num_rows += len(chunk)
+        pairs_scored += chunk.pairs_scored
+
+    return num_rows, pairs_scored
+
+
+def stored(chunks: Iterator[MatchChunk], writer: MatchRunWriter) -> Iterator[MatchChunk]:
+    """Passes chunks through, writing each to the run in its own transaction"""
+    for chunk in chunks:
+        writer.write(chunk.user_ids, chunk.match_user_ids, chunk.ranks, chunk.scores)
+        yield chunk
+
+
+def matched_users(chunks: Iterator[MatchChunk], user_ids: set[int]) -> Iterator[MatchChunk]:
+    """Passes chunks through, collecting the ids of users who got matches"""
+    for chunk in chunks:
+        user_ids.update(np.unique(chunk.user_ids).tolist())
+        yield chunk
+
+
+def notify(session: Session, user_ids: set[int]) -> int:
+    """Queues a match notification to each user, returns how many were queued"""
+    return EmailOutbox(session).enqueue_for_users(
+        sorted(user_ids),
+        "match_notification",
+        MATCH_NOTIFICATION_SUBJECT,
+        MATCH_NOTIFICATION_BODY,
+    )
+
+
+def report(pairs_scored: int, num_rows: int, elapsed: float) -> None:
+    print(
+        f"scored {pairs_scored:,} pairs in {elapsed:.2f}s "
+        f"({pairs_scored / max(elapsed, 1e-9):,.0f} pairs/sec), wrote {num_rows:,} matches",
+        file=sys.stderr,
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compute daily matches")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument(
+        "--output", help="CSV file, - for stdout, which is the default unless --store is given"
+    )
+    parser.add_argument(
+        "--store", action="store_true", help="write the run to daily_matches and publish it"
+    )
+    parser.add_argument(
+        "--date",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="the day the run is for, YYYY-MM-DD, today by default",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=0, help="processes to shard across, 0 to run inline"
+    )
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=0,
+        help="score only this many index candidates per user, 0 to score every pair",
+    )
+    parser.add_argument(
+        "--checkpoint-dir", help="where shards are checkpointed, required with --workers"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="re-score only the users affected by profile changes since the current run",
+    )
+    parser.add_argument(
+        "--notify", action="store_true", help="email every matched user once the run is written"
+    )
+    args = parser.parse_args(argv)
+
+    if args.workers and not args.checkpoint_dir:
+        parser.error("--checkpoint-dir is required with --workers")
+
+    if args.workers and args.candidates:
+        parser.error("--candidates cannot be combined with --workers")
+
+    if args.incremental and not args.store:
+        parser.error("--incremental requires --store")
+
+    if args.incremental and (args.workers or args.candidates):
+        parser.error("--incremental cannot be combined with --workers or --candidates")
+
+    started = time.perf_counter()
+
+    if args.workers:
+        # A resumed run keeps scoring the snapshot it started with
+        if not has_saved_features(args.checkpoint_dir):
+            with SessionLocal() as session:
+                change_ids, _ = pending_changes(session)
+                save_features(load_features(session), args.checkpoint_dir, change_ids)
+
+        change_ids = saved_change_ids(args.checkpoint_dir)
+        try:
+            chunks = iter_sharded_matches(
+                args.checkpoint_dir,
+                args.workers,
+                args.top_k,
+                args.block_size,
+                args.shard_size,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        previous_run = previous = None
+
+        # Read first, so changes made while the features load are picked up next run
+        with SessionLocal() as session:
+            change_ids, changed = pending_changes(session)
+            features = load_features(session)
+
+            if args.incremental:
+                previous_run, previous = load_current_run(session)
+
+                if previous_run is None or previous_run.top_k != args.top_k:
+                    print(f"no current top-{args.top_k} run, rebuilding", file=sys.stderr)
+                    previous = None
+
+        if previous is not None:
+            chunks = iter_incremental_matches(
+                features,
+                previous,
+                np.array(changed, dtype=np.int64),
+                args.top_k,
+                args.block_size,
+            )
+        elif args.candidates:
+            index = CandidateIndex.build(features.user_ids, features.answers)
+            index.save(CANDIDATE_INDEX_PATH)
+
+            chunks = iter_candidate_matches(
+                features, index, args.top_k, args.candidates, args.block_size
+            )
+        else:
+            chunks = iter_matches(features, args.top_k, args.block_size)
+
+    notified: set[int] = set()
+    writer = MatchRunWriter(SessionLocal, args.date, args.top_k, change_ids)
+
+    if args.store:
+        writer.start()
+        chunks = stored(chunks, writer)
+
+    if args.notify:
+        chunks = matched_users(chunks, notified)
+
+    output = "-" if args.output is None and not args.store else args.output
+
+    if output == "-":
+        num_rows, pairs_scored = write_matches(chunks, sys.stdout)
+    else:
+        # With --store alone the chunks are still drained through the CSV writer
+        with open(output or os.devnull, "w", newline="") as out:
+            num_rows, pairs_scored = write_matches(chunks, out)
+
+    report(pairs_scored, num_rows, time.perf_counter() - started)
+
+    if args.store:
+        deleted = writer.publish()
+        print(
+            f"published run {writer.run_id} for {args.date}, deleted {deleted:,} older matches",
+            file=sys.stderr,
+        )
+
+    if args.notify:
+        with SessionLocal() as session:
+            queued = notify(session, notified)
+            session.commit()
+
+        print(f"queued {queued:,} match notifications", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
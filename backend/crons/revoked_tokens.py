@@ -0,0 +1,29 @@
+# CRON to delete revocations of tokens that have expired
+#
+# An expired token is rejected on its own, so its revoked_tokens row only costs
+# space. RevocationStore never deletes on the request path, this keeps the
+# table down to the tokens that are still live.
+#
+#   python -m crons.revoked_tokens
+import sys
+import time
+
+from db import SessionLocal
+from services.revocation import delete_expired
+
+
+def main() -> None:
+    started = time.perf_counter()
+
+    with SessionLocal() as session:
+        deleted = delete_expired(session)
+        session.commit()
+
+    print(
+        f"deleted {deleted} expired revocations in {time.perf_counter() - started:.2f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
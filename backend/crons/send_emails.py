@@ -0,0 +1,57 @@
+# Background sender for the email outbox
+#
+# Requests and crons only write emails to the outbox table. This delivers them
+# in batches over one kept-alive SMTP connection, retrying failures with
+# exponential backoff. Several senders can run at once, each claims its own
+# batches.
+#
+#   python -m crons.send_emails --interval 5
+#   python -m crons.send_emails --once
+#
+# For local development point SMTP_HOST/SMTP_PORT at any debugging SMTP server,
+# e.g. `python -m aiosmtpd -n -l localhost:8025`.
+import argparse
+import signal
+import sys
+import threading
+import time
+
+from db import SessionLocal
+from services.outbox import EMAIL_BATCH_SIZE, EmailSender, SMTPTransport
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Send queued emails")
+    parser.add_argument("--batch-size", type=int, default=EMAIL_BATCH_SIZE)
+    parser.add_argument(
+        "--interval", type=float, default=5.0, help="seconds between polls once drained"
+    )
+    parser.add_argument("--once", action="store_true", help="drain the outbox and exit")
+    args = parser.parse_args(argv)
+
+    sender = EmailSender(SessionLocal, SMTPTransport(), batch_size=args.batch_size)
+    started = time.perf_counter()
+
+    if args.once:
+        try:
+            while sender.send_batch() == args.batch_size:
+                pass
+        finally:
+            sender.transport.close()
+    else:
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+        signal.signal(signal.SIGINT, lambda *_: stopped.set())
+        sender.run(args.interval, stopped)
+
+    stats = sender.stats()
+    print(
+        f"sent {stats['sent']} emails in {stats['batches']} batches, "
+        f"{stats['retried']} to retry, {stats['failed']} given up on "
+        f"in {time.perf_counter() - started:.2f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# CRON to re-encode survey vectors whose answers changed without going through
+# SurveyService (backfills, manual fixes, ...). Run it before the match cron.
+#
+#   python -m crons.survey_vectors
+import sys
+import time
+
+from db import SessionLocal
+from services.survey import SurveyService
+
+
+def main() -> None:
+    started = time.perf_counter()
+
+    with SessionLocal() as session:
+        reencoded = SurveyService(session).encode_stale_vectors()
+        session.commit()
+
+    print(
+        f"re-encoded {reencoded} survey vectors in {time.perf_counter() - started:.2f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# CRON to reconcile the denormalized unread counters with the messages table
+#
+# MessageService adjusts unread_counters in the same transaction as each message
+# write, so a counter only drifts when messages change some other way (manual
+# fixes, one-off scripts, ...). This recounts every counter's unseen messages
+# with a correlated COUNT(*) and rewrites only those that differ, then creates
+# the counters missing for users with unseen messages, in two statements.
+#
+#   python -m crons.unread_counters
+import sys
+import time
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models.message import MessageModel, UnreadCounterModel
+
+
+def reconcile(session: Session) -> tuple[int, int]:
+    """Returns (counters repaired, counters created)"""
+    actual = (
+        select(func.count())
+        .where(
+            MessageModel.recipient_id == UnreadCounterModel.user_id,
+            MessageModel.seen_at.is_(None),
+        )
+        .scalar_subquery()
+    )
+    repaired = session.execute(
+        update(UnreadCounterModel)
+        .values(unread_count=actual)
+        .where(UnreadCounterModel.unread_count != actual)
+    ).rowcount
+
+    missing = (
+        select(MessageModel.recipient_id, func.count())
+        .where(
+            MessageModel.seen_at.is_(None),
+            MessageModel.recipient_id.not_in(select(UnreadCounterModel.user_id)),
+        )
+        .group_by(MessageModel.recipient_id)
+    )
+    created = session.execute(
+        insert(UnreadCounterModel).from_select(["user_id", "unread_count"], missing)
+    ).rowcount
+
+    return repaired, created
+
+
+def main() -> None:
+    started = time.perf_counter()
+
+    with SessionLocal() as session:
+        repaired, created = reconcile(session)
+        session.commit()
+
+    print(
+        f"repaired {repaired} and created {created} unread counters "
+        f"in {time.perf_counter() - started:.2f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///pair.db")
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+# Seconds a request waits for a connection before failing instead of queueing forever
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def async_url(url: str) -> str:
+    """The same database through its asyncio driver"""
+    scheme, _, rest = url.partition("://")
+
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+# Their insert() adds ON CONFLICT, which the generic one can't express
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def dialect_insert(session: Session, model):
+    """insert(model) for the database session is bound to, with on_conflict_do_*"""
+    return _DIALECT_INSERTS[session.get_bind().dialect.name](model)
+
+
+def _pool_options(url: str) -> dict:
+    # SQLite connections are local files, its dialect picks its own pool
+    if url.startswith("sqlite"):
+        return {}
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", async_url(DATABASE_URL))
+
+engine = create_engine(DATABASE_URL, **_pool_options(DATABASE_URL))
+SessionLocal = sessionmaker(bind=engine)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options(ASYNC_DATABASE_URL))
+# Loaded attributes stay readable after the per-request commit, e.g. for the response
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
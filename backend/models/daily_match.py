@@ -0,0 +1,57 @@
+import enum
+from datetime import datetime
+
+from sqlalchemy import Column, Date, DateTime, Enum, Float, ForeignKey, Integer
+
+from models.user import Base
+
+
+class MatchRunStatus(enum.Enum):
+    RUNNING = "RUNNING"
+    COMPLETE = "COMPLETE"
+
+
+class MatchRunModel(Base):
+    """One run of the match cron. Its matches are only read once it's made current"""
+
+    __tablename__ = "match_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    match_date = Column(Date, nullable=False, index=True)
+    status = Column(Enum(MatchRunStatus), default=MatchRunStatus.RUNNING, nullable=False)
+    num_matches = Column(Integer, default=0, nullable=False)
+    top_k = Column(Integer, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime)
+
+    def __repr__(self) -> str:
+        return f"<MatchRunModel(id={self.id}, match_date={self.match_date}, status={self.status})>"
+
+
+class CurrentMatchRunModel(Base):
+    """A single row pointing at the run being served, swapped in one UPDATE"""
+
+    __tablename__ = "current_match_run"
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey("match_runs.id"), nullable=False)
+
+
+class DailyMatchModel(Base):
+    """A user's ranked matches for one run. The primary key is the index a user's
+    list is read from, keyed by run rather than by date so a re-run of a day can
+    be written next to the one being served"""
+
+    __tablename__ = "daily_matches"
+
+    user_id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey("match_runs.id"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    match_user_id = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+
+    def __repr__(self) -> str:
+        return (
+            f"<DailyMatchModel(user_id={self.user_id}, rank={self.rank}, "
+            f"match_user_id={self.match_user_id})>"
+        )
@@ -0,0 +1,34 @@
+import enum
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Enum, Index, Integer, String, Text
+
+from models.user import Base
+
+
+class EmailStatus(enum.Enum):
+    PENDING = "PENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+
+class EmailOutboxModel(Base):
+    __tablename__ = "email_outbox"
+    # The sender's scan for due emails is a range read of this index
+    __table_args__ = (Index("ix_email_outbox_status_send_after", "status", "send_after", "id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(Enum(EmailStatus), default=EmailStatus.PENDING, nullable=False)
+    # Not sent before this, pushed back while a sender holds the email and after failures
+    send_after = Column(DateTime, default=datetime.utcnow, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = Column(DateTime)
+
+    def __repr__(self) -> str:
+        return f"<EmailOutboxModel(kind={self.kind}, recipient={self.recipient})>"
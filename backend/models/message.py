@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
+
+from models.user import Base
+
+
+class ConversationModel(Base):
+    __tablename__ = "conversations"
+    # user_a_id is always the lower of the two ids so a pair maps to one row
+    __table_args__ = (UniqueConstraint("user_a_id", "user_b_id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_a_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_b_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ConversationModel(user_a_id={self.user_a_id}, user_b_id={self.user_b_id})>"
+
+
+class MessageModel(Base):
+    __tablename__ = "messages"
+    # id breaks created_at ties so (created_at, id) is a stable keyset cursor
+    __table_args__ = (
+        Index("ix_messages_recipient_created_at", "recipient_id", "created_at", "id"),
+        Index(
+            "ix_messages_conversation_created_at", "conversation_id", "created_at", "id"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    body = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    seen_at = Column(DateTime)
+
+    def __repr__(self) -> str:
+        return f"<MessageModel(sender_id={self.sender_id}, recipient_id={self.recipient_id}, created_at={self.created_at})>"
+
+
+class UnreadCounterModel(Base):
+    """Denormalized count of unseen messages per recipient, maintained by MessageService"""
+
+    __tablename__ = "unread_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    unread_count = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<UnreadCounterModel(user_id={self.user_id}, unread_count={self.unread_count})>"
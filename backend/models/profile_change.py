@@ -0,0 +1,31 @@
+import enum
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Enum, Integer
+
+from models.user import Base
+
+
+class ProfileChangeKind(enum.Enum):
+    CREATED = "CREATED"
+    EDITED = "EDITED"
+    DEACTIVATED = "DEACTIVATED"
+    DELETED = "DELETED"
+    SURVEY = "SURVEY"
+
+
+class ProfileChangeModel(Base):
+    """Log of changes that may move a user's matches, used as a queue: the match
+    cron re-scores the users logged here and deletes the rows it read once its
+    run is published"""
+
+    __tablename__ = "profile_changes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # No foreign key, deleted users are logged too
+    user_id = Column(Integer, nullable=False)
+    kind = Column(Enum(ProfileChangeKind), nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ProfileChangeModel(user_id={self.user_id}, kind={self.kind})>"
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String
+
+from models.user import Base
+
+
+class RevokedTokenModel(Base):
+    __tablename__ = "revoked_tokens"
+
+    # Assigned by the database in insert order, so every process can follow
+    # new revocations by id without trusting each other's clocks
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jti = Column(String, nullable=False, unique=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<RevokedTokenModel(jti={self.jti}, expires_at={self.expires_at})>"
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    SmallInteger,
+    String,
+    UniqueConstraint,
+)
+
+from models.user import Base
+
+
+class SurveyQuestionModel(Base):
+    __tablename__ = "survey_questions"
+
+    # Also the question's position in answer vectors, so ids are never reused
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    text = Column(String, nullable=False)
+    # Answers are 1-based indexes into choices
+    choices = Column(JSON, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<SurveyQuestionModel(id={self.id}, text={self.text})>"
+
+
+class SurveyAnswerModel(Base):
+    __tablename__ = "survey_answers"
+    __table_args__ = (UniqueConstraint("user_id", "question_id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    question_id = Column(Integer, nullable=False)
+    # 1-based choice index, 0 is reserved for "unanswered" in feature vectors
+    answer = Column(SmallInteger, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<SurveyAnswerModel(user_id={self.user_id}, question_id={self.question_id}, answer={self.answer})>"
+
+
+class SurveyVectorModel(Base):
+    """A submitted user's answers, packed for the match cron and compatibility scoring"""
+
+    __tablename__ = "survey_vectors"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # int8 answer per question id, 0 for unanswered. Shorter than the current
+    # survey when questions were added since, readers pad with zeros
+    vector = Column(LargeBinary, nullable=False)
+    # Bumped on every re-encode, so cached scores can tell the answers changed
+    version = Column(Integer, nullable=False, default=1)
+    encoded_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<SurveyVectorModel(user_id={self.user_id}, version={self.version})>"
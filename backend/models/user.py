@@ -23,7 +23,10 @@ class UserModel(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     first_name = Column(String, nullable=False)
-    gender = Column(Enum(Gender), nullable=False)
+    # None from sign up until the user fills in their profile
+    gender = Column(Enum(Gender))
+    # None means open to matches of any gender
+    interested_in = Column(Enum(Gender))
     image_1 = Column(String)
     image_2 = Column(String)
     image_3 = Column(String)
@@ -1,19 +1,26 @@
-from datetime import datetime
-
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
-Base = declarative_base()
+from models.user import Base
 
 
 class VisibleFirstNameModel(Base):
     __tablename__ = "visible_first_name"
+    __table_args__ = (
+        UniqueConstraint("user_id", "permission_granted_for_user_id"),
+        # "which first names may this viewer see" lookups start from the viewer
+        Index(
+            "ix_visible_first_name_viewer",
+            "permission_granted_for_user_id",
+            "user_id",
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     permission_granted_for_user_id = Column(
-        Integer, ForeignKey("user.id"), nullable=False
+        Integer, ForeignKey("users.id"), nullable=False
     )
     created_at = Column(DateTime, default=func.now(), nullable=False)
 
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class LoginSchema(BaseModel):
+    email: str
+    password: str
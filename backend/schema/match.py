@@ -0,0 +1,18 @@
+from datetime import date
+
+from pydantic import BaseModel
+
+
+class DailyMatchSchema(BaseModel):
+    rank: int
+    match_user_id: int
+    score: float
+
+
+class DailyMatchPageSchema(BaseModel):
+    """match_date is None when there's nothing to show, before the first run or
+    for a user the run found no matches for"""
+
+    match_date: date | None
+    matches: list[DailyMatchSchema]
+    next_cursor: int | None
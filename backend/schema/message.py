@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class MessageSchema(BaseModel):
+    body: str
+
+
+class MessageResponseSchema(BaseModel):
+    id: int
+    conversation_id: int
+    sender_id: int
+    recipient_id: int
+    body: str
+    created_at: datetime
+    seen_at: datetime | None
+
+    model_config = {"from_attributes": True}
+
+
+class MessagePageSchema(BaseModel):
+    messages: list[MessageResponseSchema]
+    next_cursor: str | None
@@ -1,5 +1,7 @@
 from pydantic import BaseModel
 
+from models.user import Gender
+
 
 class ProfileSchema(BaseModel):
     username: str
@@ -7,3 +9,40 @@ class ProfileSchema(BaseModel):
     email: str
     first_name: str
     about: str
+    # Left as they are when not sent, interested_in None means any gender
+    gender: Gender | None = None
+    interested_in: Gender | None = None
+
+
+class AccountSchema(BaseModel):
+    """The signed in user's own account, without the password hash"""
+
+    id: int
+    username: str
+    email: str
+    first_name: str
+    gender: Gender | None
+    interested_in: Gender | None
+    about: str | None
+    image_1: str | None
+    image_2: str | None
+    image_3: str | None
+    is_active: bool
+
+    model_config = {"from_attributes": True}
+
+
+class ProfileCardSchema(BaseModel):
+    """What a match card shows, first_name is None unless the viewer was granted it"""
+
+    id: int
+    username: str
+    first_name: str | None
+    gender: Gender | None
+    about: str | None
+    image: str | None
+
+
+class ProfileSearchPageSchema(BaseModel):
+    profiles: list[ProfileCardSchema]
+    next_cursor: int | None
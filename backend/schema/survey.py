@@ -0,0 +1,14 @@
+from pydantic import BaseModel, Field
+
+
+class SurveyQuestionSchema(BaseModel):
+    id: int
+    text: str
+    choices: list[str]
+
+    model_config = {"from_attributes": True}
+
+
+class SurveyAnswersSchema(BaseModel):
+    # question id -> 1-based choice index
+    answers: dict[int, int] = Field(min_length=1)
@@ -0,0 +1,5 @@
+from pydantic import BaseModel
+
+
+class VisibilitySchema(BaseModel):
+    user_ids: list[int]
@@ -0,0 +1,54 @@
+# Bulk user maintenance from CSV or JSONL files, one transaction per chunk
+#
+#   python -m scripts.bulk_users import users.jsonl --skip-existing
+#   python -m scripts.bulk_users deactivate flagged.csv
+#   python -m scripts.bulk_users delete flagged.csv
+#
+# Import records have username, email, first_name, gender and either password or
+# hashed_password, plus any of the optional profile columns. Deactivate and delete
+# read an id column.
+import argparse
+import sys
+
+from db import SessionLocal
+from services.bulk import DEFAULT_CHUNK_SIZE, BulkUserService, Progress, read_records
+from services.hashing import BCRYPT_ROUNDS, HASHING_WORKERS
+
+
+def _user_ids(path: str, chunk_size: int):
+    for chunk in read_records(path, chunk_size):
+        yield [int(record["id"]) for record in chunk]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Import, deactivate or delete users in bulk")
+    parser.add_argument("action", choices=("import", "deactivate", "delete"))
+    parser.add_argument("path", help=".csv or .jsonl file")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=HASHING_WORKERS)
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS)
+    parser.add_argument(
+        "--skip-existing", action="store_true", help="import: skip emails already registered"
+    )
+    args = parser.parse_args(argv)
+
+    progress = Progress(f"{args.action}:")
+
+    with SessionLocal() as session:
+        svc = BulkUserService(session, args.workers, args.rounds)
+
+        if args.action == "import":
+            affected = svc.import_users(
+                read_records(args.path, args.chunk_size), progress, args.skip_existing
+            )
+        elif args.action == "deactivate":
+            affected = svc.deactivate_users(_user_ids(args.path, args.chunk_size), progress)
+        else:
+            affected = svc.delete_users(_user_ids(args.path, args.chunk_size), progress)
+
+    progress.report()
+    print(f"{args.action}: {affected:,} users affected", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
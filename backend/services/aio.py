@@ -0,0 +1,41 @@
+import inspect
+from typing import Any, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class AsyncService(object):
+    """Async version of a sync service, bound to an AsyncSession.
+
+    Every method of the wrapped service becomes a coroutine that runs the sync
+    method with run_sync, on the greenlet through which the session's queries
+    reach the async driver. Handlers await it without blocking the event loop,
+    and the services keep a single implementation.
+
+    Methods that are already coroutines, like AuthService.login, await other
+    work between queries and are overridden explicitly in the subclasses.
+    """
+
+    service_class: type
+
+    def __init__(self, session: AsyncSession, **kwargs) -> None:
+        self.session = session
+        self.service = self.service_class(session.sync_session, **kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Runs a sync callable that queries through this session"""
+        return await self.session.run_sync(lambda _: fn(*args, **kwargs))
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.service, name)
+
+        if not inspect.ismethod(attr):
+            return attr
+
+        if inspect.iscoroutinefunction(attr):
+            raise AttributeError(f"{type(self).__name__} has no async version of {name}")
+
+        async def method(*args, **kwargs) -> Any:
+            return await self.run(attr, *args, **kwargs)
+
+        return method
@@ -1,49 +1,95 @@
-import jwt
+import uuid
 from datetime import datetime, timedelta
 
-from .user import UserService
-
-from fastapi import HTTPException
-
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from models.user import UserModel
 
+from .aio import AsyncService
+from .hashing import HashingPool, get_hashing_pool
+from .outbox import EmailOutbox, email_update_verification
+from .revocation import get_revocation_store
+from .throttle import LoginThrottle, get_login_throttle
+from . import user as users
+from .token import DEFAULT_KID, TokenVerifier
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+from fastapi import HTTPException
 
 
 class AuthService(object):
-    def __init__(self, session, secret_key: str, token_expiration_in_minutes: int):
+    def __init__(
+        self,
+        session,
+        secret_key: str,
+        token_expiration_in_minutes: int,
+        hashing_pool: HashingPool | None = None,
+        token_verifier: TokenVerifier | None = None,
+        throttle: LoginThrottle | None = None,
+    ):
         self.session = session
         self.SECRET_KEY = secret_key
         self.TOKEN_EXPIRATION_IN_MINUTES = token_expiration_in_minutes
-        self.user_svc = UserService(session)
+        self.user_svc = users.UserService(session)
+        self.hashing_pool = hashing_pool or get_hashing_pool()
+        self.token_verifier = token_verifier or TokenVerifier(
+            {DEFAULT_KID: secret_key},
+            DEFAULT_KID,
+            revocation_store=get_revocation_store(),
+        )
+        self.throttle = get_login_throttle() if throttle is None else throttle
 
     def generate_token(self, user_id: int) -> str:
-        return jwt.encode(
+        return self.token_verifier.sign(
             {
-                "sub": user_id,
+                "sub": str(user_id),
+                "jti": uuid.uuid4().hex,
                 "exp": datetime.utcnow()
                 + timedelta(minutes=self.TOKEN_EXPIRATION_IN_MINUTES),
-            },
-            self.SECRET_KEY,
-            algorithm="HS256",
+            }
         )
 
-    def login(self, email: str, password: str) -> dict[str, str]:
-        user = self.user_svc.get_user_by_email(email)
+    async def login(
+        self, email: str, password: str, client_ip: str | None = None
+    ) -> dict[str, str]:
+        self.throttle.check(client_ip, email)
+
+        return await self.authenticate(self.user_svc.get_user_by_email(email), password)
+
+    async def authenticate(self, user: UserModel | None, password: str) -> dict[str, str]:
+        """Checks the password of the user looked up by login and issues a token"""
+        verified = user is not None and await self.hashing_pool.verify(
+            password, user.hashed_password
+        )
+        self.throttle.record(verified)
 
         if user is None:
             raise HTTPException(status_code=401, detail="Invalid email")
 
-        if not verify_password(password, user.hashed_password):
+        if not verified:
             raise HTTPException(status_code=401, detail="Invalid password")
 
         return {"access_token": self.generate_token(user.id), "token_type": "bearer"}
 
-    def logout(self): ...
+    def logout(self, token: str) -> None:
+        """Revokes the given token server-side until it expires"""
+        claims = self.token_verifier.verify(token)
+
+        self.token_verifier.revocation_store.revoke(
+            self.session, claims["jti"], datetime.utcfromtimestamp(claims["exp"])
+        )
 
-    def send_email_update_verification(self, email: str): ...
+    def send_email_update_verification(self, email: str) -> None:
+        """Queued in the outbox, sent once the caller's transaction commits"""
+        EmailOutbox(self.session).enqueue(email_update_verification(email))
 
     def confirm_emai_update(self): ...
+
+
+class AsyncAuthService(AsyncService):
+    service_class = AuthService
+
+    async def login(
+        self, email: str, password: str, client_ip: str | None = None
+    ) -> dict[str, str]:
+        self.service.throttle.check(client_ip, email)
+        user = await self.run(self.service.user_svc.get_user_by_email, email)
+
+        return await self.service.authenticate(user, password)
@@ -0,0 +1,216 @@
+import csv
+import json
+import sys
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import IO, Iterable, Iterator
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.user import Gender, UserModel
+
+from .hashing import BCRYPT_ROUNDS, HASHING_WORKERS, hash_password
+from .user import UserService
+
+DEFAULT_CHUNK_SIZE = 1000
+
+REQUIRED_COLUMNS = ("username", "email", "first_name", "gender")
+OPTIONAL_COLUMNS = ("interested_in", "about", "image_1", "image_2", "image_3", "is_active")
+
+
+def read_records(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[list[dict]]:
+    """Streams a .csv (with a header row) or .jsonl file as lists of up to chunk_size dicts"""
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            records = csv.DictReader(f)
+        elif path.endswith(".jsonl"):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            raise ValueError(f"Expected a .csv or .jsonl file, got {path}")
+
+        chunk = []
+
+        for record in records:
+            chunk.append(record)
+
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+
+def user_row(record: dict) -> dict:
+    """UserModel column values from an import record, CSV empty strings read as missing"""
+    missing = [column for column in REQUIRED_COLUMNS if not record.get(column)]
+
+    if missing:
+        raise ValueError(f"Record for {record.get('email')!r} is missing {', '.join(missing)}")
+
+    row = {column: record[column] for column in REQUIRED_COLUMNS}
+    row.update(
+        (column, record[column])
+        for column in OPTIONAL_COLUMNS
+        if record.get(column) not in (None, "")
+    )
+    row["gender"] = Gender(row["gender"])
+
+    if "interested_in" in row:
+        row["interested_in"] = Gender(row["interested_in"])
+
+    if isinstance(row.get("is_active"), str):
+        row["is_active"] = row["is_active"].lower() in ("1", "true", "yes")
+
+    return row
+
+
+class Progress(object):
+    """Reports rows done and rows/sec, at most every interval seconds"""
+
+    def __init__(self, label: str, out: IO = sys.stderr, interval: float = 1.0) -> None:
+        self.label = label
+        self.out = out
+        self.interval = interval
+        self.rows = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / max(time.perf_counter() - self.started, 1e-9)
+
+    def update(self, rows: int) -> None:
+        self.rows += rows
+
+        if time.perf_counter() - self._reported >= self.interval:
+            self.report()
+
+    def report(self) -> None:
+        self._reported = time.perf_counter()
+        print(
+            f"{self.label} {self.rows:,} rows in {self._reported - self.started:.1f}s "
+            f"({self.rows_per_second:,.0f} rows/sec)",
+            file=self.out,
+        )
+
+
+class BulkUserService(object):
+    """Imports, deactivates and deletes users in chunks, one transaction per chunk.
+
+    Each chunk is a single executemany insert or IN statement. Passwords are
+    hashed in worker processes, and the next chunk is hashed while the current
+    one is inserted. A chunk that fails is rolled back on its own, the chunks
+    before it stay committed.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        workers: int = HASHING_WORKERS,
+        rounds: int = BCRYPT_ROUNDS,
+        user_svc: UserService | None = None,
+    ) -> None:
+        self.session = session
+        self.workers = workers
+        self.rounds = rounds
+        self.user_svc = user_svc or UserService(session)
+
+    def _hash_passwords(self, chunk: list[dict], executor: Executor) -> list[Future | str]:
+        """Records may carry a plain password, or a hashed_password from the old platform"""
+        return [
+            record["hashed_password"]
+            if record.get("hashed_password")
+            else executor.submit(hash_password, record["password"], self.rounds)
+            for record in chunk
+        ]
+
+    def _hashed_rows(
+        self, chunks: Iterable[list[dict]], executor: Executor, skip_existing: bool
+    ) -> Iterator[list[dict]]:
+        pending = None
+
+        for chunk in chunks:
+            if skip_existing:
+                chunk = self._new_records(chunk)
+
+            rows = [user_row(record) for record in chunk]
+            hashed = self._hash_passwords(chunk, executor)
+
+            if pending is not None:
+                yield _with_passwords(*pending)
+
+            pending = rows, hashed
+
+        if pending is not None:
+            yield _with_passwords(*pending)
+
+    def import_users(
+        self,
+        chunks: Iterable[list[dict]],
+        progress: Progress | None = None,
+        skip_existing: bool = False,
+    ) -> int:
+        """Inserts every record, returns how many users were created.
+
+        With skip_existing, records whose email is already taken are left out,
+        so an interrupted import can be re-run from the start.
+        """
+        created = 0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for rows in self._hashed_rows(chunks, executor, skip_existing):
+                try:
+                    created += len(self.user_svc.create_users(rows))
+                    self.session.commit()
+                except Exception:
+                    self.session.rollback()
+                    raise
+
+                if progress is not None:
+                    progress.update(len(rows))
+
+        return created
+
+    def _new_records(self, chunk: list[dict]) -> list[dict]:
+        emails = [record.get("email") for record in chunk]
+        q = select(UserModel.email).where(UserModel.email.in_(emails))
+        existing = set(self.session.execute(q).scalars())
+
+        return [record for record in chunk if record.get("email") not in existing]
+
+    def deactivate_users(
+        self, chunks: Iterable[list[int]], progress: Progress | None = None
+    ) -> int:
+        """Returns how many active accounts were deactivated"""
+        return self._apply(self.user_svc.deactivate_accounts, chunks, progress)
+
+    def delete_users(self, chunks: Iterable[list[int]], progress: Progress | None = None) -> int:
+        """Returns how many users were deleted"""
+        return self._apply(self.user_svc.delete_users, chunks, progress)
+
+    def _apply(self, statement, chunks: Iterable[list[int]], progress: Progress | None) -> int:
+        affected = 0
+
+        for user_ids in chunks:
+            try:
+                affected += statement(user_ids)
+                self.session.commit()
+            except Exception:
+                self.session.rollback()
+                raise
+
+            if progress is not None:
+                progress.update(len(user_ids))
+
+        return affected
+
+
+def _with_passwords(rows: list[dict], hashed: list[Future | str]) -> list[dict]:
+    for row, hashed_password in zip(rows, hashed):
+        row["hashed_password"] = (
+            hashed_password.result() if isinstance(hashed_password, Future) else hashed_password
+        )
+
+    return rows
@@ -0,0 +1,175 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class LRUCache(object):
+    """Bounded mapping that evicts the least recently used entry once full.
+
+    Entries can expire at an absolute unix time, either given per entry or
+    derived from the cache-wide ttl. Expired entries count as misses.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+
+        if item is None or (item[1] is not None and item[1] <= time.time()):
+            if item is not None:
+                del self._data[key]
+
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        return item[0]
+
+    def set(self, key: Hashable, value: Any, expires_at: float | None = None) -> None:
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def invalidate(self, *keys: Hashable) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class CacheBackend(ABC):
+    """A cache shared by every process, e.g. Redis or memcached. Implementations
+    are responsible for serializing values"""
+
+    @abstractmethod
+    def get(self, key: str) -> Any: ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None: ...
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None: ...
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Stand-in for a shared backend in tests, or a single-process deployment"""
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[Any, float]] = {}
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+
+        if item is None or item[1] <= time.time():
+            return None
+
+        return item[0]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (value, time.time() + ttl)
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class ReadThroughCache(object):
+    """Process-local LRU in front of an optional shared backend.
+
+    Callers read with get, load from the database on a miss and set the
+    result, which fills both tiers. None is never cached.
+    """
+
+    def __init__(
+        self, local: LRUCache, shared: CacheBackend | None = None, ttl: float = 60
+    ) -> None:
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        value = self.local.get(key)
+
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+
+            if value is not None:
+                self.local.set(key, value)
+                self.shared_hits += 1
+                return value
+
+        self.misses += 1
+
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def invalidate(self, *keys: str) -> None:
+        for key in keys:
+            self.local.delete(key)
+
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self.local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+        }
+
+
+def invalidate_on_commit(
+    session: Session, cache: ReadThroughCache | LRUCache, *keys: Hashable
+) -> None:
+    """Invalidates keys now, and again when the session's transaction ends, so a
+    read between the write and the commit can't leave uncommitted data cached"""
+    cache.invalidate(*keys)
+    session.info.setdefault("cache_invalidations", []).append((cache, keys))
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_queued_keys(session: Session) -> None:
+    for cache, keys in session.info.pop("cache_invalidations", ()):
+        cache.invalidate(*keys)
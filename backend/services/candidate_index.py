@@ -0,0 +1,208 @@
+import os
+from collections import Counter
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.compatibility import encode_answers
+
+CANDIDATE_INDEX_PATH = os.environ.get("CANDIDATE_INDEX_PATH", "candidate_index.npz")
+
+DEFAULT_NUM_TABLES = 8
+DEFAULT_NUM_BITS = 12
+
+
+class CandidateIndex(object):
+    """Random-projection LSH over one-hot survey answer vectors.
+
+    Each of num_tables tables hashes a vector to num_bits sign bits of random
+    projections, so users with similar answers (high cosine similarity) tend
+    to share buckets. Queries return the users colliding in the most tables,
+    probing buckets one bit away when the exact buckets are too sparse.
+    """
+
+    def __init__(
+        self,
+        num_questions: int,
+        num_choices: int,
+        num_tables: int = DEFAULT_NUM_TABLES,
+        num_bits: int = DEFAULT_NUM_BITS,
+        seed: int = 0,
+    ) -> None:
+        self.num_questions = num_questions
+        self.num_choices = num_choices
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.planes = (
+            np.random.default_rng(seed)
+            .standard_normal((num_questions * num_choices, num_tables * num_bits))
+            .astype(np.float32)
+        )
+        self._powers = 1 << np.arange(num_bits, dtype=np.int64)
+        self._tables: list[dict[int, set[int]]] = [{} for _ in range(num_tables)]
+        self._keys: dict[int, np.ndarray] = {}
+
+    @classmethod
+    def build(cls, user_ids: np.ndarray, answers: np.ndarray, **kwargs) -> "CandidateIndex":
+        index = cls(answers.shape[1], max(int(answers.max(initial=0)), 1), **kwargs)
+        index.add(user_ids, answers)
+
+        return index
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._keys
+
+    def _hash(self, answers: np.ndarray) -> np.ndarray:
+        """(len(answers), num_tables) bucket keys"""
+        answers = np.atleast_2d(answers)
+
+        # Questions or choices added since the index was built are ignored
+        fixed = np.zeros((len(answers), self.num_questions), dtype=np.int8)
+        width = min(answers.shape[1], self.num_questions)
+        fixed[:, :width] = answers[:, :width]
+        fixed[fixed > self.num_choices] = 0
+
+        one_hot, _ = encode_answers(fixed, self.num_choices)
+        bits = (one_hot @ self.planes) > 0
+
+        return bits.reshape(len(answers), self.num_tables, self.num_bits) @ self._powers
+
+    def add(self, user_ids, answers: np.ndarray) -> None:
+        """Inserts or re-inserts users with their current answers"""
+        for user_id, keys in zip(user_ids, self._hash(answers)):
+            user_id = int(user_id)
+            self.remove(user_id)
+
+            for table, key in zip(self._tables, keys.tolist()):
+                table.setdefault(key, set()).add(user_id)
+
+            self._keys[user_id] = keys
+
+    def remove(self, user_id: int) -> None:
+        keys = self._keys.pop(user_id, None)
+
+        if keys is None:
+            return
+
+        for table, key in zip(self._tables, keys.tolist()):
+            bucket = table[key]
+            bucket.discard(user_id)
+
+            if not bucket:
+                del table[key]
+
+    def query(self, answers: np.ndarray, limit: int) -> np.ndarray:
+        return self.query_many(np.atleast_2d(answers), limit)[0]
+
+    def query_many(self, answers: np.ndarray, limit: int) -> list[np.ndarray]:
+        """Up to limit candidate user ids per row of answers, most collisions first"""
+        results = []
+
+        for keys in self._hash(answers).tolist():
+            votes = Counter()
+
+            for table, key in zip(self._tables, keys):
+                votes.update(table.get(key, ()))
+
+            if len(votes) < limit:
+                for table, key in zip(self._tables, keys):
+                    for bit in self._powers.tolist():
+                        votes.update(table.get(key ^ bit, ()))
+
+            results.append(
+                np.array([user_id for user_id, _ in votes.most_common(limit)], dtype=np.int64)
+            )
+
+        return results
+
+    def save(self, path: str) -> None:
+        user_ids = np.fromiter(self._keys, dtype=np.int64, count=len(self._keys))
+        keys = np.array(list(self._keys.values()), dtype=np.int64).reshape(
+            len(user_ids), self.num_tables
+        )
+        tmp_path = f"{path}.tmp"
+
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                shape=np.array(
+                    [self.num_questions, self.num_choices, self.num_tables, self.num_bits]
+                ),
+                planes=self.planes,
+                user_ids=user_ids,
+                keys=keys,
+            )
+
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CandidateIndex":
+        with np.load(path) as f:
+            num_questions, num_choices, num_tables, num_bits = f["shape"].tolist()
+            index = cls(num_questions, num_choices, num_tables, num_bits)
+            index.planes = f["planes"]
+
+            for user_id, keys in zip(f["user_ids"].tolist(), f["keys"]):
+                for table, key in zip(index._tables, keys.tolist()):
+                    table.setdefault(key, set()).add(user_id)
+
+                index._keys[user_id] = keys
+
+        return index
+
+
+_candidate_index: CandidateIndex | None = None
+_loaded_mtime: int | None = None
+
+
+def get_candidate_index() -> CandidateIndex | None:
+    """The process-wide index, as last written to CANDIDATE_INDEX_PATH by the
+    match cron, reloaded whenever the cron rewrites the file. None until the
+    cron has trained one, an index over no questions would put everyone in
+    one bucket.
+
+    Changes applied through reindex_on_commit only reach the process that
+    committed them, so processes may differ on users changed since the last
+    rebuild until they load the next one.
+    """
+    global _candidate_index, _loaded_mtime
+
+    try:
+        mtime = os.stat(CANDIDATE_INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return _candidate_index
+
+    if mtime != _loaded_mtime:
+        index = CandidateIndex.load(CANDIDATE_INDEX_PATH)
+        _candidate_index = index if index.num_questions > 0 else None
+        _loaded_mtime = mtime
+
+    return _candidate_index
+
+
+def reindex_on_commit(
+    session: Session, index: CandidateIndex | None, user_ids, answers: np.ndarray | None
+) -> None:
+    """Queues adding user_ids with their answers to index, or removing them when
+    answers is None, to apply once the session's transaction commits"""
+    if index is not None:
+        session.info.setdefault("candidate_index_updates", []).append((index, user_ids, answers))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_queued_updates(session: Session) -> None:
+    for index, user_ids, answers in session.info.pop("candidate_index_updates", ()):
+        if answers is None:
+            for user_id in user_ids:
+                index.remove(int(user_id))
+        else:
+            index.add(user_ids, answers)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_queued_updates(session: Session) -> None:
+    session.info.pop("candidate_index_updates", None)
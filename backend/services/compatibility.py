@@ -0,0 +1,140 @@
+import numpy as np
+
+from models.user import Gender
+
+GENDER_CODES = {gender: code for code, gender in enumerate(Gender)}
+ANY_GENDER = -1
+
+
+class MatchFeatures(object):
+    """Read-only arrays describing the active users, all row-aligned by user index"""
+
+    def __init__(
+        self,
+        user_ids: np.ndarray,
+        genders: np.ndarray,
+        interested_in: np.ndarray,
+        answers: np.ndarray,
+    ) -> None:
+        self.user_ids = user_ids
+        self.genders = genders
+        self.interested_in = interested_in
+        self.answers = answers
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+
+def build_features(users, answers: np.ndarray) -> MatchFeatures:
+    """users are rows (or UserModels) with id, gender and interested_in, sorted by id"""
+    user_ids = np.fromiter((u.id for u in users), dtype=np.int64, count=len(users))
+    genders = np.fromiter(
+        (GENDER_CODES[u.gender] for u in users), dtype=np.int8, count=len(users)
+    )
+    interested_in = np.fromiter(
+        (
+            ANY_GENDER if u.interested_in is None else GENDER_CODES[u.interested_in]
+            for u in users
+        ),
+        dtype=np.int8,
+        count=len(users),
+    )
+
+    return MatchFeatures(user_ids, genders, interested_in, answers)
+
+
+def encode_answers(
+    answers: np.ndarray, num_choices: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """One-hot encodes the answer matrix so that a dot product between two rows
+    counts agreeing answers, and a second matrix marks which questions were answered"""
+    num_users, num_questions = answers.shape
+    if num_choices is None:
+        num_choices = max(int(answers.max(initial=0)), 1)
+
+    one_hot = np.zeros((num_users, num_questions * num_choices), dtype=np.float32)
+    rows, cols = np.nonzero(answers)
+    one_hot[rows, cols * num_choices + answers[rows, cols].astype(np.int64) - 1] = 1.0
+
+    answered = (answers > 0).astype(np.float32)
+
+    return one_hot, answered
+
+
+def compatibility_scores(
+    one_hot: np.ndarray,
+    answered: np.ndarray,
+    rows: slice | np.ndarray,
+    cols: slice | np.ndarray = slice(None),
+) -> np.ndarray:
+    """Fraction of agreeing answers among the questions both users answered,
+    for every (row, col) pair"""
+    agreeing = one_hot[rows] @ one_hot[cols].T
+    in_common = answered[rows] @ answered[cols].T
+
+    return agreeing / np.maximum(in_common, 1.0)
+
+
+def score_one_to_many(answers: np.ndarray, row: int, cols: np.ndarray) -> np.ndarray:
+    """Scores of one user against others, straight from their answer matrix.
+    NaN where the two have no answered question in common, nothing to score"""
+    one_hot, answered = encode_answers(answers)
+    scores = compatibility_scores(one_hot, answered, [row], cols)[0]
+    scores[(answered[[row]] @ answered[cols].T)[0] == 0] = np.nan
+
+    return scores
+
+
+def preference_mask(
+    features: MatchFeatures,
+    rows: slice | np.ndarray,
+    cols: slice | np.ndarray = slice(None),
+) -> np.ndarray:
+    """True where both users' gender preferences allow the pair"""
+    genders, interested_in = features.genders, features.interested_in
+
+    row_wants = interested_in[rows][:, None]
+    col_wants = interested_in[cols][None, :]
+
+    return ((row_wants == ANY_GENDER) | (row_wants == genders[cols][None, :])) & (
+        (col_wants == ANY_GENDER) | (col_wants == genders[rows][:, None])
+    )
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Column indices and scores of the k best entries of each row, best first"""
+    k = min(k, scores.shape[1])
+
+    if k == 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(scores, idx, axis=1)
+
+    order = np.argsort(-best, axis=1, kind="stable")
+
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(
+        best, order, axis=1
+    )
+
+
+def rank_candidates(
+    features: MatchFeatures,
+    one_hot: np.ndarray,
+    answered: np.ndarray,
+    row: int,
+    cols: np.ndarray,
+    k: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Exactly scores one user against a candidate subset of users, returning the
+    feature indices and scores of the k best allowed candidates, best first"""
+    cols = cols[cols != row]
+
+    scores = compatibility_scores(one_hot, answered, [row], cols)
+    scores[~preference_mask(features, [row], cols)] = -np.inf
+
+    idx, best = top_k(scores, k)
+    allowed = np.isfinite(best[0])
+
+    return cols[idx[0][allowed]], best[0][allowed]
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+HASHING_WORKERS = int(os.environ.get("HASHING_WORKERS", str(os.cpu_count() or 1)))
+HASHING_MAX_PENDING = int(os.environ.get("HASHING_MAX_PENDING", "64"))
+
+
+@lru_cache
+def _crypt_context(rounds: int) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    return _crypt_context(rounds).hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    # The cost is read back from the hash, rounds only matters for new hashes
+    return _crypt_context(BCRYPT_ROUNDS).verify(plain_password, hashed_password)
+
+
+class HashingPool(object):
+    """Runs bcrypt in worker processes so hashing never blocks the event loop.
+
+    At most max_pending hashes may be queued or running at once, anything past
+    that is rejected with a 503 straight away rather than waiting its turn.
+    """
+
+    def __init__(
+        self,
+        workers: int = HASHING_WORKERS,
+        max_pending: int = HASHING_MAX_PENDING,
+        rounds: int = BCRYPT_ROUNDS,
+    ) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor: ProcessPoolExecutor | None = None
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many requests, please try again shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        started = time.perf_counter()
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), fn, *args
+            )
+        finally:
+            elapsed = time.perf_counter() - started
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queue_depth": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "mean_latency_seconds": self.total_seconds / max(self.completed, 1),
+            "max_latency_seconds": self.max_seconds,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_hashing_pool: HashingPool | None = None
+
+
+def get_hashing_pool() -> HashingPool:
+    global _hashing_pool
+
+    if _hashing_pool is None:
+        _hashing_pool = HashingPool()
+
+    return _hashing_pool
@@ -0,0 +1,165 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+DEFAULT_MAX_QUEUE_SIZE = 100
+
+
+class HubBackend(ABC):
+    """Carries events between the hubs of every API process.
+
+    A production backend wraps a broker (Redis pub/sub, NATS, ...) and calls
+    deliver for every event any process publishes, including its own.
+    """
+
+    @abstractmethod
+    async def start(self, deliver: Callable[[int, dict], None]) -> None: ...
+
+    @abstractmethod
+    async def publish(self, user_id: int, event: dict) -> None: ...
+
+    async def stop(self) -> None:
+        pass
+
+
+class LocalHubBackend(HubBackend):
+    """Single-process stand-in for a broker, also records what was published"""
+
+    def __init__(self) -> None:
+        self._deliver: Callable[[int, dict], None] | None = None
+        self.published: list[tuple[int, dict]] = []
+
+    async def start(self, deliver: Callable[[int, dict], None]) -> None:
+        self._deliver = deliver
+
+    async def publish(self, user_id: int, event: dict) -> None:
+        self.published.append((user_id, event))
+
+        if self._deliver is not None:
+            self._deliver(user_id, event)
+
+
+class Subscription(object):
+    """One connection's pending events. None is queued when the hub drops it"""
+
+    def __init__(self, max_queue_size: int) -> None:
+        self.max_queue_size = max_queue_size
+        self.queue: asyncio.Queue[dict | None] = asyncio.Queue()
+        self.dropped = False
+
+    async def get(self) -> dict | None:
+        return await self.queue.get()
+
+
+class MessageHub(object):
+    """Pushes events to the WebSocket connections of a user id.
+
+    Each connection gets a bounded queue. A connection that falls more than
+    max_queue_size events behind is dropped instead of buffering without limit,
+    and the client is expected to reconnect and catch up over HTTP.
+    """
+
+    def __init__(
+        self,
+        backend: HubBackend | None = None,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+    ) -> None:
+        self.backend = backend or LocalHubBackend()
+        self.max_queue_size = max_queue_size
+        self._subscriptions: dict[int, set[Subscription]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # The loop only keeps weak references to tasks, these are the in-flight
+        # publishes, so they aren't garbage collected before they run
+        self._tasks: set[asyncio.Task] = set()
+
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self.deliver)
+
+    async def stop(self) -> None:
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.backend.stop()
+        self._loop = None
+
+    def connect(self, user_id: int) -> Subscription:
+        subscription = Subscription(self.max_queue_size)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+
+        return subscription
+
+    def disconnect(self, user_id: int, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(user_id)
+
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+
+            if not subscriptions:
+                del self._subscriptions[user_id]
+
+    def deliver(self, user_id: int, event: dict) -> None:
+        """Queues an event for this process's connections of user_id, runs on the loop"""
+        for subscription in list(self._subscriptions.get(user_id, ())):
+            if subscription.queue.qsize() >= subscription.max_queue_size:
+                subscription.dropped = True
+                subscription.queue.put_nowait(None)
+                self.disconnect(user_id, subscription)
+                self.dropped += 1
+                continue
+
+            subscription.queue.put_nowait(event)
+            self.delivered += 1
+
+    def publish(self, user_id: int, event: dict) -> None:
+        """Publishes through the backend, callable from any thread"""
+        if self._loop is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._publish, user_id, event)
+
+    def _publish(self, user_id: int, event: dict) -> None:
+        task = self._loop.create_task(self.backend.publish(user_id, event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "connections": sum(len(s) for s in self._subscriptions.values()),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+_message_hub: MessageHub | None = None
+
+
+def get_message_hub() -> MessageHub:
+    global _message_hub
+
+    if _message_hub is None:
+        _message_hub = MessageHub()
+
+    return _message_hub
+
+
+def queue_event(session: Session, user_id: int, event: dict) -> None:
+    """Publishes the event once the session commits, and never if it rolls back"""
+    session.info.setdefault("hub_events", []).append((user_id, event))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_queued_events(session: Session) -> None:
+    hub = get_message_hub()
+
+    for user_id, hub_event in session.info.pop("hub_events", ()):
+        hub.publish(user_id, hub_event)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_queued_events(session: Session) -> None:
+    session.info.pop("hub_events", None)
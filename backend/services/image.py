@@ -0,0 +1,223 @@
+import hashlib
+import io
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator
+
+from fastapi import HTTPException
+from PIL import Image, UnidentifiedImageError
+
+IMAGE_STORAGE_PATH = os.environ.get("IMAGE_STORAGE_PATH", "images")
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP"}
+ORIGINAL = "original"
+# Variant -> bounding box, every variant is WebP and never upscaled
+VARIANTS = {"thumb": (160, 160), "card": (480, 480), "full": (1600, 1600)}
+WEBP_QUALITY = 80
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def image_key(digest: str, variant: str = ORIGINAL) -> str:
+    return digest if variant == ORIGINAL else f"{digest}.{variant}.webp"
+
+
+class ImageStorage(ABC):
+    """Where image bytes live, addressed by key. Writes of an existing key are
+    skipped by callers, since the same key always holds the same bytes"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def write(self, key: str, data: bytes) -> None: ...
+
+    @abstractmethod
+    def size(self, key: str) -> int: ...
+
+    @abstractmethod
+    def read(self, key: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """Yields the bytes in [start, end) in chunks, end None meaning to the end"""
+
+
+class LocalImageStorage(ImageStorage):
+    """Files under root, fanned out by the first hex digits of the key"""
+
+    def __init__(self, root: str = IMAGE_STORAGE_PATH) -> None:
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        os.replace(tmp_path, path)
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._path(key))
+
+    def read(self, key: str, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as f:
+            f.seek(start)
+            remaining = (end if end is not None else self.size(key)) - start
+
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+
+                if not chunk:
+                    break
+
+                remaining -= len(chunk)
+                yield chunk
+
+
+def render_variants(storage: ImageStorage, digest: str) -> None:
+    """Writes every missing WebP variant of an original"""
+    missing = [v for v in VARIANTS if not storage.exists(image_key(digest, v))]
+
+    if not missing:
+        return
+
+    original = Image.open(io.BytesIO(b"".join(storage.read(image_key(digest)))))
+    original.load()
+
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+    for variant in missing:
+        image = original.copy()
+        image.thumbnail(VARIANTS[variant])
+
+        out = io.BytesIO()
+        image.save(out, "WEBP", quality=WEBP_QUALITY)
+        storage.write(image_key(digest, variant), out.getvalue())
+
+
+class ImageService(object):
+    """Stores uploads content-addressed by their SHA-256, so a re-upload costs
+    nothing, and renders their variants once in a background pool. Pillow drops
+    the GIL while decoding, resizing and encoding, so threads are enough"""
+
+    def __init__(
+        self, storage: ImageStorage | None = None, workers: int = IMAGE_WORKERS
+    ) -> None:
+        self.storage = LocalImageStorage() if storage is None else storage
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._rendering: dict[str, Future] = {}
+
+        self.uploaded = 0
+        self.deduplicated = 0
+        self.rendered = 0
+        self.render_failures = 0
+
+    def store(self, data: bytes) -> str:
+        """Validates and stores an upload, returns its digest"""
+        if len(data) > MAX_IMAGE_BYTES:
+            raise HTTPException(status_code=413, detail="Image too large")
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image_format = image.format
+                image.verify()
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise HTTPException(status_code=400, detail="Not an image")
+
+        if image_format not in ALLOWED_FORMATS:
+            raise HTTPException(status_code=400, detail="Unsupported image format")
+
+        digest = hashlib.sha256(data).hexdigest()
+
+        if self.storage.exists(image_key(digest)):
+            self.deduplicated += 1
+        else:
+            self.storage.write(image_key(digest), data)
+            self.uploaded += 1
+
+        self.render(digest)
+
+        return digest
+
+    def render(self, digest: str) -> Future:
+        """Queues variant rendering, once per digest however often it's asked for"""
+        future = self._rendering.get(digest)
+
+        if future is None:
+            future = self._executor.submit(render_variants, self.storage, digest)
+            self._rendering[digest] = future
+            future.add_done_callback(lambda f: self._rendered(digest, f))
+
+        return future
+
+    def _rendered(self, digest: str, future: Future) -> None:
+        self._rendering.pop(digest, None)
+
+        if future.exception() is None:
+            self.rendered += 1
+        else:
+            self.render_failures += 1
+
+    def resolve(self, digest: str, variant: str) -> str:
+        """Key to serve for a variant. Until it's rendered the original is served,
+        and rendering is queued again in case it failed"""
+        if not self.storage.exists(image_key(digest)):
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        key = image_key(digest, variant)
+
+        if variant != ORIGINAL and not self.storage.exists(key):
+            self.render(digest)
+            return image_key(digest)
+
+        return key
+
+    def content_type(self, key: str) -> str:
+        if key.endswith(".webp"):
+            return "image/webp"
+
+        head = b"".join(self.storage.read(key, 0, 12))
+
+        if head.startswith(b"\xff\xd8\xff"):
+            return "image/jpeg"
+
+        if head.startswith(b"\x89PNG"):
+            return "image/png"
+
+        return "image/webp"
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "uploaded": self.uploaded,
+            "deduplicated": self.deduplicated,
+            "rendering": len(self._rendering),
+            "rendered": self.rendered,
+            "render_failures": self.render_failures,
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
+
+
+_image_service: ImageService | None = None
+
+
+def get_image_service() -> ImageService:
+    global _image_service
+
+    if _image_service is None:
+        _image_service = ImageService()
+
+    return _image_service
@@ -0,0 +1,238 @@
+import math
+import os
+from datetime import date, datetime
+from typing import Callable
+
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.daily_match import (
+    CurrentMatchRunModel,
+    DailyMatchModel,
+    MatchRunModel,
+    MatchRunStatus,
+)
+
+from .aio import AsyncService
+from .cache import LRUCache
+from .compatibility import score_one_to_many
+from .profile_changes import consume_changes
+from .survey import SurveyService
+
+SCORE_CACHE_SIZE = int(os.environ.get("SCORE_CACHE_SIZE", "100000"))
+DEFAULT_MATCH_PAGE_SIZE = 10
+MAX_MATCH_PAGE_SIZE = 50
+CURRENT_RUN_ID = 1
+
+# (lower id, higher id, lower id's vector version, higher id's vector version) -> score.
+# Re-encoding a vector bumps its version, so stale entries are never read again and
+# age out of the LRU
+_score_cache = LRUCache(maxsize=SCORE_CACHE_SIZE)
+
+
+def _or_none(score: float) -> float | None:
+    """Cached and computed scores are NaN for pairs with no answers in common"""
+    return None if math.isnan(score) else score
+
+
+def _score_key(user_id: int, other_id: int, versions: dict[int, int]) -> tuple:
+    low, high = sorted((user_id, other_id))
+
+    return low, high, versions[low], versions[high]
+
+
+class MatchService(object):
+    def __init__(self, session: Session, cache: LRUCache | None = None) -> None:
+        self.session = session
+        self.survey_svc = SurveyService(session)
+        self.cache = _score_cache if cache is None else cache
+
+    def get_score(self, user_id: int, other_id: int) -> float | None:
+        """Compatibility of two users, None unless both submitted the survey"""
+        return self.get_scores(user_id, [other_id])[other_id]
+
+    def get_scores(self, user_id: int, other_ids: list[int]) -> dict[int, float | None]:
+        """Compatibility of user_id with each of other_ids, scored with the daily match
+        cron's code. Cached pairs cost one versions query, misses one more to load vectors.
+        None unless both submitted the survey and answered a question in common"""
+        versions = self.survey_svc.get_vector_versions([user_id, *other_ids])
+        scores: dict[int, float | None] = {other_id: None for other_id in other_ids}
+
+        if user_id not in versions:
+            return scores
+
+        misses = []
+
+        for other_id in other_ids:
+            if other_id not in versions or other_id == user_id:
+                continue
+
+            score = self.cache.get(_score_key(user_id, other_id, versions))
+
+            if score is None:
+                misses.append(other_id)
+            else:
+                scores[other_id] = _or_none(score)
+
+        if misses:
+            user_ids = np.unique([user_id, *misses])
+            answers = self.survey_svc.get_answer_matrix(user_ids)
+            cols = np.searchsorted(user_ids, misses)
+            computed = score_one_to_many(answers, int(np.searchsorted(user_ids, user_id)), cols)
+
+            for other_id, score in zip(misses, computed.tolist()):
+                self.cache.set(_score_key(user_id, other_id, versions), score)
+                scores[other_id] = _or_none(score)
+
+        return scores
+
+    def get_todays_matches(
+        self, user_id: int, after_rank: int = 0, limit: int = DEFAULT_MATCH_PAGE_SIZE
+    ) -> dict:
+        """A page of user_id's matches from the current run, as written by the match
+        cron. One range read of the daily_matches primary key, resuming after_rank"""
+        limit = min(limit, MAX_MATCH_PAGE_SIZE)
+        q = (
+            select(
+                MatchRunModel.match_date,
+                DailyMatchModel.rank,
+                DailyMatchModel.match_user_id,
+                DailyMatchModel.score,
+            )
+            .select_from(CurrentMatchRunModel)
+            .join(MatchRunModel, MatchRunModel.id == CurrentMatchRunModel.run_id)
+            .join(DailyMatchModel, DailyMatchModel.run_id == CurrentMatchRunModel.run_id)
+            .where(
+                CurrentMatchRunModel.id == CURRENT_RUN_ID,
+                DailyMatchModel.user_id == user_id,
+                DailyMatchModel.rank > after_rank,
+            )
+            .order_by(DailyMatchModel.rank)
+            .limit(limit)
+        )
+        rows = self.session.execute(q).all()
+
+        return {
+            "match_date": rows[0].match_date if rows else None,
+            "matches": [
+                {"rank": row.rank, "match_user_id": row.match_user_id, "score": row.score}
+                for row in rows
+            ],
+            "next_cursor": rows[-1].rank if len(rows) == limit else None,
+        }
+
+
+class MatchRunWriter(object):
+    """Writes one run of the match cron, each batch of matches in its own
+    transaction. Nothing is served from the run until publish swaps the current
+    run pointer over to it, so readers see either the previous run or all of
+    this one, never part of it. change_ids are the profile changes read before
+    the run's features were loaded, consumed once it's published"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        match_date: date,
+        top_k: int,
+        change_ids: list[int] | None = None,
+    ) -> None:
+        self.session_factory = session_factory
+        self.match_date = match_date
+        self.top_k = top_k
+        self.change_ids = [] if change_ids is None else list(change_ids)
+        self.run_id: int | None = None
+        self.num_matches = 0
+
+    def start(self) -> int:
+        with self.session_factory() as session:
+            run = MatchRunModel(match_date=self.match_date, top_k=self.top_k)
+            session.add(run)
+            session.commit()
+            self.run_id = run.id
+
+        return self.run_id
+
+    def write(
+        self,
+        user_ids: np.ndarray,
+        match_user_ids: np.ndarray,
+        ranks: np.ndarray,
+        scores: np.ndarray,
+    ) -> None:
+        """Bulk inserts a batch of matches, as parallel arrays, in one transaction"""
+        if len(user_ids) == 0:
+            return
+
+        rows = [
+            {
+                "user_id": user_id,
+                "run_id": self.run_id,
+                "rank": rank,
+                "match_user_id": match_user_id,
+                "score": score,
+            }
+            for user_id, match_user_id, rank, score in zip(
+                user_ids.tolist(), match_user_ids.tolist(), ranks.tolist(), scores.tolist()
+            )
+        ]
+
+        with self.session_factory() as session:
+            session.execute(insert(DailyMatchModel), rows)
+            session.commit()
+
+        self.num_matches += len(rows)
+
+    def publish(self) -> int:
+        """Marks the run complete and makes it current in one transaction, then
+        deletes the matches of older runs and the profile changes the run
+        reflects. Returns how many matches were deleted.
+
+        Runs are ordered by id, so a run started later that's still being
+        written is left alone, and one that already published stays current
+        over this one.
+        """
+        with self.session_factory() as session:
+            session.execute(
+                update(MatchRunModel)
+                .where(MatchRunModel.id == self.run_id)
+                .values(
+                    status=MatchRunStatus.COMPLETE,
+                    num_matches=self.num_matches,
+                    finished_at=datetime.utcnow(),
+                )
+            )
+            swapped = session.execute(
+                update(CurrentMatchRunModel)
+                .where(
+                    CurrentMatchRunModel.id == CURRENT_RUN_ID,
+                    CurrentMatchRunModel.run_id < self.run_id,
+                )
+                .values(run_id=self.run_id)
+            ).rowcount
+
+            if not swapped and session.get(CurrentMatchRunModel, CURRENT_RUN_ID) is None:
+                session.execute(
+                    insert(CurrentMatchRunModel).values(id=CURRENT_RUN_ID, run_id=self.run_id)
+                )
+
+            session.commit()
+            current_run_id = session.scalar(
+                select(CurrentMatchRunModel.run_id).where(
+                    CurrentMatchRunModel.id == CURRENT_RUN_ID
+                )
+            )
+
+            # Each read is a single statement, so one that started before the swap
+            # has already got its snapshot of the old run
+            deleted = session.execute(
+                delete(DailyMatchModel).where(DailyMatchModel.run_id < current_run_id)
+            ).rowcount
+            consume_changes(session, self.change_ids)
+            session.commit()
+
+        return deleted
+
+
+class AsyncMatchService(AsyncService):
+    service_class = MatchService
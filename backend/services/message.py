@@ -1,24 +1,243 @@
+import base64
+import os
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, literal, select, tuple_, update
 from sqlalchemy.orm import Session
 
+from db import dialect_insert
+from models.message import ConversationModel, MessageModel, UnreadCounterModel
+
+from .aio import AsyncService
+from .cache import LRUCache, invalidate_on_commit
+from .hub import queue_event
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Seconds another worker's writes may take to show up in this worker's counts, 0 disables caching
+UNREAD_CACHE_TTL = float(os.environ.get("UNREAD_CACHE_TTL", "2"))
+
+_unread_cache = LRUCache(maxsize=100_000, ttl=UNREAD_CACHE_TTL)
+
+MESSAGE_EVENT_COLUMNS = (
+    MessageModel.id,
+    MessageModel.conversation_id,
+    MessageModel.sender_id,
+    MessageModel.recipient_id,
+    MessageModel.body,
+    MessageModel.created_at,
+)
+
+
+def _encode_cursor(message: MessageModel) -> str:
+    return base64.urlsafe_b64encode(
+        f"{message.created_at.isoformat()}|{message.id}".encode()
+    ).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor).decode().split("|")
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 
 class MessageService(object):
     def __init__(self, session: Session):
-        self.sesssion = session
+        self.session = session
+
+    def _page(self, q, cursor: str | None, limit: int) -> dict:
+        """Newest first, resuming strictly after the cursor's (created_at, id) so
+        every page is a single index range scan no matter how deep it is"""
+        limit = min(limit, MAX_PAGE_SIZE)
+
+        if cursor is not None:
+            q = q.where(
+                tuple_(MessageModel.created_at, MessageModel.id) < _decode_cursor(cursor)
+            )
+
+        q = q.order_by(MessageModel.created_at.desc(), MessageModel.id.desc()).limit(
+            limit
+        )
+        messages = self.session.execute(q).scalars().all()
+
+        return {
+            "messages": messages,
+            "next_cursor": _encode_cursor(messages[-1])
+            if len(messages) == limit
+            else None,
+        }
+
+    def _adjust_unread(self, user_id: int, delta: int) -> None:
+        """Applies delta to user_id's unread counter in the caller's transaction,
+        and pushes the new count to the user's connections once it commits.
+
+        A single upsert, so two first messages to the same user can't both miss
+        the row and both insert it.
+        """
+        stmt = (
+            dialect_insert(self.session, UnreadCounterModel)
+            .values(user_id=user_id, unread_count=max(delta, 0))
+            .on_conflict_do_update(
+                index_elements=[UnreadCounterModel.user_id],
+                set_={"unread_count": UnreadCounterModel.unread_count + delta},
+            )
+            .returning(UnreadCounterModel.unread_count)
+        )
+        count = self.session.execute(stmt).scalar_one()
+
+        invalidate_on_commit(self.session, _unread_cache, user_id)
+        queue_event(self.session, user_id, {"type": "unread_count", "count": count})
+
+    def _queue_message_event(self, message) -> None:
+        queue_event(
+            self.session,
+            message.recipient_id,
+            {
+                "type": "message",
+                "id": message.id,
+                "conversation_id": message.conversation_id,
+                "sender_id": message.sender_id,
+                "body": message.body,
+                "created_at": message.created_at.isoformat(),
+            },
+        )
+
+    def get_num_of_unread_messages(self, user_id: int) -> int:
+        if UNREAD_CACHE_TTL > 0:
+            count = _unread_cache.get(user_id)
+
+            if count is not None:
+                return count
+
+        q = select(UnreadCounterModel.unread_count).where(
+            UnreadCounterModel.user_id == user_id
+        )
+        count = self.session.execute(q).scalar_one_or_none() or 0
+
+        if UNREAD_CACHE_TTL > 0:
+            _unread_cache.set(user_id, count)
+
+        return count
+
+    def get_messages(
+        self, user_id: int, cursor: str | None = None, limit: int = DEFAULT_PAGE_SIZE
+    ) -> dict:
+        """A page of the given user_id's inbox"""
+        q = select(MessageModel).where(MessageModel.recipient_id == user_id)
+
+        return self._page(q, cursor, limit)
+
+    def get_conversation_messages(
+        self,
+        user_id: int,
+        conversation_id: int,
+        cursor: str | None = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+    ) -> dict:
+        """A page of one conversation the given user_id takes part in"""
+        conversation = self.session.get(ConversationModel, conversation_id)
+
+        if conversation is None or user_id not in (
+            conversation.user_a_id,
+            conversation.user_b_id,
+        ):
+            raise HTTPException(status_code=404, detail="Conversation not found")
+
+        q = select(MessageModel).where(MessageModel.conversation_id == conversation_id)
+
+        return self._page(q, cursor, limit)
+
+    def _get_or_create_conversation_id(self, user_id: int, other_user_id: int) -> int:
+        user_a_id, user_b_id = sorted((user_id, other_user_id))
+        q = select(ConversationModel.id).where(
+            ConversationModel.user_a_id == user_a_id,
+            ConversationModel.user_b_id == user_b_id,
+        )
+        conversation_id = self.session.execute(q).scalar_one_or_none()
+
+        if conversation_id is None:
+            conversation = ConversationModel(user_a_id=user_a_id, user_b_id=user_b_id)
+            self.session.add(conversation)
+            self.session.flush()
+            conversation_id = conversation.id
+
+        return conversation_id
+
+    def send_message(self, from_user_id: int, to_user_id: int, body: str) -> int:
+        conversation_id = self._get_or_create_conversation_id(from_user_id, to_user_id)
+
+        stmt = (
+            insert(MessageModel)
+            .values(
+                conversation_id=conversation_id,
+                sender_id=from_user_id,
+                recipient_id=to_user_id,
+                body=body,
+                created_at=datetime.utcnow(),
+            )
+            .returning(*MESSAGE_EVENT_COLUMNS)
+        )
+
+        message = self.session.execute(stmt).one()
+        self._queue_message_event(message)
+        self._adjust_unread(to_user_id, 1)
+
+        return message.id
+
+    def mark_message_as_seen(self, user_id: int, message_id: int) -> None:
+        stmt = (
+            update(MessageModel)
+            .values(seen_at=datetime.utcnow())
+            .where(
+                MessageModel.id == message_id,
+                MessageModel.recipient_id == user_id,
+                MessageModel.seen_at.is_(None),
+            )
+        )
+
+        if self.session.execute(stmt).rowcount == 1:
+            self._adjust_unread(user_id, -1)
+
+    def delete_message_(self, user_id: int, message_id: int) -> None:
+        stmt = (
+            delete(MessageModel)
+            .where(MessageModel.id == message_id, MessageModel.recipient_id == user_id)
+            .returning(MessageModel.seen_at)
+        )
+        deleted = self.session.execute(stmt).one_or_none()
+
+        if deleted is not None and deleted.seen_at is None:
+            self._adjust_unread(user_id, -1)
 
-    def get_num_of_unread_messages(self, user_id: int):
-        pass
+    def reply(self, user_id: int, message_id: int, body: str) -> None:
+        """Replies to a message the given user_id received, in one INSERT ... SELECT"""
+        original = select(
+            MessageModel.conversation_id,
+            literal(user_id),
+            MessageModel.sender_id,
+            literal(body),
+            literal(datetime.utcnow()),
+        ).where(MessageModel.id == message_id, MessageModel.recipient_id == user_id)
 
-    def get_messages(self, user_id: int):
-        pass
+        stmt = (
+            insert(MessageModel)
+            .from_select(
+                ["conversation_id", "sender_id", "recipient_id", "body", "created_at"],
+                original,
+            )
+            .returning(*MESSAGE_EVENT_COLUMNS)
+        )
+        message = self.session.execute(stmt).one_or_none()
 
-    def send_message(self, from_user_id: int, to_user_id: int):
-        pass
+        if message is None:
+            raise HTTPException(status_code=404, detail="Message not found")
 
-    def mark_message_as_seen(self, user_id: int, message_id: int):
-        pass
+        self._queue_message_event(message)
+        self._adjust_unread(message.recipient_id, 1)
 
-    def delete_message_(self, user_id: int, message_id: int):
-        pass
 
-    def reply(self, user_id: int, message_id: int):
-        pass
+class AsyncMessageService(AsyncService):
+    service_class = MessageService
@@ -0,0 +1,211 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# 0 leaves the profiler off
+PROFILE_SLOW_REQUEST_SECONDS = float(os.environ.get("PROFILE_SLOW_REQUEST_SECONDS", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+
+class Histogram(object):
+    """Cumulative buckets, as Prometheus expects them"""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total, result = 0, []
+
+        for bound, count in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class QueryStats(object):
+    """Queries run on behalf of the current request"""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set by the middleware for each request, the stats object is shared with the
+# threadpool and the greenlets that run sync queries, which copy the context
+current_query_stats: ContextVar[QueryStats | None] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = current_query_stats.get()
+
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+
+
+def _label_values(labels: dict[str, str]) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+class RequestMetrics(object):
+    """Per-route latency and query histograms, rendered in the Prometheus text format"""
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.latency: dict[tuple[str, str, str], Histogram] = {}
+        self.queries: dict[tuple[str, str], Histogram] = {}
+        self.query_seconds: Counter[tuple[str, str]] = Counter()
+        self._stats: dict[str, Callable[[], dict]] = {}
+
+    def observe(
+        self, method: str, route: str, status: int, seconds: float, query_stats: QueryStats
+    ) -> None:
+        key = (method, route, str(status))
+        self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+        self.queries.setdefault((method, route), Histogram(QUERY_COUNT_BUCKETS)).observe(
+            query_stats.count
+        )
+        self.query_seconds[method, route] += query_stats.seconds
+
+    def register_stats(self, name: str, stats: Callable[[], dict]) -> None:
+        """Exports every number of a service's stats() as a pair_<name>_<key> gauge"""
+        self._stats[name] = stats
+
+    def _histogram(self, lines: list[str], name: str, labels: dict, histogram: Histogram) -> None:
+        for bound, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{{{_label_values({**labels, 'le': bound})}}} {count}")
+
+        lines.append(f"{name}_sum{{{_label_values(labels)}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{_label_values(labels)}}} {histogram.count}")
+
+    def render(self) -> str:
+        lines = [
+            "# HELP pair_http_requests_in_flight Requests being handled",
+            "# TYPE pair_http_requests_in_flight gauge",
+            f"pair_http_requests_in_flight {self.in_flight}",
+            "# HELP pair_http_request_duration_seconds Request latency by route",
+            "# TYPE pair_http_request_duration_seconds histogram",
+        ]
+
+        for (method, route, status), histogram in sorted(self.latency.items()):
+            labels = {"method": method, "route": route, "status": status}
+            self._histogram(lines, "pair_http_request_duration_seconds", labels, histogram)
+
+        lines += [
+            "# HELP pair_http_request_db_queries Database queries per request by route",
+            "# TYPE pair_http_request_db_queries histogram",
+        ]
+
+        for (method, route), histogram in sorted(self.queries.items()):
+            labels = {"method": method, "route": route}
+            self._histogram(lines, "pair_http_request_db_queries", labels, histogram)
+
+        lines += [
+            "# HELP pair_http_request_db_seconds_total Time spent in database queries by route",
+            "# TYPE pair_http_request_db_seconds_total counter",
+        ]
+        lines += [
+            f"pair_http_request_db_seconds_total{{{_label_values({'method': m, 'route': r})}}} {s}"
+            for (m, r), s in sorted(self.query_seconds.items())
+        ]
+
+        for name, stats in sorted(self._stats.items()):
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE pair_{name}_{key} gauge")
+                    lines.append(f"pair_{name}_{key} {float(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler(object):
+    """Samples the stack of every thread each interval while running.
+
+    Requests interleave on the event loop, so a slow request's dump holds every
+    sample taken while it ran, not only its own frames. Stacks are written in
+    the collapsed format flamegraph.pl and speedscope read.
+    """
+
+    def __init__(
+        self, interval: float = PROFILE_INTERVAL_SECONDS, max_samples: int = 200_000
+    ) -> None:
+        self.interval = interval
+        self._samples: deque[tuple[float, str]] = deque(maxlen=max_samples)
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != me:
+                    self._samples.append((now, _collapse(frame)))
+
+    def dump(self, path: str, started: float, finished: float) -> int:
+        """Writes the samples taken between started and finished, returns how many"""
+        stacks = Counter(stack for at, stack in list(self._samples) if started <= at <= finished)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        return sum(stacks.values())
+
+
+def _collapse(frame) -> str:
+    names = []
+
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
@@ -0,0 +1,386 @@
+import os
+import smtplib
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Callable
+
+from sqlalchemy import bindparam, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from models.email_outbox import EmailOutboxModel, EmailStatus
+from models.user import UserModel
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "25"))
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "0") == "1"
+SMTP_TIMEOUT_SECONDS = float(os.environ.get("SMTP_TIMEOUT_SECONDS", "10"))
+EMAIL_FROM = os.environ.get("EMAIL_FROM", "Pair <no-reply@pair.local>")
+
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", "100"))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_BACKOFF_SECONDS = float(os.environ.get("EMAIL_BACKOFF_SECONDS", "30"))
+EMAIL_MAX_BACKOFF_SECONDS = float(os.environ.get("EMAIL_MAX_BACKOFF_SECONDS", "3600"))
+# How long a sender holds the emails it claimed before another may retry them
+EMAIL_LEASE_SECONDS = float(os.environ.get("EMAIL_LEASE_SECONDS", "300"))
+ENQUEUE_BATCH_SIZE = 1000
+
+MATCH_NOTIFICATION_SUBJECT = "Your new matches are in"
+MATCH_NOTIFICATION_BODY = "Today's matches are ready, open Pair to meet them."
+
+
+def email_update_verification(email: str) -> dict:
+    return {
+        "kind": "email_update_verification",
+        "recipient": email,
+        "subject": "Confirm your new email address",
+        "body": "Confirm this is your new email address for Pair to finish the change.",
+    }
+
+
+def registration_confirmation(email: str) -> dict:
+    return {
+        "kind": "registration_confirmation",
+        "recipient": email,
+        "subject": "Welcome to Pair",
+        "body": "Confirm your email address to finish signing up to Pair.",
+    }
+
+
+class EmailOutbox(object):
+    """Emails are written to the outbox in the caller's transaction, so they're
+    sent only if it commits, and without a network round-trip in the request.
+    EmailSender delivers them from another process"""
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def enqueue(self, email: dict) -> None:
+        self.session.add(EmailOutboxModel(**email))
+
+    def enqueue_many(self, emails: list[dict]) -> None:
+        if emails:
+            self.session.execute(insert(EmailOutboxModel), emails)
+
+    def enqueue_for_users(self, user_ids: list[int], kind: str, subject: str, body: str) -> int:
+        """Queues the same email to every active user of user_ids, their addresses
+        read by the insert itself. Returns how many were queued"""
+        queued = 0
+        now = datetime.utcnow()
+
+        for start in range(0, len(user_ids), ENQUEUE_BATCH_SIZE):
+            rows = select(
+                literal(kind),
+                UserModel.email,
+                literal(subject),
+                literal(body),
+                literal(EmailStatus.PENDING.name),
+                literal(now),
+                literal(0),
+                literal(now),
+            ).where(
+                UserModel.id.in_(user_ids[start : start + ENQUEUE_BATCH_SIZE]),
+                UserModel.is_active.is_(True),
+            )
+            stmt = insert(EmailOutboxModel).from_select(
+                [
+                    "kind",
+                    "recipient",
+                    "subject",
+                    "body",
+                    "status",
+                    "send_after",
+                    "attempts",
+                    "created_at",
+                ],
+                rows,
+            )
+            queued += self.session.execute(stmt).rowcount
+
+        return queued
+
+
+class EmailTransport(ABC):
+    """Where EmailSender hands messages to. A connection opened for one batch
+    may be kept for the next"""
+
+    def open(self) -> None:
+        pass
+
+    @abstractmethod
+    def send(self, message: EmailMessage) -> None: ...
+
+    def close(self) -> None:
+        pass
+
+
+class SMTPTransport(EmailTransport):
+    """One SMTP connection reused across every message and batch, reconnected
+    when the server drops it"""
+
+    def __init__(
+        self,
+        host: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        username: str | None = SMTP_USERNAME,
+        password: str | None = SMTP_PASSWORD,
+        starttls: bool = SMTP_STARTTLS,
+        timeout: float = SMTP_TIMEOUT_SECONDS,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._smtp: smtplib.SMTP | None = None
+
+    def open(self) -> None:
+        """Checks a kept connection is still alive, once per batch, or connects"""
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+                return
+            except smtplib.SMTPException:
+                self._smtp = None
+
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        if self.starttls:
+            smtp.starttls()
+
+        if self.username:
+            smtp.login(self.username, self.password or "")
+
+        self._smtp = smtp
+
+    def send(self, message: EmailMessage) -> None:
+        if self._smtp is None:
+            self.open()
+
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = None
+            raise
+
+    def close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+
+            self._smtp = None
+
+
+class LocalEmailTransport(EmailTransport):
+    """Stand-in for an SMTP server in tests and local runs, records what was
+    sent. fail_next makes that many sends fail as a dropped connection would,
+    failing_recipients are refused as a server would refuse a bad address"""
+
+    def __init__(self) -> None:
+        self.sent: list[EmailMessage] = []
+        self.fail_next = 0
+        self.failing_recipients: set[str] = set()
+        self.connections = 0
+
+    def open(self) -> None:
+        self.connections += 1
+
+    def send(self, message: EmailMessage) -> None:
+        if message["To"] in self.failing_recipients:
+            raise smtplib.SMTPRecipientsRefused({message["To"]: (550, b"No such user")})
+
+        if self.fail_next > 0:
+            self.fail_next -= 1
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+        self.sent.append(message)
+
+
+def _is_permanent(error: Exception) -> bool:
+    """5xx replies mean retrying the same email won't help"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class EmailSender(object):
+    """Delivers the outbox a batch at a time over one transport connection.
+
+    A batch is claimed by pushing its send_after past a lease, so senders in
+    several processes never pick the same email up, and one that dies holding
+    a batch only delays it. Failed sends are retried with exponential backoff
+    until max_attempts, or given up on straight away if the server refused them.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        transport: EmailTransport,
+        batch_size: int = EMAIL_BATCH_SIZE,
+        max_attempts: int = EMAIL_MAX_ATTEMPTS,
+        backoff_seconds: float = EMAIL_BACKOFF_SECONDS,
+        max_backoff_seconds: float = EMAIL_MAX_BACKOFF_SECONDS,
+        lease_seconds: float = EMAIL_LEASE_SECONDS,
+        sender: str = EMAIL_FROM,
+    ) -> None:
+        self.session_factory = session_factory
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.sender = sender
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _claim(self, session: Session, now: datetime) -> list:
+        due = (
+            (EmailOutboxModel.status == EmailStatus.PENDING)
+            & (EmailOutboxModel.send_after <= now)
+        )
+        q = (
+            select(EmailOutboxModel.id)
+            .where(due)
+            .order_by(EmailOutboxModel.send_after, EmailOutboxModel.id)
+            .limit(self.batch_size)
+        )
+        ids = session.scalars(q).all()
+
+        if not ids:
+            return []
+
+        # Re-checking due makes the claim atomic, rows another sender got first are skipped
+        stmt = (
+            update(EmailOutboxModel)
+            .where(EmailOutboxModel.id.in_(ids), due)
+            .values(send_after=now + timedelta(seconds=self.lease_seconds))
+            .returning(
+                EmailOutboxModel.id,
+                EmailOutboxModel.recipient,
+                EmailOutboxModel.subject,
+                EmailOutboxModel.body,
+                EmailOutboxModel.attempts,
+            )
+        )
+        claimed = session.execute(stmt).all()
+        session.commit()
+
+        return claimed
+
+    def _message(self, email) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = email.recipient
+        message["Subject"] = email.subject
+        message.set_content(email.body)
+
+        return message
+
+    def _backoff(self, attempts: int) -> timedelta:
+        return timedelta(
+            seconds=min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+        )
+
+    def send_batch(self) -> int:
+        """Sends one batch of due emails, returns how many were claimed"""
+        with self.session_factory() as session:
+            claimed = self._claim(session, datetime.utcnow())
+
+            if not claimed:
+                return 0
+
+            sent, failures = [], []
+
+            try:
+                self.transport.open()
+            except (smtplib.SMTPException, OSError) as e:
+                failures = [(email, e) for email in claimed]
+            else:
+                for email in claimed:
+                    try:
+                        self.transport.send(self._message(email))
+                        sent.append(email.id)
+                    except (smtplib.SMTPException, OSError) as e:
+                        failures.append((email, e))
+
+            now = datetime.utcnow()
+
+            if sent:
+                session.execute(
+                    update(EmailOutboxModel)
+                    .where(EmailOutboxModel.id.in_(sent))
+                    .values(
+                        status=EmailStatus.SENT,
+                        sent_at=now,
+                        attempts=EmailOutboxModel.attempts + 1,
+                    )
+                )
+
+            if failures:
+                rows = []
+
+                for email, error in failures:
+                    attempts = email.attempts + 1
+                    given_up = attempts >= self.max_attempts or _is_permanent(error)
+                    rows.append(
+                        {
+                            "b_id": email.id,
+                            "b_status": EmailStatus.FAILED if given_up else EmailStatus.PENDING,
+                            "b_send_after": now + self._backoff(attempts),
+                            "b_attempts": attempts,
+                            "b_last_error": str(error)[:500],
+                        }
+                    )
+                    self.failed += given_up
+                    self.retried += not given_up
+
+                outbox = EmailOutboxModel.__table__
+                session.execute(
+                    update(outbox)
+                    .where(outbox.c.id == bindparam("b_id"))
+                    .values(
+                        status=bindparam("b_status"),
+                        send_after=bindparam("b_send_after"),
+                        attempts=bindparam("b_attempts"),
+                        last_error=bindparam("b_last_error"),
+                    ),
+                    rows,
+                )
+
+            session.commit()
+
+        self.sent += len(sent)
+        self.batches += 1
+
+        return len(claimed)
+
+    def run(self, interval: float, stopped: threading.Event | None = None) -> None:
+        """Sends batches back to back while there is a backlog, and polls every
+        interval seconds once it's drained"""
+        stopped = threading.Event() if stopped is None else stopped
+
+        try:
+            while not stopped.is_set():
+                if self.send_batch() < self.batch_size:
+                    stopped.wait(interval)
+        finally:
+            self.transport.close()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from models.profile_change import ProfileChangeKind, ProfileChangeModel
+
+CONSUME_BATCH_SIZE = 10_000
+
+
+def record_changes(session: Session, user_ids, kind: ProfileChangeKind) -> None:
+    """Logs a change to each of user_ids in the caller's transaction, as one executemany"""
+    changed_at = datetime.utcnow()
+    rows = [
+        {"user_id": int(user_id), "kind": kind, "changed_at": changed_at} for user_id in user_ids
+    ]
+
+    if rows:
+        session.execute(insert(ProfileChangeModel), rows)
+
+
+def pending_changes(session: Session) -> tuple[list[int], list[int]]:
+    """The ids of every change no published run has consumed yet, and the
+    distinct users they're about.
+
+    There's no id watermark: ids are handed out at insert but become visible
+    at commit, so a change can show up below one already read. Whatever a run
+    hasn't read is simply still in the table for the next one.
+    """
+    rows = session.execute(select(ProfileChangeModel.id, ProfileChangeModel.user_id)).all()
+
+    return [row.id for row in rows], sorted({row.user_id for row in rows})
+
+
+def consume_changes(session: Session, change_ids: list[int]) -> int:
+    """Deletes the changes a run read, once it's published. Returns how many"""
+    consumed = 0
+
+    for start in range(0, len(change_ids), CONSUME_BATCH_SIZE):
+        consumed += session.execute(
+            delete(ProfileChangeModel).where(
+                ProfileChangeModel.id.in_(change_ids[start : start + CONSUME_BATCH_SIZE])
+            )
+        ).rowcount
+
+    return consumed
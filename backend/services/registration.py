@@ -1,34 +1,39 @@
 from fastapi import HTTPException
 from models.user import UserModel
-from passlib.context import CryptContext
+from schema.registration import RegistrationSchema
+from services.aio import AsyncService
+from services.hashing import HashingPool, get_hashing_pool
+from services.outbox import registration_confirmation
 from services.user import UserService
 from sqlalchemy import exists, select
 from sqlalchemy.orm import Session
 
-from backend.schema.registration import RegistrationSchema
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 def _passwords_match(password1, password2) -> bool:
     return password1 == password2
 
 
-def _hash_password(self, password: str) -> str:
-    return pwd_context.hash(password)
-
-
 class RegisterationService(object):
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, hashing_pool: HashingPool | None = None):
         self.session = session
         self.user_svc = UserService(session)
+        self.hashing_pool = hashing_pool or get_hashing_pool()
 
     def _user_already_exists(self, email: str) -> bool:
         q = select(exists().where(UserModel.email == email))
 
         return self.session.execute(q).scalar()
 
-    def sign_up(self, user_info: RegistrationSchema):
+    async def sign_up(self, user_info: RegistrationSchema):
+        self.check_sign_up(user_info)
+
+        hashed_password = await self.hashing_pool.hash(user_info.password2)
+
+        self.user_svc.create_user(user_info.email, hashed_password)
+        self.user_svc.outbox.enqueue(registration_confirmation(user_info.email))
+
+    def check_sign_up(self, user_info: RegistrationSchema) -> None:
+        """Rejects the sign up before its password is hashed"""
         if not _passwords_match(user_info.password1, user_info.password2):
             raise HTTPException(status_code=400, detail="Passwords do not match")
 
@@ -38,4 +43,16 @@ class RegisterationService(object):
                 detail="An account with that email address already exists.",
             )
 
-        self.user_svc.create_user(user_info.email, _hash_password(user_info.password2))
+
+class AsyncRegisterationService(AsyncService):
+    service_class = RegisterationService
+
+    async def sign_up(self, user_info: RegistrationSchema):
+        await self.run(self.service.check_sign_up, user_info)
+
+        hashed_password = await self.service.hashing_pool.hash(user_info.password2)
+
+        await self.run(self.service.user_svc.create_user, user_info.email, hashed_password)
+        await self.run(
+            self.service.user_svc.outbox.enqueue, registration_confirmation(user_info.email)
+        )
@@ -0,0 +1,172 @@
+import hashlib
+import math
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.orm import Session
+
+from db import SessionLocal
+from models.revoked_token import RevokedTokenModel
+
+TOKEN_EXPIRATION_IN_MINUTES = int(os.environ.get("TOKEN_EXPIRATION_IN_MINUTES", "60"))
+REVOCATION_CAPACITY = int(os.environ.get("REVOCATION_CAPACITY", "100000"))
+# The longest a transaction revoking a token may stay open after its insert
+REVOCATION_COMMIT_LAG_SECONDS = float(os.environ.get("REVOCATION_COMMIT_LAG_SECONDS", "60"))
+
+
+class BloomFilter(object):
+    """Fixed-size set membership with no false negatives and a bounded false positive rate"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self.num_bits = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.num_hashes = max(round(self.num_bits / capacity * math.log(2)), 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RevocationStore(object):
+    """Revoked token ids, in the revoked_tokens table fronted by Bloom filters.
+
+    is_revoked only queries the table when the filter reports a hit, so the
+    common case of a valid token costs a few hashes. Filters can't forget, so
+    there are two generations that rotate every token lifetime: an entry then
+    lives between one and two lifetimes, always outlasting the token itself,
+    and the filters never fill past what one lifetime of logouts can add.
+    Revocations from other processes are picked up every refresh_seconds.
+
+    Refreshes follow the table by its autoincrement id rather than by anyone's
+    clock. Ids are handed out at insert but become visible at commit, so a low
+    id can show up after higher ones: each refresh re-reads from the highest id
+    seen commit_lag_seconds ago, which any revocation committing within that
+    lag is above. Expired rows are deleted by crons.revoked_tokens, not here.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        token_lifetime_seconds: float = TOKEN_EXPIRATION_IN_MINUTES * 60,
+        capacity: int = REVOCATION_CAPACITY,
+        error_rate: float = 0.001,
+        refresh_seconds: float = 5.0,
+        commit_lag_seconds: float = REVOCATION_COMMIT_LAG_SECONDS,
+    ) -> None:
+        self.session_factory = session_factory
+        self.token_lifetime_seconds = token_lifetime_seconds
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.commit_lag_seconds = commit_lag_seconds
+
+        self._filters = [BloomFilter(capacity, error_rate), BloomFilter(capacity, error_rate)]
+        self._rotated_at = time.monotonic()
+        self._refreshed_at = 0.0
+        # (monotonic time, highest id seen by then), oldest first
+        self._watermarks: deque[tuple[float, int]] = deque()
+
+        self.lookups = 0
+        self.filter_hits = 0
+
+    def _maybe_rotate(self) -> None:
+        if time.monotonic() - self._rotated_at < self.token_lifetime_seconds:
+            return
+
+        self._filters = [BloomFilter(self.capacity, self.error_rate), self._filters[0]]
+        self._rotated_at = time.monotonic()
+
+    def _lower_bound(self, now: float) -> int:
+        """The highest id seen at least commit_lag_seconds ago, 0 before then"""
+        watermarks = self._watermarks
+
+        while len(watermarks) > 1 and now - watermarks[1][0] >= self.commit_lag_seconds:
+            watermarks.popleft()
+
+        if watermarks and now - watermarks[0][0] >= self.commit_lag_seconds:
+            return watermarks[0][1]
+
+        return 0
+
+    def refresh(self) -> None:
+        """Loads revocations made since the last refresh, by any process"""
+        now = time.monotonic()
+        highest = self._watermarks[-1][1] if self._watermarks else 0
+        q = select(RevokedTokenModel.id, RevokedTokenModel.jti).where(
+            RevokedTokenModel.id > self._lower_bound(now),
+            RevokedTokenModel.expires_at > datetime.utcnow(),
+        )
+
+        with self.session_factory() as session:
+            for revocation_id, jti in session.execute(q):
+                self._filters[0].add(jti)
+                highest = max(highest, revocation_id)
+
+        self._watermarks.append((now, highest))
+        self._refreshed_at = now
+
+    def revoke(self, session: Session, jti: str, expires_at: datetime) -> None:
+        """Adds the revocation to the caller's transaction"""
+        session.add(RevokedTokenModel(jti=jti, expires_at=expires_at))
+        self._filters[0].add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        self._maybe_rotate()
+
+        if time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+            self.refresh()
+
+        self.lookups += 1
+
+        if not any(jti in bloom for bloom in self._filters):
+            return False
+
+        self.filter_hits += 1
+        q = select(
+            exists().where(
+                RevokedTokenModel.jti == jti,
+                RevokedTokenModel.expires_at > datetime.utcnow(),
+            )
+        )
+
+        with self.session_factory() as session:
+            return session.execute(q).scalar()
+
+    def stats(self) -> dict[str, int]:
+        return {"lookups": self.lookups, "filter_hits": self.filter_hits}
+
+
+def delete_expired(session: Session) -> int:
+    """Deletes revocations of tokens that have expired anyway, returns how many"""
+    return session.execute(
+        delete(RevokedTokenModel).where(RevokedTokenModel.expires_at < datetime.utcnow())
+    ).rowcount
+
+
+_revocation_store: RevocationStore | None = None
+
+
+def get_revocation_store() -> RevocationStore:
+    global _revocation_store
+
+    if _revocation_store is None:
+        _revocation_store = RevocationStore(SessionLocal)
+
+    return _revocation_store
@@ -0,0 +1,377 @@
+import heapq
+import os
+import re
+from bisect import bisect_left, insort
+from itertools import islice
+
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models.user import UserModel
+
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+# Bounds the work of a short last word like "a", which would otherwise expand
+# to a large share of the vocabulary
+MAX_PREFIX_TERMS = 100
+LOAD_BATCH_SIZE = 10_000
+# Updates buffered in the delta segment before it's merged into the main one
+MERGE_THRESHOLD = int(os.environ.get("SEARCH_INDEX_MERGE_THRESHOLD", "1000"))
+# How often each process rebuilds its index from the database, 0 never
+SEARCH_INDEX_REBUILD_SECONDS = float(os.environ.get("SEARCH_INDEX_REBUILD_SECONDS", "300"))
+
+WORD_PATTERN = re.compile(r"\w+")
+# Sorts after every string starting with the prefix it's appended to
+_PREFIX_END = "\U0010ffff"
+_NO_POSTINGS = np.empty(0, dtype=np.int64)
+
+
+def tokenize(text: str | None) -> list[str]:
+    return WORD_PATTERN.findall(text.lower()) if text else []
+
+
+def _contains(postings: np.ndarray, user_ids: np.ndarray) -> np.ndarray:
+    """Which of user_ids are in the sorted postings, in O(len(user_ids) log len(postings))"""
+    found = np.searchsorted(postings, user_ids).clip(max=len(postings) - 1)
+
+    return postings[found] == user_ids
+
+
+def _prefixed(items: list, prefix: tuple | str, end: tuple | str) -> range:
+    """Positions of the sorted items from prefix up to end"""
+    start = bisect_left(items, prefix)
+
+    return range(start, bisect_left(items, end, lo=start))
+
+
+class SearchIndex(object):
+    """In-process inverted index over active profiles, for search by username
+    prefix and by the words of their about text.
+
+    Lowercased usernames are kept in a sorted list, so the usernames starting
+    with a query are one bisect away as a contiguous slice, already in the order
+    they're ranked in. Each about word maps to the sorted array of the users
+    using it, so pages of a common word are sliced off its array rather than
+    gathered from every match, and the words themselves are kept sorted so the
+    last word of a query is matched as a prefix, as the user types it.
+
+    Those sorted structures are the main segment, which edits don't touch:
+    added profiles go to a small delta segment, and removed ones are marked dead
+    in the main segment, both read alongside it. Every MERGE_THRESHOLD updates
+    they're merged in, in one pass, rather than paying to shift the sorted
+    arrays on every edit.
+
+    Only active users are indexed. UserService applies each change to the
+    index of the process making it once its transaction commits. Other
+    processes only see it when they next rebuild their index from the
+    database, every SEARCH_INDEX_REBUILD_SECONDS, so results are eventually
+    consistent across workers.
+    """
+
+    def __init__(self) -> None:
+        # Main segment
+        self._usernames: list[tuple[str, int]] = []
+        self._terms: list[str] = []
+        self._postings: dict[str, np.ndarray] = {}
+        # Delta segment, postings as sorted lists
+        self._delta_usernames: list[tuple[str, int]] = []
+        self._delta_terms: list[str] = []
+        self._delta_postings: dict[str, list[int]] = {}
+        # Main segment entries removed since the last merge
+        self._dead_usernames: set[tuple[str, int]] = set()
+        self._dead_postings: dict[str, set[int]] = {}
+        self._updates = 0
+        # user id -> (lowercased username, about words), what to undo on removal
+        self._profiles: dict[int, tuple[str | None, tuple[str, ...]]] = {}
+
+    @classmethod
+    def build(cls, rows) -> "SearchIndex":
+        """rows are (id, username, about) of the active users"""
+        index = cls()
+        postings: dict[str, list[int]] = {}
+
+        for user_id, username, about in rows:
+            username = username.lower() if username else None
+            terms = tuple(set(tokenize(about)))
+
+            if username:
+                index._usernames.append((username, user_id))
+
+            for term in terms:
+                postings.setdefault(term, []).append(user_id)
+
+            index._profiles[user_id] = (username, terms)
+
+        index._usernames.sort()
+        index._terms = sorted(postings)
+        index._postings = {
+            term: np.sort(np.array(user_ids, dtype=np.int64))
+            for term, user_ids in postings.items()
+        }
+
+        return index
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._profiles
+
+    def add(self, user_id: int, username: str | None, about: str | None) -> None:
+        """Inserts or re-indexes a user with their current username and about text"""
+        self.remove(user_id)
+
+        username = username.lower() if username else None
+        terms = tuple(set(tokenize(about)))
+
+        if username:
+            insort(self._delta_usernames, (username, user_id))
+
+        for term in terms:
+            postings = self._delta_postings.get(term)
+
+            if postings is None:
+                self._delta_postings[term] = [user_id]
+                insort(self._delta_terms, term)
+            else:
+                insort(postings, user_id)
+
+        self._profiles[user_id] = (username, terms)
+        self._updated()
+
+    def remove(self, user_id: int) -> None:
+        profile = self._profiles.pop(user_id, None)
+
+        if profile is None:
+            return
+
+        username, terms = profile
+
+        # Taken out of the delta segment if it was added since the last merge,
+        # else it's in the main segment, and marked dead there
+        if username:
+            entry = (username, user_id)
+            i = bisect_left(self._delta_usernames, entry)
+
+            if self._delta_usernames[i : i + 1] == [entry]:
+                del self._delta_usernames[i]
+            else:
+                self._dead_usernames.add(entry)
+
+        for term in terms:
+            postings = self._delta_postings.get(term, [])
+            i = bisect_left(postings, user_id)
+
+            if postings[i : i + 1] != [user_id]:
+                self._dead_postings.setdefault(term, set()).add(user_id)
+            elif len(postings) > 1:
+                del postings[i]
+            else:
+                del self._delta_postings[term]
+                del self._delta_terms[bisect_left(self._delta_terms, term)]
+
+        self._updated()
+
+    def _updated(self) -> None:
+        self._updates += 1
+
+        if self._updates >= MERGE_THRESHOLD:
+            self.merge()
+
+    def merge(self) -> None:
+        """Folds the delta segment and the dead entries into the main segment"""
+        dead = self._dead_usernames
+        # Two sorted runs, which sort merges in one pass
+        self._usernames = sorted(
+            [entry for entry in self._usernames if entry not in dead] + self._delta_usernames
+        )
+
+        for term in self._delta_postings.keys() | self._dead_postings.keys():
+            postings = self._term_postings(term)
+
+            if len(postings):
+                self._postings[term] = postings
+            else:
+                self._postings.pop(term, None)
+
+        self._terms = sorted(self._postings)
+        self._delta_usernames, self._delta_terms, self._delta_postings = [], [], {}
+        self._dead_usernames, self._dead_postings = set(), {}
+        self._updates = 0
+
+    def _term_postings(self, term: str) -> np.ndarray:
+        """The sorted ids of the users using term, across both segments"""
+        postings = self._postings.get(term, _NO_POSTINGS)
+        dead = self._dead_postings.get(term)
+        delta = self._delta_postings.get(term)
+
+        # Every dead id is in the main postings, and no delta id is left there,
+        # a re-added user having been marked dead first
+        if dead:
+            dead_ids = np.sort(np.fromiter(dead, np.int64, len(dead)))
+            postings = np.delete(postings, np.searchsorted(postings, dead_ids))
+
+        if delta:
+            delta_ids = np.array(delta, dtype=np.int64)
+            postings = np.insert(postings, np.searchsorted(postings, delta_ids), delta_ids)
+
+        return postings
+
+    def _prefix_terms(self, prefix: str) -> list[str]:
+        """The first MAX_PREFIX_TERMS words starting with prefix, across both segments"""
+        end = prefix + _PREFIX_END
+        main = (self._terms[i] for i in _prefixed(self._terms, prefix, end))
+        delta = (self._delta_terms[i] for i in _prefixed(self._delta_terms, prefix, end))
+
+        return list(islice(dict.fromkeys(heapq.merge(main, delta)), MAX_PREFIX_TERMS))
+
+    def _keyword_matches(self, words: list[str], query: str, count: int) -> list[int]:
+        """The first count users whose about text has every word, the last one
+        as a prefix, leaving out those whose username starts with query.
+
+        They all have the full words, so they're ranked by how rare the word
+        matching the prefix is, rarest first, then by id. That order is walked
+        a group of equally rare words at a time until count users are found.
+        """
+        *full, last = words
+        candidates: np.ndarray | None = None
+
+        # Rarest first, so every later check is against the fewest candidates
+        for postings in sorted(map(self._term_postings, full), key=len):
+            if not len(postings):
+                return []
+
+            candidates = (
+                postings if candidates is None else candidates[_contains(postings, candidates)]
+            )
+
+        groups: dict[int, list[np.ndarray]] = {}
+
+        for term in self._prefix_terms(last):
+            postings = self._term_postings(term)
+
+            if not len(postings):
+                continue
+
+            matched = (
+                postings if candidates is None else candidates[_contains(postings, candidates)]
+            )
+
+            if len(matched):
+                groups.setdefault(len(postings), []).append(matched)
+
+        found: list[int] = []
+        seen: set[int] = set()
+
+        for _, arrays in sorted(groups.items()):
+            user_ids = arrays[0] if len(arrays) == 1 else np.unique(np.concatenate(arrays))
+
+            # In slices, so a word thousands use isn't converted whole for one page
+            for batch in range(0, len(user_ids), count):
+                for user_id in user_ids[batch : batch + count].tolist():
+                    if user_id in seen or (self._profiles[user_id][0] or "").startswith(query):
+                        continue
+
+                    seen.add(user_id)
+                    found.append(user_id)
+
+                    if len(found) == count:
+                        return found
+
+        return found
+
+    def _username_matches(self, query: str):
+        """(username, id) of the users whose username starts with query, in order"""
+        start, end = (query,), (query + _PREFIX_END,)
+        main = (self._usernames[i] for i in _prefixed(self._usernames, start, end))
+        delta = (
+            self._delta_usernames[i] for i in _prefixed(self._delta_usernames, start, end)
+        )
+
+        if self._dead_usernames:
+            main = (entry for entry in main if entry not in self._dead_usernames)
+
+        return heapq.merge(main, delta)
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = DEFAULT_SEARCH_PAGE_SIZE
+    ) -> list[int]:
+        """A page of the ids of users matching query, best first.
+
+        Users whose username starts with the query rank first, in username
+        order, so an exact match leads. Users matching it by about words follow.
+        Pages that end within the username matches are read straight off the
+        sorted usernames without looking at any words.
+        """
+        query = query.strip().lower()
+
+        if not query:
+            return []
+
+        end = offset + limit
+        usernames = list(islice(self._username_matches(query), end))
+        results = [user_id for _, user_id in usernames[offset:]]
+
+        if len(usernames) == end:
+            return results
+
+        words = list(dict.fromkeys(tokenize(query)))
+
+        if not words:
+            return results
+
+        num_usernames = len(usernames)
+        matches = self._keyword_matches(words, query, end - num_usernames)
+
+        return results + matches[max(offset - num_usernames, 0) :]
+
+
+def _active_profiles(session: Session, batch_size: int = LOAD_BATCH_SIZE):
+    q = (
+        select(UserModel.id, UserModel.username, UserModel.about)
+        .where(UserModel.is_active.is_(True))
+        .execution_options(yield_per=batch_size)
+    )
+
+    for batch in session.execute(q).partitions():
+        yield from batch
+
+
+_search_index = SearchIndex()
+
+
+def get_search_index() -> SearchIndex:
+    """The process-wide index, empty until load_search_index fills it"""
+    return _search_index
+
+
+def load_search_index(session: Session) -> SearchIndex:
+    """Rebuilds the process-wide index from every active user"""
+    global _search_index
+
+    _search_index = SearchIndex.build(_active_profiles(session))
+
+    return _search_index
+
+
+def index_on_commit(
+    session: Session, index: SearchIndex, user_id: int, profile: tuple | None
+) -> None:
+    """Queues a (username, about) update for user_id, or its removal when profile
+    is None, to apply to index once the session's transaction commits"""
+    session.info.setdefault("search_index_updates", []).append((index, user_id, profile))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_queued_updates(session: Session) -> None:
+    for index, user_id, profile in session.info.pop("search_index_updates", ()):
+        if profile is None:
+            index.remove(user_id)
+        else:
+            index.add(user_id, *profile)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_queued_updates(session: Session) -> None:
+    session.info.pop("search_index_updates", None)
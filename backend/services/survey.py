@@ -1,15 +1,254 @@
+from datetime import datetime
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import bindparam, exists, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.profile_change import ProfileChangeKind
+from models.survey import SurveyAnswerModel, SurveyQuestionModel, SurveyVectorModel
+from models.user import UserModel
+
+from .aio import AsyncService
+from .candidate_index import CandidateIndex, get_candidate_index, reindex_on_commit
+from .profile_changes import record_changes
+
+ENCODE_BATCH_SIZE = 1000
+
+
+def _answer_matrix(user_ids: np.ndarray, rows) -> np.ndarray:
+    if not rows or len(user_ids) == 0:
+        return np.zeros((len(user_ids), 0), dtype=np.int8)
+
+    answer_user_ids, question_ids, answers = (np.array(col) for col in zip(*rows))
+    positions = np.searchsorted(user_ids, answer_user_ids).clip(max=len(user_ids) - 1)
+    known = user_ids[positions] == answer_user_ids
+
+    matrix = np.zeros((len(user_ids), question_ids.max() + 1), dtype=np.int8)
+    matrix[positions[known], question_ids[known]] = answers[known]
+
+    return matrix
+
+
+def _vector_matrix(user_ids: np.ndarray, rows) -> np.ndarray:
+    """Stacks (user_id, vector) rows straight from their bytes, row-aligned with the
+    sorted user_ids. Vectors encoded before questions were added are zero padded"""
+    if not rows or len(user_ids) == 0:
+        return np.zeros((len(user_ids), 0), dtype=np.int8)
+
+    vector_user_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    width = max(len(row[1]) for row in rows)
+    vectors = np.frombuffer(
+        b"".join(bytes(row[1]).ljust(width, b"\0") for row in rows), dtype=np.int8
+    ).reshape(len(rows), width)
+
+    positions = np.searchsorted(user_ids, vector_user_ids).clip(max=len(user_ids) - 1)
+    known = user_ids[positions] == vector_user_ids
+
+    matrix = np.zeros((len(user_ids), width), dtype=np.int8)
+    matrix[positions[known]] = vectors[known]
+
+    return matrix
+
+
 class SurveyService(object):
-    def __init__(self):
-        pass
+    """Answers are written as the user goes. Submitting packs them into the user's
+    survey vector, which is what matching reads, and later answers or edits
+    re-encode only that user's vector"""
+
+    def __init__(self, session: Session, candidate_index: CandidateIndex | None = None):
+        self.session = session
+        self.candidate_index = (
+            get_candidate_index() if candidate_index is None else candidate_index
+        )
+
+    def get_survey(self) -> list[SurveyQuestionModel]:
+        q = select(SurveyQuestionModel).order_by(SurveyQuestionModel.id)
+
+        return list(self.session.execute(q).scalars())
+
+    def _check_answers(self, answers: dict[int, int]) -> None:
+        q = select(SurveyQuestionModel.id, SurveyQuestionModel.choices).where(
+            SurveyQuestionModel.id.in_(list(answers))
+        )
+        num_choices = {row.id: len(row.choices) for row in self.session.execute(q)}
+
+        for question_id, answer in answers.items():
+            if question_id not in num_choices:
+                raise HTTPException(status_code=400, detail=f"Unknown question {question_id}")
+
+            if not 1 <= answer <= num_choices[question_id]:
+                raise HTTPException(
+                    status_code=400, detail=f"Invalid answer to question {question_id}"
+                )
+
+    def _answered(self, user_id: int, question_ids: list[int] | None) -> set[int]:
+        q = select(SurveyAnswerModel.question_id).where(SurveyAnswerModel.user_id == user_id)
+
+        if question_ids is not None:
+            q = q.where(SurveyAnswerModel.question_id.in_(question_ids))
+
+        return set(self.session.execute(q).scalars())
+
+    def answer_survey(self, user_id: int, answers: dict[int, int]) -> None:
+        """Stores answers to questions the user hasn't answered yet"""
+        self._check_answers(answers)
+
+        if self._answered(user_id, list(answers)):
+            raise HTTPException(
+                status_code=400, detail="Question already answered, edit the answer instead"
+            )
+
+        self.session.execute(
+            insert(SurveyAnswerModel),
+            [
+                {"user_id": user_id, "question_id": question_id, "answer": answer}
+                for question_id, answer in answers.items()
+            ],
+        )
+        self._reencode_if_submitted(user_id)
+
+    def edit_survey_answers(self, user_id: int, answers: dict[int, int]) -> None:
+        """Changes answers the user already gave, with a single executemany"""
+        self._check_answers(answers)
+
+        if len(self._answered(user_id, list(answers))) < len(answers):
+            raise HTTPException(status_code=400, detail="Question not answered yet")
+
+        answers_table = SurveyAnswerModel.__table__
+        stmt = (
+            update(answers_table)
+            .where(
+                answers_table.c.user_id == bindparam("b_user_id"),
+                answers_table.c.question_id == bindparam("b_question_id"),
+            )
+            .values(answer=bindparam("b_answer"))
+        )
+        self.session.execute(
+            stmt,
+            [
+                {"b_user_id": user_id, "b_question_id": question_id, "b_answer": answer}
+                for question_id, answer in answers.items()
+            ],
+        )
+        self._reencode_if_submitted(user_id)
+
+    def submit_survey(self, user_id: int) -> None:
+        """Encodes the user's answers once every question is answered, which makes them
+        matchable"""
+        question_ids = set(self.session.execute(select(SurveyQuestionModel.id)).scalars())
+        answered = self._answered(user_id, None)
+
+        # With no questions in the survey yet there'd be nothing to score on
+        if not answered or question_ids - answered:
+            raise HTTPException(
+                status_code=400, detail="Answer every question before submitting"
+            )
+
+        self.encode_vectors([user_id])
+
+    def _reencode_if_submitted(self, user_id: int) -> None:
+        q = select(exists().where(SurveyVectorModel.user_id == user_id))
+
+        if self.session.execute(q).scalar():
+            self.encode_vectors([user_id])
+
+    def encode_vectors(self, user_ids: list[int]) -> None:
+        """Packs the current answers of user_ids into their vectors and re-indexes them"""
+        user_ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+        q = select(
+            SurveyAnswerModel.user_id,
+            SurveyAnswerModel.question_id,
+            SurveyAnswerModel.answer,
+        ).where(SurveyAnswerModel.user_id.in_(user_ids.tolist()))
+        matrix = _answer_matrix(user_ids, self.session.execute(q).all())
+
+        q = select(SurveyVectorModel.user_id).where(
+            SurveyVectorModel.user_id.in_(user_ids.tolist())
+        )
+        encoded = set(self.session.execute(q).scalars())
+        encoded_at = datetime.utcnow()
+        new, changed = [], []
+
+        for user_id, answers in zip(user_ids.tolist(), matrix):
+            (changed if user_id in encoded else new).append(
+                {"b_user_id": user_id, "b_vector": answers.tobytes()}
+            )
+
+        vectors = SurveyVectorModel.__table__
+
+        if new:
+            self.session.execute(
+                insert(vectors).values(
+                    user_id=bindparam("b_user_id"),
+                    vector=bindparam("b_vector"),
+                    version=1,
+                    encoded_at=encoded_at,
+                ),
+                new,
+            )
+
+        if changed:
+            self.session.execute(
+                update(vectors)
+                .where(vectors.c.user_id == bindparam("b_user_id"))
+                .values(
+                    vector=bindparam("b_vector"),
+                    version=vectors.c.version + 1,
+                    encoded_at=encoded_at,
+                ),
+                changed,
+            )
+
+        # Submissions, later edits and the survey_vectors cron all end up here
+        record_changes(self.session, user_ids.tolist(), ProfileChangeKind.SURVEY)
+        reindex_on_commit(self.session, self.candidate_index, user_ids, matrix)
+
+    def encode_stale_vectors(self, batch_size: int = ENCODE_BATCH_SIZE) -> int:
+        """Re-encodes submitted users whose answers changed after their vector was
+        encoded, e.g. by a backfill that bypassed the service. Returns how many"""
+        q = (
+            select(SurveyAnswerModel.user_id)
+            .join(SurveyVectorModel, SurveyVectorModel.user_id == SurveyAnswerModel.user_id)
+            .where(SurveyAnswerModel.updated_at > SurveyVectorModel.encoded_at)
+            .distinct()
+        )
+        user_ids = list(self.session.execute(q).scalars())
+
+        for start in range(0, len(user_ids), batch_size):
+            self.encode_vectors(user_ids[start : start + batch_size])
+
+        return len(user_ids)
+
+    def get_answer_matrix(self, user_ids: np.ndarray) -> np.ndarray:
+        """Returns an int8 (len(user_ids), num_questions) matrix of submitted answers,
+        row-aligned with the sorted user_ids. Unanswered questions and users who haven't
+        submitted are 0. Meant for small id sets"""
+        q = select(SurveyVectorModel.user_id, SurveyVectorModel.vector).where(
+            SurveyVectorModel.user_id.in_(user_ids.tolist())
+        )
+
+        return _vector_matrix(user_ids, self.session.execute(q).all())
+
+    def get_vector_versions(self, user_ids: list[int]) -> dict[int, int]:
+        """Version of each submitted user's vector, users who haven't submitted are left out"""
+        q = select(SurveyVectorModel.user_id, SurveyVectorModel.version).where(
+            SurveyVectorModel.user_id.in_(user_ids)
+        )
+
+        return dict(self.session.execute(q).all())
 
-    def get_survey(self):
-        pass
+    def get_active_answer_matrix(self, user_ids: np.ndarray) -> np.ndarray:
+        """Same as get_answer_matrix but scans the vectors of every active user
+        instead of binding user_ids, for callers that load (nearly) all of them"""
+        q = (
+            select(SurveyVectorModel.user_id, SurveyVectorModel.vector)
+            .join(UserModel, UserModel.id == SurveyVectorModel.user_id)
+            .where(UserModel.is_active.is_(True))
+        )
 
-    def answer_survey(self):
-        pass
+        return _vector_matrix(user_ids, self.session.execute(q).all())
 
-    def edit_survey_answers(self):
-        pass
 
-    def submit_survey(self):
-        pass
+class AsyncSurveyService(AsyncService):
+    service_class = SurveyService
@@ -0,0 +1,143 @@
+import os
+import time
+from abc import ABC, abstractmethod
+
+from fastapi import HTTPException
+
+LOGIN_IP_ATTEMPTS = int(os.environ.get("LOGIN_IP_ATTEMPTS", "30"))
+LOGIN_EMAIL_ATTEMPTS = int(os.environ.get("LOGIN_EMAIL_ATTEMPTS", "5"))
+LOGIN_WINDOW_SECONDS = float(os.environ.get("LOGIN_WINDOW_SECONDS", "60"))
+THROTTLE_EVICT_SECONDS = float(os.environ.get("THROTTLE_EVICT_SECONDS", "30"))
+THROTTLE_MAX_KEYS = int(os.environ.get("THROTTLE_MAX_KEYS", "1000000"))
+
+
+class ThrottleBackend(ABC):
+    """Token buckets shared by every process, e.g. a Redis script. A bucket is
+    kept as the single time it will next be full, so take has to be atomic"""
+
+    @abstractmethod
+    def take(self, key: str, interval: float, burst: float, now: float) -> float:
+        """Takes a token from key's bucket, which refills one token per interval
+        and holds burst of them. Returns 0 if one was taken, or else the seconds
+        until one will be"""
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+
+class InMemoryThrottleBackend(ThrottleBackend):
+    """Buckets in a dict of key -> time it's full again, for a single process or
+    as a stand-in for a shared backend in tests.
+
+    A bucket that has refilled is the same as no bucket, so those are evicted
+    every evict_seconds, or sooner once there are more than max_keys of them.
+    Memory then stays bounded by the keys seen within one window.
+    """
+
+    def __init__(
+        self, evict_seconds: float = THROTTLE_EVICT_SECONDS, max_keys: int = THROTTLE_MAX_KEYS
+    ) -> None:
+        self.evict_seconds = evict_seconds
+        self.max_keys = max_keys
+        self._full_at: dict[str, float] = {}
+        self._evicted_at = 0.0
+
+    def take(self, key: str, interval: float, burst: float, now: float) -> float:
+        if now - self._evicted_at >= self.evict_seconds or len(self._full_at) > self.max_keys:
+            self.evict(now)
+
+        # An empty-to-full bucket spans burst intervals, so a take is allowed while
+        # the bucket is at least one interval short of that
+        full_at = max(self._full_at.get(key, now), now)
+        retry_after = full_at + interval - burst * interval - now
+
+        if retry_after > 0:
+            return retry_after
+
+        self._full_at[key] = full_at + interval
+
+        return 0.0
+
+    def evict(self, now: float) -> None:
+        self._full_at = {key: at for key, at in self._full_at.items() if at > now}
+        self._evicted_at = now
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+
+class LoginThrottle(object):
+    """Limits login attempts per client IP and per email, over a sliding window.
+
+    Attempts are checked before the user is looked up or the password hashed,
+    so a credential stuffing burst is turned away for the cost of two dict
+    lookups. Every attempt counts, failed or not.
+    """
+
+    def __init__(
+        self,
+        backend: ThrottleBackend | None = None,
+        ip_attempts: int = LOGIN_IP_ATTEMPTS,
+        email_attempts: int = LOGIN_EMAIL_ATTEMPTS,
+        window_seconds: float = LOGIN_WINDOW_SECONDS,
+    ) -> None:
+        self.backend = InMemoryThrottleBackend() if backend is None else backend
+        self.ip_attempts = ip_attempts
+        self.email_attempts = email_attempts
+        self.window_seconds = window_seconds
+
+        self.allowed = 0
+        self.rejected = 0
+        self.verified = 0
+        self.failed = 0
+
+    def _take(self, key: str, attempts: int) -> float:
+        return self.backend.take(key, self.window_seconds / attempts, attempts, time.time())
+
+    def check(self, client_ip: str | None, email: str) -> None:
+        """Raises a 429 if either the IP or the email is over its limit"""
+        retry_after = 0.0
+
+        if client_ip is not None:
+            retry_after = self._take(f"login:ip:{client_ip}", self.ip_attempts)
+
+        if not retry_after:
+            retry_after = self._take(f"login:email:{email.strip().lower()}", self.email_attempts)
+
+        if retry_after:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts, please try again later",
+                headers={"Retry-After": str(int(retry_after) + 1)},
+            )
+
+        self.allowed += 1
+
+    def record(self, verified: bool) -> None:
+        """Counts the outcome of an attempt that got past check"""
+        if verified:
+            self.verified += 1
+        else:
+            self.failed += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "verified": self.verified,
+            "failed": self.failed,
+            "tracked_keys": len(self.backend),
+        }
+
+
+_login_throttle: LoginThrottle | None = None
+
+
+def get_login_throttle() -> LoginThrottle:
+    global _login_throttle
+
+    if _login_throttle is None:
+        _login_throttle = LoginThrottle()
+
+    return _login_throttle
@@ -0,0 +1,119 @@
+import hashlib
+import os
+
+import jwt
+from fastapi import HTTPException
+
+from .cache import LRUCache
+from .revocation import RevocationStore, get_revocation_store
+
+ALGORITHM = "HS256"
+DEFAULT_KID = "default"
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+
+
+def _parse_keys(value: str) -> dict[str, str]:
+    """JWT_KEYS is a comma separated list of kid:secret pairs"""
+    return dict(pair.split(":", 1) for pair in value.split(",") if pair)
+
+
+class TokenVerifier(object):
+    """Signs and verifies HS256 tokens without touching the database.
+
+    Tokens carry the kid of the key that signed them, so keys can be rotated:
+    new tokens are signed with the active key while tokens signed with older
+    keys stay valid until that key is retired. Verified claims are cached by
+    token hash until the token's exp, so repeat requests skip the HMAC check.
+    Every request, cached or not, is still checked against the revocation store.
+    """
+
+    def __init__(
+        self,
+        keys: dict[str, str],
+        active_kid: str,
+        cache_size: int = TOKEN_CACHE_SIZE,
+        revocation_store: RevocationStore | None = None,
+    ) -> None:
+        if active_kid not in keys:
+            raise ValueError(f"No key for active kid {active_kid!r}")
+
+        self.keys = dict(keys)
+        self.active_kid = active_kid
+        self.revocation_store = revocation_store
+        self._cache = LRUCache(maxsize=cache_size)
+
+    def sign(self, claims: dict) -> str:
+        return jwt.encode(
+            claims,
+            self.keys[self.active_kid],
+            algorithm=ALGORITHM,
+            headers={"kid": self.active_kid},
+        )
+
+    def verify(self, token: str) -> dict:
+        token_hash = hashlib.sha256(token.encode()).digest()
+        claims = self._cache.get(token_hash)
+
+        if claims is None:
+            claims = self._decode(token)
+            self._cache.set(token_hash, claims, expires_at=claims["exp"])
+
+        if self.revocation_store is not None and self.revocation_store.is_revoked(
+            claims["jti"]
+        ):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+
+        return claims
+
+    def _decode(self, token: str) -> dict:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid", DEFAULT_KID)
+
+            if kid not in self.keys:
+                raise HTTPException(status_code=401, detail="Invalid token")
+
+            claims = jwt.decode(
+                token,
+                self.keys[kid],
+                algorithms=[ALGORITHM],
+                options={"require": ["exp", "sub", "jti"]},
+            )
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        return claims
+
+    def rotate(self, kid: str, secret: str) -> None:
+        """Signs new tokens with the given key, older keys still verify"""
+        self.keys[kid] = secret
+        self.active_kid = kid
+
+    def retire(self, kid: str) -> None:
+        """Stops accepting tokens signed with the given key"""
+        if kid == self.active_kid:
+            raise ValueError("Cannot retire the active key, rotate first")
+
+        self.keys.pop(kid, None)
+        self._cache.clear()
+
+
+_token_verifier: TokenVerifier | None = None
+
+
+def get_token_verifier() -> TokenVerifier:
+    """The process-wide verifier, keyed from JWT_KEYS/JWT_ACTIVE_KID, or SECRET_KEY alone"""
+    global _token_verifier
+
+    if _token_verifier is None:
+        keys = _parse_keys(os.environ.get("JWT_KEYS", ""))
+
+        if keys:
+            active_kid = os.environ.get("JWT_ACTIVE_KID", next(iter(keys)))
+        else:
+            keys, active_kid = {DEFAULT_KID: os.environ["SECRET_KEY"]}, DEFAULT_KID
+
+        _token_verifier = TokenVerifier(
+            keys, active_kid, revocation_store=get_revocation_store()
+        )
+
+    return _token_verifier
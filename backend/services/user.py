@@ -1,104 +1,592 @@
+import os
 import random
 import string
 
-from sqlalchemy import delete, select, update
-from sqlalchemy.orm import Session
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-from ..models.user import UserModel
-from ..models.visible_first_names import VisibleFirstNameModel
-from ..schema.profile import ProfileSchema, SignUpSchema
-from .auth import AuthService
+from db import dialect_insert
+from models.message import ConversationModel, MessageModel, UnreadCounterModel
+from models.profile_change import ProfileChangeKind
+from models.survey import SurveyAnswerModel, SurveyVectorModel
+from models.user import UserModel
+from models.visible_first_names import VisibleFirstNameModel
+from schema.profile import ProfileCardSchema, ProfileSchema
+
+from .aio import AsyncService
+from .cache import LRUCache, ReadThroughCache, invalidate_on_commit
+from .candidate_index import CandidateIndex, get_candidate_index, reindex_on_commit
+from .compatibility import build_features, encode_answers, rank_candidates
+from .outbox import EmailOutbox, email_update_verification
+from .profile_changes import record_changes
+from .search_index import (
+    DEFAULT_SEARCH_PAGE_SIZE,
+    MAX_SEARCH_PAGE_SIZE,
+    SearchIndex,
+    get_search_index,
+    index_on_commit,
+)
+from .survey import SurveyService
+
+NUM_SUGGESTION_CANDIDATES = 300
+# Bounds how stale another worker's view of a grant or revoke can be
+VISIBILITY_CACHE_TTL = float(os.environ.get("VISIBILITY_CACHE_TTL", "30"))
+
+# viewer id -> frozenset of user ids whose first name the viewer may see
+_visibility_cache = LRUCache(maxsize=10_000, ttl=VISIBILITY_CACHE_TTL)
+
+NUM_USERNAME_SUGGESTIONS = int(os.environ.get("NUM_USERNAME_SUGGESTIONS", "5"))
+NUM_USERNAME_CANDIDATES = 20
+# Accounts get "user" and random digits until they pick a username, never
+# anything derived from their email, since usernames are public and searchable
+PLACEHOLDER_USERNAME_BASE = "user"
+PLACEHOLDER_USERNAME_DIGITS = 8
+TAKEN_USERNAME_TTL = float(os.environ.get("TAKEN_USERNAME_TTL", "300"))
+
+# Usernames recently found taken, skipped without asking the database again
+_taken_usernames = LRUCache(maxsize=100_000, ttl=TAKEN_USERNAME_TTL)
+
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
+
+# "user:id:<id>" -> column values, "user:email:<email>" -> id
+_user_cache = ReadThroughCache(
+    LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL), ttl=USER_CACHE_TTL
+)
+
+
+def _id_key(user_id: int) -> str:
+    return f"user:id:{user_id}"
+
+
+def _email_key(email: str) -> str:
+    return f"user:email:{email}"
+
+
+def _user_row(user: UserModel) -> dict:
+    return {column.key: getattr(user, column.key) for column in UserModel.__table__.columns}
+
+
+def _username_candidates(base_username: str, digits: int) -> list[str]:
+    """The bare name then NUM_USERNAME_CANDIDATES random variants with up to digits digits"""
+    upper = 10**digits - 1
+    variants = (
+        lambda: f"{base_username}{random.randint(10, upper)}",
+        lambda: f"{base_username}_{random.randint(100, upper)}",
+        lambda: f"{base_username}.{random.randint(1, upper)}",
+        lambda: f"{base_username}{random.choice(string.ascii_lowercase)}{random.randint(1, upper)}",
+    )
+    candidates = dict.fromkeys(
+        [base_username] + [variants[i % len(variants)]() for i in range(NUM_USERNAME_CANDIDATES)]
+    )
+
+    return list(candidates)
 
 
 class UserService(object):
-    def __init__(self, session: Session) -> None:
+    def __init__(
+        self,
+        session: Session,
+        candidate_index: CandidateIndex | None = None,
+        cache: ReadThroughCache | None = None,
+        search_index: SearchIndex | None = None,
+    ) -> None:
         self.session = session
-        self.auth_svc = AuthService
+        self.outbox = EmailOutbox(session)
+        self.candidate_index = (
+            get_candidate_index() if candidate_index is None else candidate_index
+        )
+        self.search_index = get_search_index() if search_index is None else search_index
+        self.survey_svc = SurveyService(session, self.candidate_index)
+        self.cache = cache or _user_cache
+
+    def _from_cache(self, row: dict) -> UserModel:
+        """Attaches a cached row to the session as a clean persistent instance, without a query"""
+        user = UserModel(**row)
+        make_transient_to_detached(user)
+
+        return self.session.merge(user, load=False)
+
+    def _cache_user(self, user: UserModel) -> None:
+        self.cache.set(_id_key(user.id), _user_row(user))
+        self.cache.set(_email_key(user.email), user.id)
+
+    def _invalidate_user(self, user_id: int, *emails: str) -> None:
+        invalidate_on_commit(
+            self.session,
+            self.cache,
+            _id_key(user_id),
+            *(_email_key(email) for email in emails),
+        )
 
     def get_user(self, user_id: int) -> UserModel:
+        row = self.cache.get(_id_key(user_id))
+
+        if row is not None:
+            return self._from_cache(row)
+
         q = select(UserModel).where(UserModel.id == user_id)
+        user = self.session.execute(q).scalar_one()
+        self._cache_user(user)
+
+        return user
+
+    def get_profile_cards(
+        self, viewer_id: int, user_ids: list[int]
+    ) -> list[ProfileCardSchema]:
+        """Active profiles of user_ids as seen by viewer_id, in the order requested.
 
-        return self.session.execute(q).scalar_one()
+        One query loads only the card columns and outer joins the viewer's
+        visible_first_name grant, so first names are resolved without a lookup per card.
+        """
+        grant = VisibleFirstNameModel
+        q = (
+            select(
+                UserModel.id,
+                UserModel.username,
+                UserModel.first_name,
+                UserModel.gender,
+                UserModel.about,
+                UserModel.image_1,
+                grant.id.is_not(None).label("first_name_visible"),
+            )
+            .outerjoin(
+                grant,
+                (grant.user_id == UserModel.id)
+                & (grant.permission_granted_for_user_id == viewer_id),
+            )
+            .where(UserModel.id.in_(user_ids), UserModel.is_active.is_(True))
+        )
+        rows = {row.id: row for row in self.session.execute(q)}
+
+        return [
+            ProfileCardSchema(
+                id=row.id,
+                username=row.username,
+                first_name=row.first_name
+                if row.first_name_visible or row.id == viewer_id
+                else None,
+                gender=row.gender,
+                about=row.about,
+                image=row.image_1,
+            )
+            for row in (rows.get(user_id) for user_id in user_ids)
+            if row is not None
+        ]
 
     def get_user_by_email(self, email: str) -> UserModel | None:
+        user_id = self.cache.get(_email_key(email))
+
+        if user_id is not None:
+            try:
+                user = self.get_user(user_id)
+            except NoResultFound:
+                user = None
+
+            # The mapping outlives email changes and deletes made by other processes
+            if user is not None and user.email == email:
+                return user
+
+            self.cache.invalidate(_email_key(email))
+
         q = select(UserModel).where(UserModel.email == email)
+        user = self.session.execute(q).scalar_one_or_none()
+
+        if user is not None:
+            self._cache_user(user)
 
-        return self.session.execute(q).scalar_one_or_none()
+        return user
 
-    def create_user(self, profile_data: SignUpSchema) -> None:
+    def create_user(
+        self,
+        email: str,
+        hashed_password: str,
+        username: str | None = None,
+        first_name: str = "",
+    ) -> int:
+        """Creates an account from its sign up details, returns its id. A random
+        placeholder stands in for the username until one is picked, and the rest
+        of the profile is filled in later"""
         user = UserModel(
-            email=profile_data.email,
-            password=profile_data.password,
+            email=email,
+            hashed_password=hashed_password,
+            username=username or self._placeholder_username(),
+            first_name=first_name,
         )
 
         self.session.add(user)
+        self.session.flush()
+        record_changes(self.session, [user.id], ProfileChangeKind.CREATED)
+        index_on_commit(self.session, self.search_index, user.id, (user.username, user.about))
+
+        # No survey answers yet, re-indexed on survey submission
+        reindex_on_commit(
+            self.session, self.candidate_index, [user.id], np.zeros((1, 0), dtype=np.int8)
+        )
+
+        return user.id
+
+    def create_users(self, rows: list[dict]) -> list[int]:
+        """Inserts users from their column values, hashed_password included, as a
+        single executemany and returns their ids, in the order of rows"""
+        if not rows:
+            return []
+
+        # Batched executemany RETURNING doesn't keep row order by itself
+        stmt = insert(UserModel).returning(UserModel.id, sort_by_parameter_order=True)
+        user_ids = list(self.session.scalars(stmt, rows))
+        record_changes(self.session, user_ids, ProfileChangeKind.CREATED)
+        reindex_on_commit(
+            self.session,
+            self.candidate_index,
+            user_ids,
+            np.zeros((len(user_ids), 0), dtype=np.int8),
+        )
+
+        for user_id, row in zip(user_ids, rows):
+            if row.get("is_active", True):
+                index_on_commit(
+                    self.session,
+                    self.search_index,
+                    user_id,
+                    (row.get("username"), row.get("about")),
+                )
+
+        return user_ids
 
     def edit_user(self, user_id: int, profile_data: ProfileSchema) -> None:
         user = self.get_user(user_id)
 
         if profile_data.email is not None and user.email != profile_data.email:
-            self.auth_svc.send_email_update_verification(profile_data.email)
+            self.outbox.enqueue(email_update_verification(profile_data.email))
+
+        username = profile_data.username or user.username
+
+        if username != user.username and not self._free_usernames([username]):
+            raise HTTPException(status_code=400, detail="Username taken")
+
+        values = {
+            "username": username,
+            "first_name": profile_data.first_name,
+            "about": profile_data.about,
+        }
+
+        # Matching needs a gender, so once given it can be changed but not cleared
+        if profile_data.gender is not None:
+            values["gender"] = profile_data.gender
+
+        if "interested_in" in profile_data.model_fields_set:
+            values["interested_in"] = profile_data.interested_in
+
+        stmt = update(UserModel).values(values).where(UserModel.id == user_id)
 
+        self.session.execute(stmt)
+        record_changes(self.session, [user_id], ProfileChangeKind.EDITED)
+        self._invalidate_user(user_id)
+
+        if user.is_active:
+            index_on_commit(
+                self.session, self.search_index, user_id, (username, profile_data.about)
+            )
+
+    def set_image(self, user_id: int, slot: int, digest: str | None) -> None:
+        """Points one of the user's three image slots at a stored image digest"""
         stmt = (
             update(UserModel)
-            .values(
-                first_name=profile_data.first_name,
-                about=profile_data.about,
-            )
+            .values({f"image_{slot}": digest})
             .where(UserModel.id == user_id)
         )
 
         self.session.execute(stmt)
+        self._invalidate_user(user_id)
 
     def update_user_email_address(self, user_id: int, new_email: str) -> None:
         stmt = update(UserModel).values(email=new_email).where(UserModel.id == user_id)
 
         self.session.execute(stmt)
+        # A stale entry for the old email is caught by get_user_by_email's check
+        self._invalidate_user(user_id, new_email)
+
+    def _delete_dependents(self, user_ids: list[int]) -> None:
+        """Deletes the rows referencing user_ids, one statement per table, so the
+        users themselves can be deleted with foreign keys enforced.
+
+        Their conversations go with them, messages to the other side included,
+        and the other side's unread counters drop by what they hadn't seen.
+        """
+        conversation_ids = select(ConversationModel.id).where(
+            or_(
+                ConversationModel.user_a_id.in_(user_ids),
+                ConversationModel.user_b_id.in_(user_ids),
+            )
+        )
+        unseen = select(MessageModel.id).where(
+            MessageModel.conversation_id.in_(conversation_ids), MessageModel.seen_at.is_(None)
+        )
+        unseen_by_counter = (
+            select(func.count())
+            .where(
+                MessageModel.id.in_(unseen),
+                MessageModel.recipient_id == UnreadCounterModel.user_id,
+            )
+            .scalar_subquery()
+        )
+
+        self.session.execute(
+            update(UnreadCounterModel)
+            .values(unread_count=UnreadCounterModel.unread_count - unseen_by_counter)
+            .where(
+                UnreadCounterModel.user_id.not_in(user_ids),
+                UnreadCounterModel.user_id.in_(
+                    select(MessageModel.recipient_id).where(MessageModel.id.in_(unseen))
+                ),
+            )
+        )
+
+        for stmt in (
+            delete(MessageModel).where(MessageModel.conversation_id.in_(conversation_ids)),
+            delete(ConversationModel).where(ConversationModel.id.in_(conversation_ids)),
+            delete(UnreadCounterModel).where(UnreadCounterModel.user_id.in_(user_ids)),
+            delete(VisibleFirstNameModel).where(
+                or_(
+                    VisibleFirstNameModel.user_id.in_(user_ids),
+                    VisibleFirstNameModel.permission_granted_for_user_id.in_(user_ids),
+                )
+            ),
+            delete(SurveyAnswerModel).where(SurveyAnswerModel.user_id.in_(user_ids)),
+            delete(SurveyVectorModel).where(SurveyVectorModel.user_id.in_(user_ids)),
+        ):
+            self.session.execute(stmt)
 
     def delete_user(self, user_id: int) -> None:
         stmt = delete(UserModel).where(UserModel.id == user_id)
 
+        self._delete_dependents([user_id])
         self.session.execute(stmt)
+        record_changes(self.session, [user_id], ProfileChangeKind.DELETED)
+        self._invalidate_user(user_id)
+        reindex_on_commit(self.session, self.candidate_index, [user_id], None)
+        index_on_commit(self.session, self.search_index, user_id, None)
 
     def deactivate_account(self, user_id: int) -> None:
         """Deactivates a given user_id's account. DOES NOT DELETE"""
         stmt = update(UserModel).values(is_active=False).where(UserModel.id == user_id)
 
         self.session.execute(stmt)
+        record_changes(self.session, [user_id], ProfileChangeKind.DEACTIVATED)
+        self._invalidate_user(user_id)
+        reindex_on_commit(self.session, self.candidate_index, [user_id], None)
+        index_on_commit(self.session, self.search_index, user_id, None)
+
+    def delete_users(self, user_ids: list[int]) -> int:
+        """Deletes many users with a single IN statement, returns how many existed"""
+        stmt = delete(UserModel).where(UserModel.id.in_(user_ids))
+
+        if user_ids:
+            self._delete_dependents(user_ids)
+
+        return self._apply_to_users(stmt, user_ids, ProfileChangeKind.DELETED)
+
+    def deactivate_accounts(self, user_ids: list[int]) -> int:
+        """Deactivates many accounts with a single IN statement, returns how many were active"""
+        stmt = (
+            update(UserModel)
+            .values(is_active=False)
+            .where(UserModel.id.in_(user_ids), UserModel.is_active.is_(True))
+        )
+
+        return self._apply_to_users(stmt, user_ids, ProfileChangeKind.DEACTIVATED)
+
+    def _apply_to_users(self, stmt, user_ids: list[int], kind: ProfileChangeKind) -> int:
+        if not user_ids:
+            return 0
+
+        rowcount = self.session.execute(stmt).rowcount
+        record_changes(self.session, user_ids, kind)
+        invalidate_on_commit(self.session, self.cache, *map(_id_key, user_ids))
+
+        reindex_on_commit(self.session, self.candidate_index, user_ids, None)
+
+        for user_id in user_ids:
+            index_on_commit(self.session, self.search_index, user_id, None)
+
+        return rowcount
 
     def suggest_usernames(self, user_id: int) -> list[str]:
-        """Suggests a series of usernames for the given user_id based on the users first name and/or email address"""
+        """Suggests NUM_USERNAME_SUGGESTIONS free usernames for the given user_id based on
+        the users first name and/or email address"""
         user = self.get_user(user_id)
 
         base_username = (
             user.first_name.lower() if user.first_name else user.email.split("@")[0]
         )
 
-        suggestions = set()
+        suggestions: list[str] = []
+        digits = 3
+
+        while len(suggestions) < NUM_USERNAME_SUGGESTIONS:
+            candidates = [
+                candidate
+                for candidate in _username_candidates(base_username, digits)
+                if candidate not in suggestions and _taken_usernames.get(candidate) is None
+            ]
+            suggestions.extend(self._free_usernames(candidates))
+            # Longer suffixes make another collision less likely on the next round
+            digits += 1
+
+        return suggestions[:NUM_USERNAME_SUGGESTIONS]
+
+    def _placeholder_username(self) -> str:
+        """A free username that says nothing about the user"""
+        digits = PLACEHOLDER_USERNAME_DIGITS
+
+        while True:
+            # Without the bare base, which every placeholder would otherwise try first
+            candidates = _username_candidates(PLACEHOLDER_USERNAME_BASE, digits)[1:]
+            free = self._free_usernames(candidates)
+
+            if free:
+                return free[0]
+
+            digits += 1
+
+    def _free_usernames(self, candidates: list[str]) -> list[str]:
+        """Checks candidates against the unique username index with a single IN query"""
+        if not candidates:
+            return []
+
+        q = select(UserModel.username).where(UserModel.username.in_(candidates))
+        taken = set(self.session.execute(q).scalars())
+
+        for username in taken:
+            _taken_usernames.set(username, True)
+
+        return [candidate for candidate in candidates if candidate not in taken]
+
+    def search_profiles(
+        self,
+        viewer_id: int,
+        query: str,
+        offset: int = 0,
+        limit: int = DEFAULT_SEARCH_PAGE_SIZE,
+    ) -> dict:
+        """A page of active profiles matching query by username prefix or about
+        words, ranked by the search index and loaded in one query"""
+        limit = min(limit, MAX_SEARCH_PAGE_SIZE)
+        user_ids = self.search_index.search(query, offset, limit)
+
+        return {
+            "profiles": self.get_profile_cards(viewer_id, user_ids),
+            "next_cursor": offset + limit if len(user_ids) == limit else None,
+        }
+
+    def suggest_profiles(self, user_id: int, limit: int = 20) -> list[ProfileCardSchema]:
+        """Suggests active profiles for the given user_id, as the cards they may see.
+        Candidates come from the ANN index and are then ranked by their exact
+        compatibility score. Until the match cron has trained an index every
+        active user is a candidate"""
+        user = self.get_user(user_id)
+
+        # Nothing to match on until the profile is filled in
+        if user.gender is None:
+            return []
+
+        q = (
+            select(UserModel)
+            .where(UserModel.is_active.is_(True))
+            .where(UserModel.gender.is_not(None))
+            .where(UserModel.id != user_id)
+        )
+
+        if self.candidate_index is not None:
+            answers = self.survey_svc.get_answer_matrix(np.array([user_id]))
+            candidate_ids = self.candidate_index.query(answers, NUM_SUGGESTION_CANDIDATES)
+            q = q.where(UserModel.id.in_(candidate_ids.tolist()))
+
+        users = sorted([user, *self.session.execute(q).scalars()], key=lambda u: u.id)
 
-        # Generate some variations
-        suggestions.add(base_username)
-        suggestions.add(f"{base_username}{random.randint(10, 99)}")
-        suggestions.add(f"{base_username}_{random.randint(100, 999)}")
-        suggestions.add(f"{base_username}.{random.randint(1, 999)}")
-        suggestions.add(f"{base_username}{random.choice(string.ascii_lowercase)}")
+        features = build_features(
+            users, self.survey_svc.get_answer_matrix(np.array([u.id for u in users]))
+        )
+        one_hot, answered = encode_answers(features.answers)
+        ranked, _ = rank_candidates(
+            features,
+            one_hot,
+            answered,
+            users.index(user),
+            np.arange(len(users)),
+            limit,
+        )
 
-        return list(suggestions)
+        return self.get_profile_cards(user_id, [users[i].id for i in ranked.tolist()])
 
     def show_first_name(self, user_id: int, permission_granted_for_id: int) -> None:
         """Allow the permission_granted_for user to see the given user_id's first name"""
-        visible_first_name = VisibleFirstNameModel(
-            user_id=user_id, permission_granted_for_user_id=permission_granted_for_id
-        )
+        self.show_first_names(user_id, [permission_granted_for_id])
 
-        self.session.add(visible_first_name)
+    def show_first_names(self, user_id: int, permission_granted_for_ids: list[int]) -> None:
+        """Allow each of the permission_granted_for users to see the given user_id's first name,
+        with one multi-row INSERT that skips the grants already there"""
+        granted_ids = sorted(set(permission_granted_for_ids) - {user_id})
+
+        if granted_ids:
+            self.session.execute(
+                dialect_insert(self.session, VisibleFirstNameModel)
+                .values(
+                    [
+                        {"user_id": user_id, "permission_granted_for_user_id": granted_id}
+                        for granted_id in granted_ids
+                    ]
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[
+                        VisibleFirstNameModel.user_id,
+                        VisibleFirstNameModel.permission_granted_for_user_id,
+                    ]
+                )
+            )
+
+        invalidate_on_commit(self.session, _visibility_cache, *granted_ids)
 
     def un_show_first_name(self, user_id: int, permission_revoked_for_id: int) -> None:
         """Un-show the first name of the given user id from the permission_revoked_for id"""
+        self.un_show_first_names(user_id, [permission_revoked_for_id])
+
+    def un_show_first_names(self, user_id: int, permission_revoked_for_ids: list[int]) -> None:
+        """Un-show the first name of the given user id from each of the permission_revoked_for ids"""
         stmt = delete(VisibleFirstNameModel).where(
             VisibleFirstNameModel.user_id == user_id,
-            VisibleFirstNameModel.permission_granted_for_user_id
-            == permission_revoked_for_id,
+            VisibleFirstNameModel.permission_granted_for_user_id.in_(
+                permission_revoked_for_ids
+            ),
         )
 
         self.session.execute(stmt)
+        invalidate_on_commit(self.session, _visibility_cache, *permission_revoked_for_ids)
+
+    def _first_names_visible_to(self, viewer_id: int) -> frozenset[int]:
+        visible = _visibility_cache.get(viewer_id)
+
+        if visible is None:
+            q = select(VisibleFirstNameModel.user_id).where(
+                VisibleFirstNameModel.permission_granted_for_user_id == viewer_id
+            )
+            visible = frozenset(self.session.execute(q).scalars())
+            _visibility_cache.set(viewer_id, visible)
+
+        return visible
+
+    def can_see_first_names(self, viewer_id: int, user_ids: list[int]) -> dict[int, bool]:
+        """Whether viewer_id may see the first name of each of user_ids, in at most one query"""
+        visible = self._first_names_visible_to(viewer_id)
+
+        return {
+            user_id: user_id == viewer_id or user_id in visible for user_id in user_ids
+        }
+
+
+class AsyncUserService(AsyncService):
+    service_class = UserService
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from models.user import Base, Gender, UserModel
+from models.visible_first_names import VisibleFirstNameModel
+from services.cache import LRUCache, ReadThroughCache
+from services.user import AsyncUserService
+
+
+async def _session_factory() -> async_sessionmaker:
+    engine = create_async_engine("sqlite+aiosqlite://")
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": f"User{user_id}",
+                    "gender": Gender.FEMALE,
+                }
+                for user_id in (1, 2, 3)
+            ],
+        )
+
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+def test_async_service_runs_sync_methods() -> None:
+    """Test service methods are awaitable and query through the AsyncSession"""
+
+    async def run() -> list:
+        session_factory = await _session_factory()
+
+        async with session_factory() as session:
+            svc = AsyncUserService(session, cache=ReadThroughCache(LRUCache()))
+            await svc.show_first_names(2, [1])
+            await session.commit()
+
+            return await svc.get_profile_cards(1, [2, 3])
+
+    cards = asyncio.run(run())
+
+    assert [(card.id, card.first_name) for card in cards] == [(2, "User2"), (3, None)]
+
+
+def test_async_service_passes_attributes_through() -> None:
+    """Test non-method attributes of the wrapped service are returned as is"""
+
+    async def run() -> None:
+        session_factory = await _session_factory()
+
+        async with session_factory() as session:
+            cache = ReadThroughCache(LRUCache())
+
+            assert AsyncUserService(session, cache=cache).cache is cache
+
+    asyncio.run(run())
+
+
+def test_uncommitted_session_is_rolled_back() -> None:
+    """Test writes of a request that raises before the commit are discarded"""
+
+    async def run() -> list:
+        session_factory = await _session_factory()
+
+        with pytest.raises(RuntimeError):
+            async with session_factory() as session:
+                await AsyncUserService(session).show_first_names(2, [1])
+                raise RuntimeError
+
+        async with session_factory() as session:
+            return (await session.execute(select(VisibleFirstNameModel))).all()
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,24 @@
+from benchmarks.suite import compare
+
+
+def _run(**p50s: float) -> dict:
+    return {"results": {name: {"p50_ms": p50} for name, p50 in p50s.items()}}
+
+
+def test_compare_reports_cases_slower_than_tolerance() -> None:
+    """Test only cases slower than the baseline by more than the tolerance regress"""
+    baseline = _run(login=2.0, get_user=1.0, get_messages=1.0)
+    results = _run(login=2.2, get_user=1.5, get_messages=0.5)
+
+    regressions = compare(baseline, results, tolerance=0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("get_user:")
+
+
+def test_compare_ignores_noise_and_new_cases() -> None:
+    """Test sub-threshold slowdowns of tiny cases and cases missing from the baseline pass"""
+    baseline = _run(can_see=0.02)
+    results = _run(can_see=0.04, new_case=100.0)
+
+    assert compare(baseline, results, tolerance=0.2) == []
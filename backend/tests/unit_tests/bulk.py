@@ -0,0 +1,130 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session
+
+from models.message import ConversationModel, MessageModel, UnreadCounterModel
+from models.survey import SurveyVectorModel
+from models.user import Base, Gender, UserModel
+from models.visible_first_names import VisibleFirstNameModel
+from services.bulk import BulkUserService, Progress, read_records, user_row
+from services.cache import LRUCache, ReadThroughCache
+from services.candidate_index import CandidateIndex
+from services.hashing import verify_password
+from services.message import MessageService
+from services.user import UserService
+
+
+def _record(i: int, **fields) -> dict:
+    return {
+        "username": f"user{i}",
+        "email": f"user{i}@example.com",
+        "first_name": "User",
+        "gender": "FEMALE",
+        "password": f"password{i}",
+        **fields,
+    }
+
+
+@pytest.fixture
+def session() -> Session:
+    engine = create_engine("sqlite://")
+    # Enforced the way Postgres always does
+    event.listen(engine, "connect", lambda conn, _: conn.execute("PRAGMA foreign_keys=ON"))
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def bulk_service(session: Session) -> BulkUserService:
+    user_svc = UserService(
+        session, CandidateIndex(num_questions=0, num_choices=1), ReadThroughCache(LRUCache())
+    )
+    return BulkUserService(session, workers=2, rounds=4, user_svc=user_svc)
+
+
+def test_read_records_streams_chunks(tmp_path) -> None:
+    """Test CSV and JSONL files are read in chunks of chunk_size records"""
+    (tmp_path / "users.csv").write_text("id,email\n1,a@example.com\n2,b@example.com\n3,\n")
+    (tmp_path / "users.jsonl").write_text("\n".join(json.dumps({"id": i}) for i in range(3)))
+
+    csv_chunks = list(read_records(str(tmp_path / "users.csv"), chunk_size=2))
+    jsonl_chunks = list(read_records(str(tmp_path / "users.jsonl"), chunk_size=2))
+
+    assert [len(chunk) for chunk in csv_chunks] == [2, 1]
+    assert csv_chunks[1] == [{"id": "3", "email": ""}]
+    assert [len(chunk) for chunk in jsonl_chunks] == [2, 1]
+
+
+def test_user_row_requires_profile_columns() -> None:
+    """Test a record missing a required column is rejected"""
+    assert user_row(_record(1, interested_in=""))["gender"] is Gender.FEMALE
+
+    with pytest.raises(ValueError):
+        user_row(_record(1, first_name=""))
+
+
+def test_import_users_hashes_and_inserts(bulk_service: BulkUserService, session: Session) -> None:
+    """Test every chunk is inserted, hashing plain passwords and keeping existing hashes"""
+    records = [_record(i) for i in range(5)] + [_record(5, hashed_password="old-hash")]
+    progress = Progress("import:", out=io.StringIO())
+
+    created = bulk_service.import_users([records[:4], records[4:]], progress)
+
+    users = {u.username: u for u in session.execute(select(UserModel)).scalars()}
+    assert created == 6 and progress.rows == 6
+    assert verify_password("password0", users["user0"].hashed_password)
+    assert users["user5"].hashed_password == "old-hash"
+    assert len(bulk_service.user_svc.candidate_index) == 6
+
+
+def test_import_users_can_skip_existing(bulk_service: BulkUserService, session: Session) -> None:
+    """Test re-running an import only creates the users that are missing"""
+    bulk_service.import_users([[_record(0), _record(1)]])
+
+    created = bulk_service.import_users([[_record(0), _record(1), _record(2)]], skip_existing=True)
+
+    assert created == 1
+    assert session.execute(select(func.count(UserModel.id))).scalar() == 3
+
+
+def test_deactivate_and_delete_users_in_batches(
+    bulk_service: BulkUserService, session: Session
+) -> None:
+    """Test batched IN statements count only the rows they changed"""
+    bulk_service.import_users([[_record(i) for i in range(6)]])
+
+    assert bulk_service.deactivate_users([[1, 2], [3, 99]]) == 3
+    assert bulk_service.deactivate_users([[1, 2]]) == 0
+    assert bulk_service.delete_users([[1, 4]]) == 2
+
+    active = session.execute(select(UserModel.id).where(UserModel.is_active.is_(True)))
+    assert active.scalars().all() == [5, 6]
+
+
+def test_delete_users_with_dependent_rows(bulk_service: BulkUserService, session: Session) -> None:
+    """Test deleting users takes their messages, grants and survey rows with them,
+    and takes what they sent off the other side's unread count"""
+    bulk_service.import_users([[_record(i) for i in range(3)]])
+    messages = MessageService(session)
+    messages.send_message(2, 1, "hi")
+    messages.send_message(1, 3, "hello")
+    messages.send_message(2, 3, "hey")
+    bulk_service.user_svc.show_first_names(1, [2, 3])
+    bulk_service.user_svc.show_first_names(2, [1])
+    session.add(SurveyVectorModel(user_id=1, vector=b"\x01"))
+    session.commit()
+
+    assert bulk_service.delete_users([[1]]) == 1
+
+    q = select(UnreadCounterModel.user_id, UnreadCounterModel.unread_count)
+    counters = dict(session.execute(q).all())
+    assert counters == {3: 1}
+    assert session.scalars(select(MessageModel.body)).all() == ["hey"]
+    assert session.scalar(select(func.count()).select_from(ConversationModel)) == 1
+    assert session.scalar(select(func.count()).select_from(VisibleFirstNameModel)) == 0
+    assert session.get(SurveyVectorModel, 1) is None
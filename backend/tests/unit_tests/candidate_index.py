@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from services import candidate_index as candidate_index_module
+from services.candidate_index import CandidateIndex, get_candidate_index
+
+
+@pytest.fixture
+def answers() -> np.ndarray:
+    return np.array(
+        [[1, 2, 3, 1], [1, 2, 3, 1], [3, 1, 2, 2], [3, 1, 2, 2]],
+        dtype=np.int8,
+    )
+
+
+@pytest.fixture
+def index(answers: np.ndarray) -> CandidateIndex:
+    return CandidateIndex.build(np.array([1, 2, 3, 4]), answers, num_tables=4, num_bits=6)
+
+
+def test_query_returns_identical_answers_first(
+    index: CandidateIndex, answers: np.ndarray
+) -> None:
+    """Test users with identical answers collide in every table"""
+    candidates = index.query(answers[0], limit=2)
+
+    assert set(candidates.tolist()) == {1, 2}
+
+
+def test_remove_drops_user_from_results(
+    index: CandidateIndex, answers: np.ndarray
+) -> None:
+    """Test removed users are never returned as candidates"""
+    index.remove(2)
+
+    assert 2 not in index
+    assert 2 not in index.query(answers[0], limit=4).tolist()
+
+
+def test_add_reindexes_existing_user(index: CandidateIndex, answers: np.ndarray) -> None:
+    """Test re-adding a user moves them to the buckets of their new answers"""
+    index.add([2], answers[2:3])
+
+    assert len(index) == 4
+    assert set(index.query(answers[2], limit=3).tolist()) == {2, 3, 4}
+
+
+def test_save_and_load_round_trip(
+    index: CandidateIndex, answers: np.ndarray, tmp_path
+) -> None:
+    """Test a saved index answers queries exactly like the original"""
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+
+    loaded = CandidateIndex.load(path)
+
+    assert len(loaded) == len(index)
+    assert loaded.query(answers[2], limit=4).tolist() == index.query(
+        answers[2], limit=4
+    ).tolist()
+
+
+def test_process_index_waits_for_training_and_follows_rebuilds(
+    index: CandidateIndex, answers: np.ndarray, tmp_path, monkeypatch
+) -> None:
+    """Test there's no index until the cron saves a trained one, and a rewritten
+    file is picked up without a restart"""
+    path = str(tmp_path / "index.npz")
+    monkeypatch.setattr(candidate_index_module, "CANDIDATE_INDEX_PATH", path)
+    monkeypatch.setattr(candidate_index_module, "_candidate_index", None)
+    monkeypatch.setattr(candidate_index_module, "_loaded_mtime", None)
+
+    assert get_candidate_index() is None
+
+    CandidateIndex(num_questions=0, num_choices=1).save(path)
+
+    assert get_candidate_index() is None
+
+    index.save(path)
+    os.utime(path, ns=(1, 1))
+    loaded = get_candidate_index()
+
+    assert len(loaded) == 4
+    assert get_candidate_index() is loaded
+
+    index.remove(4)
+    index.save(path)
+    os.utime(path, ns=(2, 2))
+
+    assert len(get_candidate_index()) == 3
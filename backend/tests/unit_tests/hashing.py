@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services.hashing import HashingPool
+
+
+@pytest.fixture
+def pool() -> HashingPool:
+    pool = HashingPool(workers=2, max_pending=2, rounds=4)
+    yield pool
+    pool.shutdown()
+
+
+def test_hash_and_verify(pool: HashingPool) -> None:
+    """Test a password hashed by the pool verifies, and a wrong one doesn't"""
+
+    async def run() -> tuple[bool, bool]:
+        hashed = await pool.hash("SecurePass123!")
+        return (
+            await pool.verify("SecurePass123!", hashed),
+            await pool.verify("WrongPass", hashed),
+        )
+
+    assert asyncio.run(run()) == (True, False)
+    assert pool.stats()["completed"] == 3
+    assert pool.stats()["queue_depth"] == 0
+
+
+def test_saturated_pool_fails_fast(pool: HashingPool) -> None:
+    """Test hashes past max_pending are rejected with a 503 instead of queueing"""
+
+    async def run() -> list:
+        return await asyncio.gather(
+            *(pool.hash("SecurePass123!") for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    errors = [r for r in results if isinstance(r, HTTPException)]
+
+    assert len(errors) == 1
+    assert errors[0].status_code == 503
+    assert pool.stats()["rejected"] == 1
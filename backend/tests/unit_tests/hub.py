@@ -0,0 +1,60 @@
+import asyncio
+
+from services.hub import LocalHubBackend, MessageHub
+
+
+def test_published_events_reach_connections() -> None:
+    """Test an event published for a user is delivered to each of their connections"""
+
+    async def run() -> list:
+        hub = MessageHub(LocalHubBackend())
+        await hub.start()
+        phone, laptop = hub.connect(1), hub.connect(1)
+        other = hub.connect(2)
+
+        hub.publish(1, {"type": "unread_count", "count": 1})
+        events = [await phone.get(), await laptop.get()]
+
+        assert other.queue.empty()
+        return events
+
+    assert asyncio.run(run()) == [{"type": "unread_count", "count": 1}] * 2
+
+
+def test_slow_connection_is_dropped() -> None:
+    """Test a connection that falls max_queue_size events behind is dropped"""
+
+    async def run() -> MessageHub:
+        hub = MessageHub(LocalHubBackend(), max_queue_size=2)
+        await hub.start()
+        subscription = hub.connect(1)
+
+        for count in range(3):
+            hub.deliver(1, {"type": "unread_count", "count": count})
+
+        assert subscription.dropped
+        assert [await subscription.get() for _ in range(3)][-1] is None
+        return hub
+
+    hub = asyncio.run(run())
+
+    assert hub.stats() == {"connections": 0, "delivered": 2, "dropped": 1}
+
+
+def test_publishes_are_held_until_done() -> None:
+    """Test in-flight publishes are referenced by the hub and released once sent"""
+
+    async def run() -> LocalHubBackend:
+        backend = LocalHubBackend()
+        hub = MessageHub(backend)
+        await hub.start()
+
+        hub.publish(1, {"type": "unread_count", "count": 1})
+        await asyncio.sleep(0)
+        assert len(hub._tasks) == 1
+
+        await hub.stop()
+        assert not hub._tasks
+        return backend
+
+    assert asyncio.run(run()).published == [(1, {"type": "unread_count", "count": 1})]
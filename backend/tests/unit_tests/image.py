@@ -0,0 +1,105 @@
+import io
+import os
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.dependencies import get_image_service
+from app.image import router
+from services.image import VARIANTS, ImageService, LocalImageStorage, image_key
+
+
+def _png(width: int = 800, height: int = 600) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 90)).save(out, "PNG")
+    return out.getvalue()
+
+
+@pytest.fixture
+def image_service(tmp_path) -> ImageService:
+    svc = ImageService(LocalImageStorage(str(tmp_path)), workers=1)
+    yield svc
+    svc.shutdown()
+
+
+@pytest.fixture
+def client(image_service: ImageService) -> TestClient:
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_image_service] = lambda: image_service
+    return TestClient(app)
+
+
+def test_store_is_content_addressed(image_service: ImageService) -> None:
+    """Test the same bytes are stored once, under their hash"""
+    data = _png()
+
+    digest = image_service.store(data)
+    image_service.render(digest).result()
+
+    assert image_service.store(data) == digest
+    assert image_service.stats()["uploaded"] == 1
+    assert image_service.stats()["deduplicated"] == 1
+    assert b"".join(image_service.storage.read(image_key(digest))) == data
+
+
+def test_store_renders_webp_variants_once(image_service: ImageService) -> None:
+    """Test every variant is rendered as WebP within its bounding box"""
+    digest = image_service.store(_png())
+    image_service.render(digest).result()
+
+    for variant, box in VARIANTS.items():
+        data = b"".join(image_service.storage.read(image_key(digest, variant)))
+        image = Image.open(io.BytesIO(data))
+
+        assert image.format == "WEBP"
+        assert image.width <= box[0] and image.height <= box[1]
+
+
+def test_store_rejects_non_images(image_service: ImageService) -> None:
+    """Test uploads Pillow can't identify are rejected before being stored"""
+    with pytest.raises(HTTPException) as e:
+        image_service.store(b"definitely not a png")
+
+    assert e.value.status_code == 400
+
+
+def test_get_image_serves_ranges_and_etags(
+    client: TestClient, image_service: ImageService
+) -> None:
+    """Test byte ranges are served as 206 and a matching ETag as 304"""
+    data = _png()
+    digest = image_service.store(data)
+    image_service.render(digest).result()
+
+    whole = client.get(f"/v1/images/{digest}")
+    partial = client.get(f"/v1/images/{digest}", headers={"Range": "bytes=10-19"})
+    cached = client.get(
+        f"/v1/images/{digest}", headers={"If-None-Match": whole.headers["ETag"]}
+    )
+    unsatisfiable = client.get(
+        f"/v1/images/{digest}", headers={"Range": f"bytes={len(data)}-"}
+    )
+
+    assert whole.content == data and whole.headers["content-type"] == "image/png"
+    assert partial.status_code == 206 and partial.content == data[10:20]
+    assert partial.headers["Content-Range"] == f"bytes 10-19/{len(data)}"
+    assert cached.status_code == 304
+    assert unsatisfiable.status_code == 416
+
+
+def test_get_image_falls_back_until_variant_is_rendered(
+    client: TestClient, image_service: ImageService
+) -> None:
+    """Test a variant requested before it's rendered serves the original, briefly cached"""
+    data = _png()
+    digest = image_service.store(data)
+    image_service.render(digest).result()
+    os.remove(image_service.storage._path(image_key(digest, "thumb")))
+
+    response = client.get(f"/v1/images/{digest}", params={"variant": "thumb"})
+
+    assert response.content == data
+    assert "immutable" not in response.headers["Cache-Control"]
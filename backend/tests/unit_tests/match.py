@@ -0,0 +1,369 @@
+import os
+from datetime import date
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from crons.match import (
+    iter_incremental_matches,
+    iter_matches,
+    iter_sharded_matches,
+    load_current_run,
+    load_features,
+    save_features,
+)
+from models.daily_match import DailyMatchModel
+from models.profile_change import ProfileChangeKind, ProfileChangeModel
+from models.survey import SurveyVectorModel
+from models.user import Base, Gender, UserModel
+from schema.profile import ProfileSchema
+from services.cache import LRUCache
+from services.compatibility import ANY_GENDER, MatchFeatures, top_k
+from services.match import MatchRunWriter, MatchService
+from services.candidate_index import CandidateIndex
+from services.profile_changes import pending_changes
+from services.search_index import SearchIndex
+from services.user import UserService
+
+
+@pytest.fixture
+def features() -> MatchFeatures:
+    return MatchFeatures(
+        user_ids=np.array([10, 20, 30, 40], dtype=np.int64),
+        genders=np.array([0, 1, 0, 1], dtype=np.int8),
+        interested_in=np.array([1, 0, ANY_GENDER, 0], dtype=np.int8),
+        answers=np.array(
+            [[1, 2, 3], [1, 2, 3], [1, 2, 0], [3, 1, 2]],
+            dtype=np.int8,
+        ),
+    )
+
+
+def test_top_k_orders_best_first() -> None:
+    """Test top_k returns the k best columns of each row in descending order"""
+    scores = np.array([[0.1, 0.9, 0.5, 0.7]])
+
+    idx, best = top_k(scores, 2)
+
+    assert idx.tolist() == [[1, 3]]
+    assert best.tolist() == [[0.9, 0.7]]
+
+
+def test_iter_matches_respects_gender_preferences(features: MatchFeatures) -> None:
+    """Test users are only matched when both gender preferences allow it"""
+    pairs = {
+        (user_id, match_user_id)
+        for chunk in iter_matches(features, k=3, block_size=2)
+        for user_id, match_user_id, _, _ in chunk.rows()
+    }
+
+    assert pairs == {
+        (10, 20),
+        (10, 40),
+        (20, 10),
+        (20, 30),
+        (30, 20),
+        (30, 40),
+        (40, 10),
+        (40, 30),
+    }
+
+
+def test_iter_matches_ranks_by_agreement(features: MatchFeatures) -> None:
+    """Test the user with identical answers is ranked first"""
+    rows = [row for chunk in iter_matches(features, k=3) for row in chunk.rows()]
+
+    assert rows[0] == (10, 20, 1, 1.0)
+    assert rows[1][:3] == (10, 40, 2)
+
+
+def test_iter_matches_counts_every_scored_pair(features: MatchFeatures) -> None:
+    """Test every block reports the number of pairs it scored"""
+    chunks = list(iter_matches(features, k=1, block_size=3))
+
+    assert [chunk.pairs_scored for chunk in chunks] == [12, 4]
+
+
+def test_sharded_matches_equal_inline_matches(
+    features: MatchFeatures, tmp_path
+) -> None:
+    """Test sharding across processes produces the same matches as a single process"""
+    save_features(features, str(tmp_path))
+
+    sharded = iter_sharded_matches(str(tmp_path), workers=2, k=2, shard_size=3)
+    inline = iter_matches(features, k=2)
+
+    assert [row for chunk in sharded for row in chunk.rows()] == [
+        row for chunk in inline for row in chunk.rows()
+    ]
+
+
+def test_sharded_matches_resume_from_checkpoint(
+    features: MatchFeatures, tmp_path
+) -> None:
+    """Test only shards missing a checkpoint are recomputed on a re-run"""
+    save_features(features, str(tmp_path))
+    list(iter_sharded_matches(str(tmp_path), workers=1, k=2, shard_size=2))
+
+    checkpointed = tmp_path / "shard-00000.npz"
+    mtime = os.path.getmtime(checkpointed)
+    os.remove(tmp_path / "shard-00001.npz")
+
+    chunks = list(iter_sharded_matches(str(tmp_path), workers=1, k=2, shard_size=2))
+
+    assert len(chunks) == 2
+    assert os.path.getmtime(checkpointed) == mtime
+
+    with pytest.raises(ValueError):
+        iter_sharded_matches(str(tmp_path), workers=1, k=3, shard_size=2)
+
+
+@pytest.fixture
+def match_service() -> MatchService:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": "User",
+                    "gender": Gender.FEMALE,
+                }
+                for user_id in (1, 2, 3, 4)
+            ],
+        )
+        session.execute(
+            insert(SurveyVectorModel),
+            [
+                {"user_id": 1, "vector": bytes([1, 2, 3, 1])},
+                {"user_id": 2, "vector": bytes([1, 2, 3, 2])},
+                {"user_id": 3, "vector": bytes([1, 1, 1])},
+            ],
+        )
+        yield MatchService(session, cache=LRUCache())
+
+
+def test_get_scores_scores_submitted_users(match_service: MatchService) -> None:
+    """Test scores are the share of agreeing answers, None for users without a vector"""
+    scores = match_service.get_scores(1, [2, 3, 4])
+
+    assert scores == {2: 0.75, 3: pytest.approx(1 / 3), 4: None}
+    assert match_service.get_score(4, 1) is None
+
+
+def test_pairs_with_no_answers_in_common_have_no_score(match_service: MatchService) -> None:
+    """Test a pair with nothing answered in common scores None, not 0.0, cached or not"""
+    match_service.session.execute(
+        insert(SurveyVectorModel), [{"user_id": 4, "vector": bytes([0, 0, 0, 3])}]
+    )
+
+    assert match_service.get_scores(4, [1, 3]) == {1: 0.0, 3: None}
+    assert match_service.get_scores(4, [1, 3]) == {1: 0.0, 3: None}
+
+
+def test_get_scores_memoizes_by_vector_version(match_service: MatchService) -> None:
+    """Test a pair is served from the cache, in either order, until a vector changes"""
+    survey_svc = match_service.survey_svc
+    survey_svc.get_answer_matrix = MagicMock(wraps=survey_svc.get_answer_matrix)
+
+    assert match_service.get_score(1, 2) == match_service.get_score(2, 1) == 0.75
+    assert survey_svc.get_answer_matrix.call_count == 1
+
+    match_service.session.get(SurveyVectorModel, 2).version = 2
+    match_service.session.flush()
+    match_service.get_score(1, 2)
+
+    assert survey_svc.get_answer_matrix.call_count == 2
+
+
+def test_signed_up_user_is_matched_once_gender_is_set(tmp_path) -> None:
+    """Test an account created without a gender joins the match cron's input
+    once its profile edit sets one"""
+    engine = create_engine(f"sqlite:///{tmp_path}/matches.db")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        svc = UserService(
+            session, candidate_index=CandidateIndex(0, 1), search_index=SearchIndex()
+        )
+        user_id = svc.create_user("new@example.com", "hashed_password")
+        session.commit()
+
+        assert user_id not in load_features(session).user_ids
+
+        svc.edit_user(
+            user_id,
+            ProfileSchema(
+                username="new",
+                password="password",
+                email="new@example.com",
+                first_name="New",
+                about="",
+                gender=Gender.FEMALE,
+                interested_in=Gender.MALE,
+            ),
+        )
+        session.commit()
+        features = load_features(session)
+
+        assert features.user_ids.tolist() == [user_id]
+        assert session.get(UserModel, user_id).interested_in == Gender.MALE
+
+
+def test_match_runs_are_served_only_once_published(features: MatchFeatures, tmp_path) -> None:
+    """Test /today pages through the published run, and a run being written stays hidden"""
+    engine = create_engine(f"sqlite:///{tmp_path}/matches.db")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(engine)
+    svc = MatchService(session_factory(), cache=LRUCache())
+
+    assert svc.get_todays_matches(10) == {"match_date": None, "matches": [], "next_cursor": None}
+
+    first = MatchRunWriter(session_factory, date(2024, 1, 1), 2)
+    first.start()
+    for chunk in iter_matches(features, k=2, block_size=2):
+        first.write(chunk.user_ids, chunk.match_user_ids, chunk.ranks, chunk.scores)
+    first.publish()
+
+    page = svc.get_todays_matches(10, limit=1)
+    rest = svc.get_todays_matches(10, after_rank=page["next_cursor"], limit=1)
+
+    assert page["match_date"] == date(2024, 1, 1)
+    assert [m["rank"] for m in page["matches"] + rest["matches"]] == [1, 2]
+
+    second = MatchRunWriter(session_factory, date(2024, 1, 2), 2)
+    second.start()
+    second.write(np.array([10]), np.array([40]), np.array([1]), np.array([0.5]))
+
+    assert svc.get_todays_matches(10)["match_date"] == date(2024, 1, 1)
+
+    second.publish()
+    svc.session.close()
+
+    assert svc.get_todays_matches(10)["matches"] == [
+        {"rank": 1, "match_user_id": 40, "score": 0.5}
+    ]
+    assert svc.session.scalar(select(func.count()).select_from(DailyMatchModel)) == 1
+
+
+def test_publish_leaves_newer_runs_alone(tmp_path) -> None:
+    """Test publishing a run keeps the matches of a later run still being
+    written, and never takes the pointer back from a later published run"""
+    engine = create_engine(f"sqlite:///{tmp_path}/matches.db")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(engine)
+    svc = MatchService(session_factory(), cache=LRUCache())
+    writers = [MatchRunWriter(session_factory, date(2024, 1, 1), 1) for _ in range(3)]
+
+    for match_user_id, writer in enumerate(writers, start=40):
+        writer.start()
+        writer.write(np.array([10]), np.array([match_user_id]), np.array([1]), np.array([0.5]))
+
+    writers[0].publish()
+
+    assert svc.get_todays_matches(10)["matches"][0]["match_user_id"] == 40
+    assert svc.session.scalar(select(func.count()).select_from(DailyMatchModel)) == 3
+
+    svc.session.close()
+    writers[2].publish()
+    writers[1].publish()
+
+    assert svc.get_todays_matches(10)["matches"][0]["match_user_id"] == 42
+    assert svc.session.scalar(select(func.count()).select_from(DailyMatchModel)) == 1
+
+
+def test_publish_consumes_only_the_changes_the_run_read(tmp_path) -> None:
+    """Test a change committed after the run read the log, even one with a lower
+    id, is left for the next run"""
+    engine = create_engine(f"sqlite:///{tmp_path}/matches.db")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(engine)
+
+    def log(change_id: int, user_id: int) -> None:
+        with session_factory() as session:
+            session.add(
+                ProfileChangeModel(id=change_id, user_id=user_id, kind=ProfileChangeKind.EDITED)
+            )
+            session.commit()
+
+    log(1, 10)
+    log(3, 30)
+    log(4, 30)
+
+    with session_factory() as session:
+        change_ids, changed = pending_changes(session)
+
+    assert (change_ids, changed) == ([1, 3, 4], [10, 30])
+
+    log(2, 20)
+    log(5, 40)
+    writer = MatchRunWriter(session_factory, date(2024, 1, 1), 1, change_ids)
+    writer.start()
+    writer.publish()
+
+    with session_factory() as session:
+        assert pending_changes(session) == ([2, 5], [20, 40])
+
+
+def _lists(chunks) -> dict[int, list[float]]:
+    """Each user's match scores in rank order, which ties can't reorder"""
+    lists: dict[int, list[float]] = {}
+    rows = sorted((r for c in chunks for r in c.rows()), key=lambda r: (r[0], r[2]))
+
+    for user_id, _, _, score in rows:
+        lists.setdefault(user_id, []).append(round(score, 6))
+
+    return lists
+
+
+def test_incremental_run_matches_full_rebuild(tmp_path) -> None:
+    """Test re-scoring only the users a change affects gives the lists a full rebuild would"""
+    rng = np.random.default_rng(0)
+    num_users = 300
+    before = MatchFeatures(
+        user_ids=np.arange(1, num_users + 1, dtype=np.int64),
+        genders=rng.integers(0, 2, num_users).astype(np.int8),
+        interested_in=rng.choice([0, 1, ANY_GENDER], num_users).astype(np.int8),
+        answers=rng.integers(0, 5, (num_users, 20)).astype(np.int8),
+    )
+
+    engine = create_engine(f"sqlite:///{tmp_path}/matches.db")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(engine)
+    writer = MatchRunWriter(session_factory, date(2024, 1, 1), 5)
+    writer.start()
+    for chunk in iter_matches(before, k=5, block_size=64):
+        writer.write(chunk.user_ids, chunk.match_user_ids, chunk.ranks, chunk.scores)
+    writer.publish()
+
+    # Ten users re-answer the survey, one deactivates and one signs up
+    changed = rng.choice(before.user_ids[:-1], 11, replace=False)
+    answers = before.answers.copy()
+    answers[changed[:10] - 1] = rng.integers(0, 5, (10, 20))
+    active = before.user_ids != changed[10]
+    after = MatchFeatures(
+        user_ids=np.append(before.user_ids[active], num_users + 1),
+        genders=np.append(before.genders[active], 0).astype(np.int8),
+        interested_in=np.append(before.interested_in[active], ANY_GENDER).astype(np.int8),
+        answers=np.vstack([answers[active], rng.integers(0, 5, (1, 20))]).astype(np.int8),
+    )
+    changed = np.append(changed, num_users + 1)
+
+    with session_factory() as session:
+        run, previous = load_current_run(session)
+
+    assert run.top_k == 5 and len(previous) == writer.num_matches
+
+    incremental = list(iter_incremental_matches(after, previous, changed, k=5, block_size=64))
+
+    assert _lists(incremental) == _lists(iter_matches(after, k=5, block_size=64))
+    assert sum(c.pairs_scored for c in incremental) < num_users * num_users / 2
@@ -0,0 +1,181 @@
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from crons.unread_counters import reconcile
+from models.message import MessageModel, UnreadCounterModel
+from models.user import Base, Gender, UserModel
+from services import hub, message
+from services.message import MessageService
+
+
+@pytest.fixture
+def session() -> Session:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": "User",
+                    "gender": Gender.FEMALE,
+                }
+                for user_id in (1, 2, 3)
+            ],
+        )
+        yield session
+
+
+@pytest.fixture
+def message_service(session: Session) -> MessageService:
+    message._unread_cache.clear()
+    return MessageService(session)
+
+
+def test_get_messages_pages_with_cursor(message_service: MessageService) -> None:
+    """Test walking the inbox with cursors returns every message once, newest first"""
+    sent = [message_service.send_message(2, 1, f"hi {i}") for i in range(5)]
+
+    first = message_service.get_messages(1, limit=2)
+    second = message_service.get_messages(1, first["next_cursor"], limit=2)
+    third = message_service.get_messages(1, second["next_cursor"], limit=2)
+
+    ids = [m.id for page in (first, second, third) for m in page["messages"]]
+    assert ids == sorted(sent, reverse=True)
+    assert third["next_cursor"] is None
+
+
+def test_get_messages_rejects_invalid_cursor(message_service: MessageService) -> None:
+    """Test a malformed cursor is a 400"""
+    with pytest.raises(HTTPException) as exc:
+        message_service.get_messages(1, "not-a-cursor")
+
+    assert exc.value.status_code == 400
+
+
+def test_send_message_reuses_conversation(message_service: MessageService) -> None:
+    """Test both directions of a pair share one conversation"""
+    message_service.send_message(1, 2, "hi")
+    message_service.send_message(2, 1, "hello")
+
+    inbox_1 = message_service.get_messages(1)["messages"]
+    inbox_2 = message_service.get_messages(2)["messages"]
+
+    assert inbox_1[0].conversation_id == inbox_2[0].conversation_id
+
+
+def test_reply_goes_back_to_sender(
+    message_service: MessageService, session: Session
+) -> None:
+    """Test a reply is addressed to the original sender in the same conversation"""
+    message_id = message_service.send_message(2, 1, "hi")
+
+    message_service.reply(1, message_id, "hello")
+
+    reply = message_service.get_messages(2)["messages"][0]
+    assert (reply.sender_id, reply.body) == (1, "hello")
+    assert reply.conversation_id == session.get(MessageModel, message_id).conversation_id
+
+
+def test_reply_to_someone_elses_message(message_service: MessageService) -> None:
+    """Test replying to a message the user did not receive is a 404"""
+    message_id = message_service.send_message(2, 1, "hi")
+
+    with pytest.raises(HTTPException) as exc:
+        message_service.reply(3, message_id, "hello")
+
+    assert exc.value.status_code == 404
+
+
+def test_mark_message_as_seen(
+    message_service: MessageService, session: Session
+) -> None:
+    """Test only the recipient can mark a message as seen"""
+    message_id = message_service.send_message(2, 1, "hi")
+
+    message_service.mark_message_as_seen(2, message_id)
+    assert session.get(MessageModel, message_id).seen_at is None
+
+    message_service.mark_message_as_seen(1, message_id)
+    session.expire_all()
+    assert session.get(MessageModel, message_id).seen_at is not None
+
+
+def test_unread_counter_follows_writes(message_service: MessageService) -> None:
+    """Test sends and replies increment the counter, seen and deletes decrement it"""
+    first = message_service.send_message(2, 1, "hi")
+    second = message_service.send_message(3, 1, "hey")
+    message_service.reply(1, first, "hello")
+
+    assert message_service.get_num_of_unread_messages(1) == 2
+    assert message_service.get_num_of_unread_messages(2) == 1
+
+    message_service.mark_message_as_seen(1, first)
+    message_service.mark_message_as_seen(1, first)
+    assert message_service.get_num_of_unread_messages(1) == 1
+
+    message_service.delete_message_(1, first)
+    assert message_service.get_num_of_unread_messages(1) == 1
+
+    message_service.delete_message_(1, second)
+    assert message_service.get_num_of_unread_messages(1) == 0
+
+
+def test_unread_count_read_before_rollback_is_not_cached(
+    message_service: MessageService, session: Session
+) -> None:
+    """Test a count cached from uncommitted writes is dropped when they roll back"""
+    message_service.send_message(2, 1, "rolled back")
+
+    assert message_service.get_num_of_unread_messages(1) == 1
+
+    session.rollback()
+
+    assert message_service.get_num_of_unread_messages(1) == 0
+
+
+def test_reconcile_repairs_drift(
+    message_service: MessageService, session: Session
+) -> None:
+    """Test the reconciliation cron repairs wrong and missing counters"""
+    message_service.send_message(2, 1, "hi")
+    message_service.send_message(1, 2, "hi")
+    session.execute(update(UnreadCounterModel).values(unread_count=7))
+    session.execute(delete(UnreadCounterModel).where(UnreadCounterModel.user_id == 2))
+
+    assert reconcile(session) == (1, 1)
+
+    q = select(UnreadCounterModel.user_id, UnreadCounterModel.unread_count)
+    counts = dict(session.execute(q).all())
+    assert counts == {1: 1, 2: 1}
+
+
+def test_events_are_published_only_after_commit(
+    message_service: MessageService, session: Session, monkeypatch
+) -> None:
+    """Test message and unread events go out on commit and are dropped on rollback"""
+    mock_hub = MagicMock()
+    monkeypatch.setattr(hub, "_message_hub", mock_hub)
+
+    message_service.send_message(2, 1, "rolled back")
+    session.rollback()
+    message_service.send_message(2, 1, "hi")
+    mock_hub.publish.assert_not_called()
+
+    session.commit()
+
+    events = [call.args for call in mock_hub.publish.call_args_list]
+    assert [(user_id, event["type"]) for user_id, event in events] == [
+        (1, "message"),
+        (1, "unread_count"),
+    ]
+    assert events[0][1]["body"] == "hi"
@@ -0,0 +1,84 @@
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.metrics import MetricsMiddleware
+from services.metrics import Histogram, RequestMetrics
+
+
+def _app(metrics: RequestMetrics, **kwargs) -> FastAPI:
+    engine = create_engine("sqlite://")
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, metrics=metrics, **kwargs)
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        with engine.connect() as connection:
+            for _ in range(item_id):
+                connection.execute(text("select 1"))
+
+        return {"id": item_id}
+
+    @app.get("/slow")
+    def slow():
+        time.sleep(0.05)
+
+    return app
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    """Test each bucket counts every observation up to its bound"""
+    histogram = Histogram((0.1, 1.0))
+
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [("0.1", 1), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.sum == 6.05
+
+
+def test_middleware_records_latency_and_queries_by_route() -> None:
+    """Test requests are grouped by route template and their queries are counted"""
+    metrics = RequestMetrics()
+    client = TestClient(_app(metrics))
+
+    client.get("/items/2")
+    client.get("/items/3")
+    client.get("/nowhere")
+
+    assert metrics.latency["GET", "/items/{item_id}", "200"].count == 2
+    assert metrics.latency["GET", "unmatched", "404"].count == 1
+    assert metrics.queries["GET", "/items/{item_id}"].sum == 5
+    assert metrics.in_flight == 0
+
+    rendered = metrics.render()
+    assert 'pair_http_request_db_queries_sum{method="GET",route="/items/{item_id}"} 5' in rendered
+    assert "pair_http_requests_in_flight 0" in rendered
+
+
+def test_registered_stats_are_exported_as_gauges() -> None:
+    """Test numeric service stats become gauges and anything else is skipped"""
+    metrics = RequestMetrics()
+    metrics.register_stats("cache", lambda: {"hits": 3, "label": "ignored"})
+
+    assert "pair_cache_hits 3.0" in metrics.render()
+    assert "label" not in metrics.render()
+
+
+def test_slow_requests_dump_collapsed_stacks(tmp_path) -> None:
+    """Test a request over the threshold leaves a flamegraph-ready stack file"""
+    app = _app(RequestMetrics(), slow_request_seconds=0.02, profile_dir=str(tmp_path))
+    client = TestClient(app)
+
+    client.get("/items/0")
+    client.get("/slow")
+
+    (dump,) = os.listdir(tmp_path)
+    lines = (tmp_path / dump).read_text().splitlines()
+
+    assert "GET_slow" in dump
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("metrics.py:slow" in line for line in lines)
@@ -0,0 +1,113 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+from crons.match import notify
+from models.email_outbox import EmailOutboxModel, EmailStatus
+from models.user import Base, Gender, UserModel
+from services.outbox import (
+    EmailOutbox,
+    EmailSender,
+    LocalEmailTransport,
+    registration_confirmation,
+)
+
+
+@pytest.fixture
+def session_factory(tmp_path) -> sessionmaker:
+    engine = create_engine(f"sqlite:///{tmp_path}/outbox.db")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(engine)
+
+    with factory() as session:
+        session.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": "User",
+                    "gender": Gender.FEMALE,
+                    "is_active": user_id != 3,
+                }
+                for user_id in (1, 2, 3)
+            ],
+        )
+        session.commit()
+
+    return factory
+
+
+@pytest.fixture
+def transport() -> LocalEmailTransport:
+    return LocalEmailTransport()
+
+
+def _statuses(session: Session) -> dict[str, EmailStatus]:
+    q = select(EmailOutboxModel.recipient, EmailOutboxModel.status)
+
+    return dict(session.execute(q).all())
+
+
+def test_queued_emails_are_sent_in_one_batch(
+    session_factory: sessionmaker, transport: LocalEmailTransport
+) -> None:
+    """Test match notifications reach active users only, over one connection"""
+    with session_factory() as session:
+        assert notify(session, {1, 2, 3}) == 2
+        session.commit()
+
+    sender = EmailSender(session_factory, transport, batch_size=10)
+
+    assert sender.send_batch() == 2
+    assert sender.send_batch() == 0
+    assert sorted(m["To"] for m in transport.sent) == ["user1@example.com", "user2@example.com"]
+    assert transport.connections == 1
+
+    with session_factory() as session:
+        assert set(_statuses(session).values()) == {EmailStatus.SENT}
+
+
+def test_failures_are_retried_with_backoff(
+    session_factory: sessionmaker, transport: LocalEmailTransport
+) -> None:
+    """Test a dropped connection is retried later, and a refused address given up on"""
+    with session_factory() as session:
+        EmailOutbox(session).enqueue_many(
+            [
+                registration_confirmation("flaky@example.com"),
+                registration_confirmation("bad@example.com"),
+            ]
+        )
+        session.commit()
+
+    transport.fail_next = 1
+    transport.failing_recipients.add("bad@example.com")
+    sender = EmailSender(session_factory, transport, backoff_seconds=60)
+
+    assert sender.send_batch() == 2
+    # Backing off, so nothing is due yet
+    assert sender.send_batch() == 0
+
+    with session_factory() as session:
+        flaky = session.scalars(
+            select(EmailOutboxModel).where(EmailOutboxModel.recipient == "flaky@example.com")
+        ).one()
+        assert flaky.status == EmailStatus.PENDING and flaky.attempts == 1
+        assert flaky.send_after > datetime.utcnow()
+
+        session.execute(update(EmailOutboxModel).values(send_after=datetime.utcnow()))
+        session.commit()
+
+    assert sender.send_batch() == 1
+    assert sender.stats() == {"sent": 1, "retried": 1, "failed": 1, "batches": 2}
+
+    with session_factory() as session:
+        assert _statuses(session) == {
+            "flaky@example.com": EmailStatus.SENT,
+            "bad@example.com": EmailStatus.FAILED,
+        }
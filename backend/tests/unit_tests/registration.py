@@ -1,73 +1,71 @@
-from unittest.mock import MagicMock
+from typing import Generator
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from services.registration import RegisterationService
 
-from ...app.main import app
+from app.dependencies import get_registration_service
+from app.main import app
+from schema.registration import RegistrationSchema
 
 client = TestClient(app)
 
-mock_db = MagicMock()
-
-svc = RegisterationService(mock_db)
+svc = MagicMock()
+svc.sign_up = AsyncMock(return_value=None)
 
 
 @pytest.fixture
-def reset_mocks() -> None:
-    """Reset mock call history before each test."""
-    mock_db.reset_mock()
+def reset_mocks() -> Generator[None, None, None]:
+    """Reset mock call history before each test, and route sign ups to the mock."""
     svc.reset_mock()
+    svc.sign_up.side_effect = None
+    app.dependency_overrides[get_registration_service] = lambda: svc
+    yield
+    app.dependency_overrides.pop(get_registration_service, None)
 
 
 def test_user_signup_success(reset_mocks) -> None:
     """Test successful user signup."""
-    svc.user_exists.return_value = False
-
     response = client.post(
-        "/",
+        "/v1/register/",
         json={
             "email": "testuser@example.com",
-            "password": "SecurePass123!",
-            "confirm_password": "SecurePass123!",
+            "password1": "SecurePass123!",
+            "password2": "SecurePass123!",
         },
     )
 
     assert response.status_code == 200
+    svc.sign_up.assert_awaited_once_with(
+        RegistrationSchema(
+            email="testuser@example.com",
+            password1="SecurePass123!",
+            password2="SecurePass123!",
+        )
+    )
 
-    svc.user_exists.assert_called_once_with("testuser@example.com")
-    svc.create_user.assert_called_once()
 
+def test_user_signup_rejected(reset_mocks) -> None:
+    """Test signup failure when the service rejects it, e.g. passwords that don't match."""
+    svc.sign_up.side_effect = HTTPException(status_code=400, detail="Passwords do not match")
 
-def test_user_signup_password_mismatch(reset_mocks) -> None:
-    """Test signup failure when passwords do not match."""
     response = client.post(
-        "/",
+        "/v1/register/",
         json={
             "email": "testuser@example.com",
-            "password": "SecurePass123!",
-            "confirm_password": "WrongPass",
+            "password1": "SecurePass123!",
+            "password2": "WrongPass",
         },
     )
 
     assert response.status_code == 400
     assert response.json()["detail"] == "Passwords do not match"
-    svc.create_user.assert_not_called()
 
 
-def test_user_signup_existing_user(reset_mocks) -> None:
-    """Test signup failure when user already exists."""
-    svc.user_exists.return_value = True
+def test_user_signup_incomplete(reset_mocks) -> None:
+    """Test signup failure when a field is missing, before the service is called."""
+    response = client.post("/v1/register/", json={"email": "testuser@example.com"})
 
-    response = client.post(
-        "/",
-        json={
-            "email": "existinguser@example.com",
-            "password": "SecurePass123!",
-            "confirm_password": "SecurePass123!",
-        },
-    )
-
-    assert response.status_code == 400
-    assert response.json()["detail"] == "User already exists"
-    svc.create_user.assert_not_called()
+    assert response.status_code == 422
+    svc.sign_up.assert_not_called()
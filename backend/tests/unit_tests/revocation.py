@@ -0,0 +1,117 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import sessionmaker
+
+from models.revoked_token import RevokedTokenModel
+from models.user import Base
+from services.revocation import BloomFilter, RevocationStore, delete_expired
+
+
+@pytest.fixture
+def session_factory(tmp_path) -> sessionmaker:
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine, tables=[RevokedTokenModel.__table__])
+
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def store(session_factory: sessionmaker) -> RevocationStore:
+    return RevocationStore(session_factory, token_lifetime_seconds=3600, capacity=1000)
+
+
+def _revoke(store: RevocationStore, session_factory: sessionmaker, jti: str) -> None:
+    with session_factory() as session:
+        store.revoke(session, jti, datetime.utcnow() + timedelta(hours=1))
+        session.commit()
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    """Test every added key is reported as present"""
+    bloom = BloomFilter(capacity=1000)
+    keys = [uuid.uuid4().hex for _ in range(1000)]
+
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+
+
+def test_unrevoked_token_skips_the_table(
+    store: RevocationStore, session_factory: sessionmaker
+) -> None:
+    """Test a token missing from the filter never causes a table lookup"""
+    _revoke(store, session_factory, "revoked")
+
+    assert store.is_revoked("not-revoked") is False
+    assert store.filter_hits == 0
+
+
+def test_revoked_token_is_revoked(
+    store: RevocationStore, session_factory: sessionmaker
+) -> None:
+    """Test a revoked token is confirmed by the table after a filter hit"""
+    _revoke(store, session_factory, "revoked")
+
+    assert store.is_revoked("revoked") is True
+    assert store.filter_hits == 1
+
+
+def test_refresh_picks_up_revocations_from_other_processes(
+    store: RevocationStore, session_factory: sessionmaker
+) -> None:
+    """Test revocations written by another store are loaded on refresh"""
+    other = RevocationStore(session_factory, token_lifetime_seconds=3600, capacity=1000)
+    _revoke(other, session_factory, "revoked-elsewhere")
+
+    store.refresh()
+
+    assert store.is_revoked("revoked-elsewhere") is True
+
+
+def test_refresh_picks_up_revocations_committed_out_of_order(
+    session_factory: sessionmaker,
+) -> None:
+    """Test a revocation given a lower id but committed after a refresh read a
+    higher one is still loaded, from the window re-read below the watermark"""
+    store = RevocationStore(
+        session_factory, token_lifetime_seconds=3600, capacity=1000, commit_lag_seconds=60
+    )
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+
+    with session_factory() as session:
+        session.add(RevokedTokenModel(id=1, jti="committed-late", expires_at=expires_at))
+        session.add(RevokedTokenModel(id=2, jti="committed-first", expires_at=expires_at))
+        session.commit()
+
+    with session_factory() as session:
+        session.execute(delete(RevokedTokenModel).where(RevokedTokenModel.id == 1))
+        session.commit()
+
+    store.refresh()
+
+    with session_factory() as session:
+        session.add(RevokedTokenModel(id=1, jti="committed-late", expires_at=expires_at))
+        session.commit()
+
+    store.refresh()
+
+    assert any("committed-late" in bloom for bloom in store._filters)
+
+
+def test_delete_expired_keeps_live_revocations(session_factory: sessionmaker) -> None:
+    """Test the cleanup only removes revocations of tokens that have expired"""
+    now = datetime.utcnow()
+
+    with session_factory() as session:
+        session.add(RevokedTokenModel(jti="expired", expires_at=now - timedelta(minutes=1)))
+        session.add(RevokedTokenModel(jti="live", expires_at=now + timedelta(hours=1)))
+        session.commit()
+
+        assert delete_expired(session) == 1
+        session.commit()
+
+        assert session.scalars(select(RevokedTokenModel.jti)).all() == ["live"]
@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models.user import Base, Gender
+from schema.profile import ProfileSchema
+from services.candidate_index import CandidateIndex
+from services.search_index import SearchIndex
+from services.user import UserService
+
+
+@pytest.fixture
+def index() -> SearchIndex:
+    return SearchIndex.build(
+        [
+            (1, "Anna", "Climbing and jazz on weekends"),
+            (2, "annabel", "Jazz pianist, climbing sometimes"),
+            (3, "bob", "Jazz, jazz and more jazz"),
+            (4, "anne", None),
+            (5, "carl", "Hiking, climbing"),
+        ]
+    )
+
+
+def test_username_prefix_matches_rank_first(index: SearchIndex) -> None:
+    """Test an exact username leads, then longer usernames, then about matches"""
+    assert index.search("anna") == [1, 2]
+    assert index.search("ANN") == [1, 2, 4]
+    # Nobody's username starts with it, and all three use it, so ties go by id
+    assert index.search("climbing") == [1, 2, 5]
+
+
+def test_keywords_must_all_match_with_last_as_prefix(index: SearchIndex) -> None:
+    """Test every word has to match, the last one as the prefix being typed"""
+    assert sorted(index.search("jazz clim")) == [1, 2]
+    assert sorted(index.search("jaz")) == [1, 2, 3]
+    assert index.search("hik") == [5]
+    assert index.search("jazz hiking") == []
+
+
+def test_pages_continue_where_the_last_left_off(index: SearchIndex) -> None:
+    """Test pages tile the ranked results across the username and keyword parts"""
+    everything = index.search("jazz", limit=10)
+
+    assert [index.search("jazz", offset, 1)[0] for offset in range(3)] == everything
+    assert index.search("jazz", 3, 1) == []
+
+
+def test_updates_follow_the_users_table(tmp_path) -> None:
+    """Test the index picks up creates, edits and deactivations once they commit"""
+    engine = create_engine(f"sqlite:///{tmp_path}/search.db")
+    Base.metadata.create_all(engine)
+    index = SearchIndex()
+
+    with Session(engine) as session:
+        svc = UserService(session, candidate_index=CandidateIndex(0, 1), search_index=index)
+        user_ids = svc.create_users(
+            [
+                {
+                    "username": username,
+                    "email": f"{username}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": username.title(),
+                    "gender": Gender.FEMALE,
+                    "about": about,
+                }
+                for username, about in (("dana", "sailing"), ("dave", "chess"))
+            ]
+        )
+
+        assert index.search("da") == []
+
+        session.commit()
+
+        assert index.search("da") == user_ids
+
+        svc.deactivate_account(user_ids[0])
+        session.rollback()
+
+        assert index.search("sail") == [user_ids[0]]
+
+        svc.deactivate_account(user_ids[0])
+        session.commit()
+
+        assert index.search("da") == [user_ids[1]]
+        assert index.search("sailing") == []
+        assert user_ids[0] not in index
+
+        svc.edit_user(
+            user_ids[1],
+            ProfileSchema(
+                username="dave",
+                password="password",
+                email="dave@example.com",
+                first_name="Dave",
+                about="Chess and sailing",
+            ),
+        )
+        session.commit()
+
+        assert index.search("sailing") == [user_ids[1]]
+        assert index.search("chess") == [user_ids[1]]
+
+
+def test_renaming_replaces_the_indexed_username(tmp_path) -> None:
+    """Test a user picking a username is found by it, and only by it, and a
+    taken username is refused"""
+    engine = create_engine(f"sqlite:///{tmp_path}/search.db")
+    Base.metadata.create_all(engine)
+    index = SearchIndex()
+
+    with Session(engine) as session:
+        svc = UserService(session, candidate_index=CandidateIndex(0, 1), search_index=index)
+        taken = svc.create_user("taken@example.com", "hashed_password", "erin")
+        user_id = svc.create_user("frank@example.com", "hashed_password")
+        session.commit()
+
+        placeholder = svc.get_user(user_id).username
+        profile = ProfileSchema(
+            username="frank",
+            password="password",
+            email="frank@example.com",
+            first_name="Frank",
+            about="Chess",
+        )
+        svc.edit_user(user_id, profile)
+        session.commit()
+
+        assert index.search("frank") == [user_id]
+        assert index.search(placeholder) == []
+
+        with pytest.raises(HTTPException) as e:
+            svc.edit_user(user_id, profile.model_copy(update={"username": "erin"}))
+
+        assert e.value.status_code == 400
+        assert index.search("erin") == [taken]
+
+
+@pytest.mark.parametrize("merge_threshold", [1, 7, 1000])
+def test_updates_search_like_a_fresh_build(monkeypatch, merge_threshold: int) -> None:
+    """Test edits read through the delta segment and after merges alike"""
+    monkeypatch.setattr("services.search_index.MERGE_THRESHOLD", merge_threshold)
+    rng = np.random.default_rng(0)
+    words = ["jazz", "jam", "climbing", "climb", "hiking", "hikes", "art"]
+    names = ["anna", "annabel", "anne", "bob", "bobby", "carl", None]
+    profiles = {
+        user_id: (names[user_id % len(names)], " ".join(rng.choice(words, 2)))
+        for user_id in range(1, 30)
+    }
+    index = SearchIndex.build((user_id, *profile) for user_id, profile in profiles.items())
+
+    for _ in range(60):
+        user_id = int(rng.integers(1, 40))
+
+        if rng.random() < 0.3:
+            profiles.pop(user_id, None)
+            index.remove(user_id)
+        else:
+            profiles[user_id] = (str(rng.choice(names[:-1])), " ".join(rng.choice(words, 2)))
+            index.add(user_id, *profiles[user_id])
+
+        fresh = SearchIndex.build((user_id, *profile) for user_id, profile in profiles.items())
+
+        for query in ["ann", "bob", "jazz", "cli", "jazz h", "a"]:
+            assert index.search(query, limit=50) == fresh.search(query, limit=50)
+            assert index.search(query, 3, 4) == fresh.search(query, 3, 4)
+
+    assert len(index) == len(profiles)
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from models.email_outbox import EmailOutboxModel
+from models.user import Base, UserModel
+from schema.registration import RegistrationSchema
+from services.hashing import HashingPool, verify_password
+from services.registration import AsyncRegisterationService, RegisterationService
+
+
+@pytest.fixture
+def pool() -> HashingPool:
+    pool = HashingPool(workers=1, rounds=4)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    path = f"{tmp_path}/sign_up.db"
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+
+    return path
+
+
+def _signed_up(db_path: str, email: str) -> tuple[UserModel, list[str]]:
+    with Session(create_engine(f"sqlite:///{db_path}")) as session:
+        user = session.scalars(select(UserModel).where(UserModel.email == email)).one()
+        queued = session.scalars(
+            select(EmailOutboxModel.kind).where(EmailOutboxModel.recipient == email)
+        ).all()
+
+    return user, queued
+
+
+def test_sign_up_stores_hash_and_queues_confirmation(pool: HashingPool, db_path: str) -> None:
+    """Test signing up creates the account with a bcrypt hash and queues its confirmation"""
+    info = RegistrationSchema(email="new@example.com", password1="secret", password2="secret")
+
+    with Session(create_engine(f"sqlite:///{db_path}")) as session:
+        asyncio.run(RegisterationService(session, hashing_pool=pool).sign_up(info))
+        session.commit()
+
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(RegisterationService(session, hashing_pool=pool).sign_up(info))
+
+    user, queued = _signed_up(db_path, "new@example.com")
+    assert verify_password("secret", user.hashed_password)
+    # Usernames are public, so the placeholder can't give the email away
+    assert "new" not in user.username and "@" not in user.username
+    assert queued == ["registration_confirmation"]
+    assert e.value.status_code == 400
+
+
+def test_async_sign_up_stores_hash_and_queues_confirmation(
+    pool: HashingPool, db_path: str
+) -> None:
+    """Test the async service signs up through the same steps on an AsyncSession"""
+    info = RegistrationSchema(email="async@example.com", password1="secret", password2="secret")
+
+    async def sign_up() -> None:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+
+        async with AsyncSession(engine) as session:
+            await AsyncRegisterationService(session, hashing_pool=pool).sign_up(info)
+            await session.commit()
+
+        await engine.dispose()
+
+    asyncio.run(sign_up())
+
+    user, queued = _signed_up(db_path, "async@example.com")
+    assert verify_password("secret", user.hashed_password)
+    assert queued == ["registration_confirmation"]
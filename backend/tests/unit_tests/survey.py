@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.survey import SurveyAnswerModel, SurveyQuestionModel, SurveyVectorModel
+from models.user import Base, Gender, UserModel
+from services.candidate_index import CandidateIndex
+from services.survey import SurveyService
+
+
+@pytest.fixture
+def session() -> Session:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": "User",
+                    "gender": Gender.FEMALE,
+                }
+                for user_id in (1, 2)
+            ],
+        )
+        session.execute(
+            insert(SurveyQuestionModel),
+            [{"id": i, "text": f"Question {i}", "choices": ["a", "b", "c"]} for i in (0, 1, 2)],
+        )
+        yield session
+
+
+@pytest.fixture
+def survey_service(session: Session) -> SurveyService:
+    return SurveyService(session, CandidateIndex(num_questions=3, num_choices=3))
+
+
+def _vector(session: Session, user_id: int) -> SurveyVectorModel:
+    return session.execute(
+        select(SurveyVectorModel).where(SurveyVectorModel.user_id == user_id)
+    ).scalar_one()
+
+
+def test_answers_are_validated(survey_service: SurveyService) -> None:
+    """Test unknown questions, out of range answers and repeat answers are rejected"""
+    for answers in ({7: 1}, {0: 4}, {0: 0}):
+        with pytest.raises(HTTPException):
+            survey_service.answer_survey(1, answers)
+
+    survey_service.answer_survey(1, {0: 1})
+
+    with pytest.raises(HTTPException):
+        survey_service.answer_survey(1, {0: 2})
+
+    with pytest.raises(HTTPException):
+        survey_service.edit_survey_answers(1, {1: 2})
+
+
+def test_submit_requires_every_answer(survey_service: SurveyService) -> None:
+    """Test a partial survey can't be submitted"""
+    survey_service.answer_survey(1, {0: 1, 1: 2})
+
+    with pytest.raises(HTTPException):
+        survey_service.submit_survey(1)
+
+
+def test_submit_requires_some_answers(session: Session) -> None:
+    """Test a survey without answers can't be submitted, even with no questions"""
+    session.execute(SurveyQuestionModel.__table__.delete())
+    survey_service = SurveyService(session, CandidateIndex(num_questions=0, num_choices=1))
+
+    with pytest.raises(HTTPException):
+        survey_service.submit_survey(1)
+
+
+def test_submit_encodes_packed_vector(survey_service: SurveyService, session: Session) -> None:
+    """Test submitting stores the answers as int8 bytes and indexes the user once committed"""
+    survey_service.answer_survey(1, {0: 1, 1: 2, 2: 3})
+    survey_service.submit_survey(1)
+
+    assert 1 not in survey_service.candidate_index
+
+    session.commit()
+    vector = _vector(session, 1)
+    assert vector.vector == bytes([1, 2, 3]) and vector.version == 1
+    assert 1 in survey_service.candidate_index
+    np.testing.assert_array_equal(
+        survey_service.get_answer_matrix(np.array([1, 2])), [[1, 2, 3], [0, 0, 0]]
+    )
+
+
+def test_rolled_back_submission_is_not_indexed(
+    survey_service: SurveyService, session: Session
+) -> None:
+    """Test the candidate index only changes for transactions that commit"""
+    survey_service.answer_survey(2, {0: 1, 1: 2, 2: 3})
+    survey_service.submit_survey(2)
+    session.rollback()
+
+    assert 2 not in survey_service.candidate_index
+
+
+def test_edits_reencode_submitted_users_only(
+    survey_service: SurveyService, session: Session
+) -> None:
+    """Test an edit bumps the vector version of a submitted user, and nobody else's"""
+    survey_service.answer_survey(1, {0: 1, 1: 2, 2: 3})
+    survey_service.submit_survey(1)
+    survey_service.answer_survey(2, {0: 1})
+
+    survey_service.edit_survey_answers(1, {2: 1})
+    survey_service.edit_survey_answers(2, {0: 2})
+
+    vector = _vector(session, 1)
+    assert vector.vector == bytes([1, 2, 1]) and vector.version == 2
+    assert session.get(SurveyVectorModel, 2) is None
+
+
+def test_get_answer_matrix_pads_older_vectors(
+    survey_service: SurveyService, session: Session
+) -> None:
+    """Test vectors encoded before questions were added read as unanswered there"""
+    session.execute(
+        insert(SurveyVectorModel),
+        [{"user_id": 1, "vector": bytes([2])}, {"user_id": 2, "vector": bytes([1, 3, 2])}],
+    )
+
+    matrix = survey_service.get_active_answer_matrix(np.array([1, 2]))
+
+    np.testing.assert_array_equal(matrix, [[2, 0, 0], [1, 3, 2]])
+    assert matrix.dtype == np.int8
+
+
+def test_encode_stale_vectors(survey_service: SurveyService, session: Session) -> None:
+    """Test only vectors older than their answers are re-encoded"""
+    for user_id in (1, 2):
+        survey_service.answer_survey(user_id, {0: 1, 1: 1, 2: 1})
+        survey_service.submit_survey(user_id)
+
+    session.execute(
+        update(SurveyAnswerModel)
+        .where(SurveyAnswerModel.user_id == 2, SurveyAnswerModel.question_id == 0)
+        .values(answer=3, updated_at=datetime.utcnow() + timedelta(seconds=1))
+    )
+
+    assert survey_service.encode_stale_vectors() == 1
+    assert _vector(session, 2).vector == bytes([3, 1, 1])
+    assert _vector(session, 1).version == 1
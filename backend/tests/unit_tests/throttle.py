@@ -0,0 +1,72 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from models.user import UserModel
+from services.auth import AuthService
+from services.throttle import InMemoryThrottleBackend, LoginThrottle
+from services.token import DEFAULT_KID, TokenVerifier
+
+
+@pytest.fixture
+def backend() -> InMemoryThrottleBackend:
+    return InMemoryThrottleBackend(evict_seconds=60)
+
+
+def test_bucket_allows_burst_then_refills(backend: InMemoryThrottleBackend) -> None:
+    """Test a bucket allows burst takes at once, then one per interval"""
+    taken = [backend.take("k", interval=10, burst=3, now=100) for _ in range(4)]
+
+    assert taken[:3] == [0.0, 0.0, 0.0]
+    assert taken[3] == pytest.approx(10)
+    assert backend.take("k", interval=10, burst=3, now=109) > 0
+    assert backend.take("k", interval=10, burst=3, now=110) == 0.0
+
+
+def test_refilled_buckets_are_evicted(backend: InMemoryThrottleBackend) -> None:
+    """Test buckets are dropped once full again, and only then"""
+    backend.take("early", interval=10, burst=3, now=100)
+    backend.take("late", interval=10, burst=3, now=165)
+
+    backend.take("other", interval=10, burst=3, now=170)
+
+    assert len(backend) == 2
+    assert "early" not in backend._full_at
+
+
+def test_login_is_rejected_before_lookup_and_hash(backend: InMemoryThrottleBackend) -> None:
+    """Test attempts over an email's limit get a 429 without reaching the database or bcrypt"""
+    throttle = LoginThrottle(backend, ip_attempts=10, email_attempts=2)
+    hashing_pool = MagicMock(verify=AsyncMock(return_value=False))
+    svc = AuthService(
+        MagicMock(),
+        "secret",
+        30,
+        hashing_pool=hashing_pool,
+        token_verifier=TokenVerifier({DEFAULT_KID: "secret"}, DEFAULT_KID),
+        throttle=throttle,
+    )
+    svc.user_svc = MagicMock()
+    svc.user_svc.get_user_by_email.return_value = UserModel(id=1, hashed_password="x")
+
+    async def attempt(email: str) -> int:
+        try:
+            await svc.login(email, "guess", "198.51.100.7")
+        except HTTPException as e:
+            return e.status_code
+
+    statuses = [asyncio.run(attempt("Victim@example.com ")) for _ in range(3)]
+    statuses.append(asyncio.run(attempt("victim@example.com")))
+
+    assert statuses == [401, 401, 429, 429]
+    assert svc.user_svc.get_user_by_email.call_count == 2
+    assert hashing_pool.verify.call_count == 2
+    assert throttle.stats() == {
+        "allowed": 2,
+        "rejected": 2,
+        "verified": 0,
+        "failed": 2,
+        "tracked_keys": 2,
+    }
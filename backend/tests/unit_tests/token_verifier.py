@@ -0,0 +1,67 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from services.token import TokenVerifier
+
+
+@pytest.fixture
+def verifier() -> TokenVerifier:
+    return TokenVerifier({"k1": "first-secret-at-least-32-bytes-long"}, "k1")
+
+
+def _claims(minutes: int = 30) -> dict:
+    return {
+        "sub": "1",
+        "jti": uuid.uuid4().hex,
+        "exp": datetime.utcnow() + timedelta(minutes=minutes),
+    }
+
+
+def test_verify_signed_token(verifier: TokenVerifier) -> None:
+    """Test a token signed by the verifier round-trips its claims"""
+    assert verifier.verify(verifier.sign(_claims()))["sub"] == "1"
+
+
+def test_verify_rejects_expired_token(verifier: TokenVerifier) -> None:
+    """Test expired tokens are rejected with a 401"""
+    with pytest.raises(HTTPException) as exc:
+        verifier.verify(verifier.sign(_claims(minutes=-1)))
+
+    assert exc.value.status_code == 401
+
+
+def test_verify_rejects_tampered_token(verifier: TokenVerifier) -> None:
+    """Test a token signed with an unknown secret is rejected"""
+    forged = TokenVerifier({"k1": "wrong-secret-at-least-32-bytes-long"}, "k1").sign(_claims())
+
+    with pytest.raises(HTTPException):
+        verifier.verify(forged)
+
+
+def test_verify_caches_claims(verifier: TokenVerifier) -> None:
+    """Test a repeat verification is served from the claims cache"""
+    token = verifier.sign(_claims())
+
+    verifier.verify(token)
+    verifier.verify(token)
+
+    assert verifier._cache.hits == 1
+
+
+def test_rotated_keys_still_verify_until_retired(verifier: TokenVerifier) -> None:
+    """Test tokens signed before a rotation verify until their key is retired"""
+    old_token = verifier.sign(_claims())
+    verifier.rotate("k2", "second-secret-at-least-32-bytes-long")
+    new_token = verifier.sign(_claims())
+
+    assert verifier.verify(old_token)["sub"] == "1"
+    assert verifier.verify(new_token)["sub"] == "1"
+
+    verifier.retire("k1")
+
+    with pytest.raises(HTTPException):
+        verifier.verify(old_token)
+    assert verifier.verify(new_token)["sub"] == "1"
@@ -1,13 +1,19 @@
 from typing import Generator, List
 from unittest.mock import MagicMock
 
+import numpy as np
 import pytest
+from sqlalchemy import create_engine, insert
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import Session
 
-from ...models.user import UserModel
-from ...schema.profile import ProfileSchema
-from ...schema.registration import RegistrationSchema
-from ...services.user import UserService
+from models.profile_change import ProfileChangeKind
+from models.user import Base, Gender, UserModel
+from models.visible_first_names import VisibleFirstNameModel
+from schema.profile import AccountSchema, ProfileCardSchema, ProfileSchema
+from services.cache import InMemoryCacheBackend, LRUCache, ReadThroughCache
+from services import user as user_module
+from services.user import UserService
 
 
 @pytest.fixture
@@ -16,17 +22,25 @@ def mock_session() -> MagicMock:
 
 
 @pytest.fixture
-def user_service(mock_session: MagicMock) -> UserService:
-    return UserService(mock_session)
+def user_cache() -> ReadThroughCache:
+    return ReadThroughCache(LRUCache(), InMemoryCacheBackend())
+
+
+@pytest.fixture
+def user_service(mock_session: MagicMock, user_cache: ReadThroughCache) -> UserService:
+    user_module._taken_usernames.clear()
+    return UserService(mock_session, cache=user_cache)
 
 
 @pytest.fixture
 def mock_user() -> UserModel:
     return UserModel(
         id=1,
+        username="john",
         first_name="John",
         email="john.doe@example.com",
-        password="hashed_password",
+        hashed_password="hashed_password",
+        is_active=True,
     )
 
 
@@ -42,6 +56,50 @@ def test_get_user_found(
     mock_session.execute.assert_called_once()
 
 
+def test_get_user_is_read_through_cached(
+    user_service: UserService, mock_session: MagicMock, user_cache: ReadThroughCache
+) -> None:
+    """Test a second lookup, by id or by email, is served without a query"""
+    user = UserModel(id=1, username="john", email="john.doe@example.com")
+    mock_session.execute.return_value.scalar_one.return_value = user
+    mock_session.merge.side_effect = lambda instance, load: instance
+
+    user_service.get_user(1)
+    user_service.get_user(1)
+    user_service.get_user_by_email("john.doe@example.com")
+
+    mock_session.execute.assert_called_once()
+    assert user_cache.stats()["local_hits"] == 3
+
+
+def test_get_user_fills_shared_backend(
+    mock_session: MagicMock, user_cache: ReadThroughCache
+) -> None:
+    """Test another process's cache is filled from the shared backend"""
+    user = UserModel(id=1, username="john", email="john.doe@example.com")
+    mock_session.execute.return_value.scalar_one.return_value = user
+    UserService(mock_session, cache=user_cache).get_user(1)
+
+    other_process = ReadThroughCache(LRUCache(), user_cache.shared)
+    UserService(mock_session, cache=other_process).get_user(1)
+
+    mock_session.execute.assert_called_once()
+    assert other_process.stats()["shared_hits"] == 1
+
+
+def test_writes_invalidate_cached_user(
+    user_service: UserService, mock_session: MagicMock, user_cache: ReadThroughCache
+) -> None:
+    """Test deactivating a user drops them from the cache"""
+    user = UserModel(id=1, username="john", email="john.doe@example.com")
+    mock_session.execute.return_value.scalar_one.return_value = user
+    user_service.get_user(1)
+
+    user_service.deactivate_account(1)
+
+    assert user_cache.get("user:id:1") is None
+
+
 def test_get_user_not_found(user_service: UserService, mock_session: MagicMock) -> None:
     """Test getting a user that doesn't exist should raise an exception"""
     mock_session.execute.return_value.scalar_one.side_effect = NoResultFound
@@ -50,46 +108,76 @@ def test_get_user_not_found(user_service: UserService, mock_session: MagicMock)
         user_service.get_user(999)
 
 
-def test_create_user(user_service: UserService, mock_session: MagicMock) -> None:
-    """Test creating a user"""
-    profile_data = RegistrationSchema(
-        email="test@example.com", password="securepassword"
+def test_account_leaves_out_the_password_hash() -> None:
+    """Test the account response carries the profile but never the hash"""
+    user = UserModel(
+        id=1,
+        username="john",
+        email="john.doe@example.com",
+        hashed_password="hashed_password",
+        first_name="John",
+        is_active=True,
     )
 
-    user_service.create_user(profile_data)
+    account = AccountSchema.model_validate(user).model_dump()
+
+    assert account["email"] == "john.doe@example.com"
+    assert "hashed_password" not in account
+
+
+def test_create_user(user_service: UserService, mock_session: MagicMock) -> None:
+    """Test creating a user stores the hash it's given, with a placeholder username
+    that gives nothing of the email away"""
+    mock_session.add.side_effect = lambda user: setattr(user, "id", 1)
+
+    assert user_service.create_user("test@example.com", "hashed_password") == 1
 
-    mock_session.add.assert_called_once()
+    user = mock_session.add.call_args.args[0]
+    assert user.hashed_password == "hashed_password"
+    assert user.username.startswith("user")
+    assert "test" not in user.username and "@" not in user.username
 
 
 def test_edit_user(
     user_service: UserService, mock_session: MagicMock, mock_user: UserModel
 ) -> None:
     """Test editing a user's profile"""
-    profile_data = ProfileSchema(first_name="Johnny", about="New bio", email=None)
+    profile_data = ProfileSchema(
+        username="john",
+        password="password",
+        email="john.doe@example.com",
+        first_name="Johnny",
+        about="New bio",
+    )
     user_service.get_user = MagicMock(return_value=mock_user)
 
     user_service.edit_user(1, profile_data)
 
-    mock_session.execute.assert_called_once()
+    # The update and the change logged for the match cron, no email sent
+    assert mock_session.execute.call_count == 2
+    mock_session.add.assert_not_called()
 
 
 def test_edit_user_email_update(
     user_service: UserService, mock_session: MagicMock, mock_user: UserModel
 ) -> None:
-    """Test editing a user's email triggers email verification"""
+    """Test editing a user's email queues a verification email"""
     user_service.get_user = MagicMock(return_value=mock_user)
-    user_service.auth_svc.send_email_update_verification = MagicMock()
 
     profile_data = ProfileSchema(
-        first_name="John", about="Same bio", email="new.email@example.com"
+        username="john",
+        password="password",
+        email="new.email@example.com",
+        first_name="John",
+        about="Same bio",
     )
 
     user_service.edit_user(1, profile_data)
 
-    user_service.auth_svc.send_email_update_verification.assert_called_once_with(
-        "new.email@example.com"
-    )
-    mock_session.execute.assert_called_once()
+    queued = mock_session.add.call_args.args[0]
+    assert queued.kind == "email_update_verification"
+    assert queued.recipient == "new.email@example.com"
+    assert mock_session.execute.call_count == 2
 
 
 def test_update_user_email_address(
@@ -102,17 +190,20 @@ def test_update_user_email_address(
 
 
 def test_delete_user(user_service: UserService, mock_session: MagicMock) -> None:
-    """Test deleting a user"""
+    """Test deleting a user, and logging the change for the match cron"""
     user_service.delete_user(1)
 
-    mock_session.execute.assert_called_once()
+    # Seven statements for the rows referencing the user, then the user and the change
+    assert mock_session.execute.call_count == 9
+    assert mock_session.execute.call_args.args[1][0]["kind"] == ProfileChangeKind.DELETED
 
 
 def test_deactivate_account(user_service: UserService, mock_session: MagicMock) -> None:
-    """Test deactivating a user account"""
+    """Test deactivating a user account, and logging the change for the match cron"""
     user_service.deactivate_account(1)
 
-    mock_session.execute.assert_called_once()
+    assert mock_session.execute.call_count == 2
+    assert mock_session.execute.call_args.args[1][0]["kind"] == ProfileChangeKind.DEACTIVATED
 
 
 def test_suggest_usernames_with_first_name(user_service: UserService) -> None:
@@ -137,9 +228,129 @@ def test_suggest_usernames_with_email(user_service: UserService) -> None:
     assert any(s.startswith("jane.doe") for s in suggestions)
 
 
+def test_suggest_usernames_only_returns_free_names(
+    user_service: UserService, mock_session: MagicMock
+) -> None:
+    """Test taken names are filtered out with one query and remembered as taken"""
+    mock_user = UserModel(id=1, first_name="John", email="john.doe@example.com")
+    user_service.get_user = MagicMock(return_value=mock_user)
+    mock_session.execute.return_value.scalars.return_value = ["john"]
+
+    suggestions: List[str] = user_service.suggest_usernames(1)
+
+    assert len(suggestions) == user_module.NUM_USERNAME_SUGGESTIONS
+    assert "john" not in suggestions
+    assert user_module._taken_usernames.get("john") is True
+    mock_session.execute.assert_called_once()
+
+
+def test_suggest_usernames_retries_until_minimum(
+    user_service: UserService, mock_session: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test a batch with longer suffixes is checked when too few candidates are free"""
+    mock_user = UserModel(id=1, first_name="John", email="john.doe@example.com")
+    user_service.get_user = MagicMock(return_value=mock_user)
+    batches = {3: ["john", "john1"], 4: [f"john_{i}" for i in range(1000, 1005)]}
+    monkeypatch.setattr(user_module, "_username_candidates", lambda _, digits: batches[digits])
+    mock_session.execute.return_value.scalars.side_effect = [["john", "john1"], []]
+
+    suggestions: List[str] = user_service.suggest_usernames(1)
+
+    assert suggestions == batches[4]
+    assert mock_session.execute.call_count == 2
+
+
 def test_suggest_usernames_raises_if_user_not_found(user_service: UserService) -> None:
     """Test that NoResultFound is raised when user doesn't exist"""
     user_service.get_user = MagicMock(side_effect=NoResultFound)
 
     with pytest.raises(NoResultFound):
         user_service.suggest_usernames(3)
+
+
+def test_get_profile_cards_hides_ungranted_first_names(
+    user_service: UserService, mock_session: MagicMock
+) -> None:
+    """Test cards come back in request order, with first names only where granted"""
+    rows = [
+        MagicMock(id=3, username="c", first_name="Carol", first_name_visible=False),
+        MagicMock(id=2, username="b", first_name="Bob", first_name_visible=True),
+    ]
+    for row in rows:
+        row.configure_mock(gender=Gender.FEMALE, about=None, image_1=None)
+    mock_session.execute.return_value = rows
+
+    cards = user_service.get_profile_cards(1, [2, 3, 4])
+
+    assert [(card.id, card.first_name) for card in cards] == [(2, "Bob"), (3, None)]
+    mock_session.execute.assert_called_once()
+
+
+def test_suggest_profiles_returns_cards_only() -> None:
+    """Test suggestions carry no private columns, and first names only where granted"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": f"First{user_id}",
+                    "gender": Gender.FEMALE,
+                }
+                for user_id in (1, 2, 3)
+            ],
+        )
+        session.execute(
+            insert(VisibleFirstNameModel), [{"user_id": 2, "permission_granted_for_user_id": 1}]
+        )
+        candidate_index = MagicMock()
+        candidate_index.query.return_value = np.array([2, 3])
+        svc = UserService(
+            session,
+            candidate_index=candidate_index,
+            cache=ReadThroughCache(LRUCache(), InMemoryCacheBackend()),
+        )
+        svc.survey_svc.get_answer_matrix = lambda ids: np.ones((len(ids), 3), dtype=np.int8)
+
+        cards = svc.suggest_profiles(1)
+
+    assert all(isinstance(card, ProfileCardSchema) for card in cards)
+    assert sorted((card.id, card.first_name) for card in cards) == [(2, "First2"), (3, None)]
+    assert not {"email", "hashed_password"} & set(cards[0].model_dump())
+
+
+def test_suggest_profiles_scores_everyone_without_a_trained_index() -> None:
+    """Test suggestions fall back to exactly scoring every active user when the
+    match cron hasn't trained a candidate index yet"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": f"First{user_id}",
+                    "gender": Gender.FEMALE,
+                    "is_active": user_id != 4,
+                }
+                for user_id in (1, 2, 3, 4)
+            ],
+        )
+        svc = UserService(session, cache=ReadThroughCache(LRUCache(), InMemoryCacheBackend()))
+        svc.candidate_index = None
+        svc.survey_svc.get_answer_matrix = lambda ids: np.ones((len(ids), 3), dtype=np.int8)
+
+        cards = svc.suggest_profiles(1)
+
+    assert sorted(card.id for card in cards) == [2, 3]
@@ -0,0 +1,106 @@
+import pytest
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.orm import Session
+
+from models.user import Base, Gender, UserModel
+from models.visible_first_names import VisibleFirstNameModel
+from services import user as user_module
+from services.user import UserService
+
+
+@pytest.fixture
+def session() -> Session:
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.execute(
+            insert(UserModel),
+            [
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hashed_password": "hashed_password",
+                    "first_name": "User",
+                    "gender": Gender.FEMALE,
+                }
+                for user_id in (1, 2, 3, 4)
+            ],
+        )
+        session.commit()
+        yield session
+
+
+@pytest.fixture
+def user_service(session: Session) -> UserService:
+    user_module._visibility_cache.clear()
+    return UserService(session)
+
+
+def _statements(session: Session) -> list[str]:
+    statements = []
+    event.listen(
+        session.get_bind(),
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    return statements
+
+
+def test_show_first_names_inserts_new_grants_at_once(
+    user_service: UserService, session: Session
+) -> None:
+    """Test bulk grants skip existing ones and the user themselves, in one
+    statement"""
+    user_service.show_first_name(1, 2)
+    statements = _statements(session)
+
+    user_service.show_first_names(1, [1, 2, 3, 4])
+
+    assert [s.split()[0] for s in statements] == ["INSERT"]
+    q = select(VisibleFirstNameModel.permission_granted_for_user_id).where(
+        VisibleFirstNameModel.user_id == 1
+    )
+    assert sorted(session.scalars(q)) == [2, 3, 4]
+
+
+def test_can_see_first_names_is_cached_per_viewer(
+    user_service: UserService, session: Session
+) -> None:
+    """Test visibility for many users takes one query, and none once cached"""
+    user_service.show_first_names(2, [1])
+    user_service.show_first_names(3, [1])
+    session.commit()
+    statements = _statements(session)
+
+    first = user_service.can_see_first_names(1, [2, 4, 1])
+    second = user_service.can_see_first_names(1, [3])
+
+    assert first == {2: True, 4: False, 1: True}
+    assert second == {3: True}
+    assert len(statements) == 1
+
+
+def test_visibility_read_before_rollback_is_not_cached(
+    user_service: UserService, session: Session
+) -> None:
+    """Test grants and revokes reach the cache only once they commit"""
+    user_service.show_first_names(2, [1])
+
+    assert user_service.can_see_first_names(1, [2]) == {2: True}
+
+    session.rollback()
+
+    assert user_service.can_see_first_names(1, [2]) == {2: False}
+
+    user_service.show_first_names(2, [1])
+    session.commit()
+    user_service.un_show_first_names(2, [1])
+
+    assert user_service.can_see_first_names(1, [2]) == {2: False}
+
+    session.rollback()
+
+    assert user_service.can_see_first_names(1, [2]) == {2: True}